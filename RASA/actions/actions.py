@@ -5,125 +5,681 @@ import googlemaps
 import firebase_admin
 from firebase_admin import credentials, firestore
 import os
-from typing import Any, List, Dict, Text
+import random
+import asyncio
+import threading
+import datetime
+import logging
+import multiprocessing
+from typing import Any, List, Dict, Optional, Text
 import time
-from functools import lru_cache
-import math
+import numpy as np
 from dotenv import load_dotenv
+try:
+    from sanic import Sanic
+    from sanic.exceptions import SanicException
+except ImportError:
+    Sanic = None
+from actions.maps_cache import MAPS_CACHE, normalize_key
+from actions.route_index import RouteIndex, normalize_landmark
+from actions.landmark_resolver import LandmarkResolver, DEFAULT_THRESHOLD as DEFAULT_LANDMARK_THRESHOLD
+from actions.road_graph import RoadGraph, DetourCalibration, DEFAULT_CALIBRATION_SAMPLES
+from actions.route_planner import RoutePlanner, DEFAULT_LIMIT as DEFAULT_PLAN_LIMIT, DEFAULT_MAX_TRANSFERS, DEFAULT_TRANSFER_RADIUS_KM
+from actions.spatial_index import SpatialIndex
+from actions.location_table import LocationTable
+from actions.fare_table import FareTable
+from actions.async_maps import AsyncMapsClient, DEFAULT_TIMEOUT_SECONDS
+from actions.single_flight import SingleFlight
+from actions.geo_cache import GeoCache, DEFAULT_PRECISION, DEFAULT_TTL, DEFAULT_MAX_ENTRIES
+from actions.landmark_matrix import LandmarkMatrix, DEFAULT_LOOKUP_PATH, DEFAULT_MATRIX_PATH, format_duration
+from actions.warmup import Warmup
+from actions.eta_cache import HotPairs, SpeedModel, bucket_end, parse_bucket_ttls, time_bucket, DEFAULT_HOT_HITS, DEFAULT_HOT_WINDOW, DEFAULT_REFRESH_AHEAD
+from actions.shared_reference import SharedReference, DEFAULT_POLL_SECONDS as DEFAULT_SHARED_POLL_SECONDS
+from actions.snapshot import Snapshot, CollectionSnapshot, DEFAULT_SNAPSHOT_PATH, updated_watermark
+from actions.resilient_maps import CircuitBreaker, ResilientMapsClient, with_latency_budget, DEFAULT_BUDGET_SECONDS, DEFAULT_MAX_ATTEMPTS
+from actions.metrics import ACTION_ERRORS, LOOKUP_RESULTS, STALE_RESPONSES, Gauge, metrics_response, observe_call, record_cache, register, track_action
+from actions.status_server import DEFAULT_PORT as DEFAULT_STATUS_PORT, register_route, start_status_server
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
-# Create Firebase credentials dictionary
-firebase_credentials = {
-    "type": "service_account",
-    "project_id": os.getenv("FIREBASE_PROJECT_ID"),
-    "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace("\\n", "\n"),  # Handle newlines in private key
-    "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
-    "client_id": os.getenv("FIREBASE_CLIENT_ID"),
-    "auth_uri": os.getenv("FIREBASE_AUTH_URI"),
-    "token_uri": os.getenv("FIREBASE_TOKEN_URI"),
-    "auth_provider_x509_cert_url": os.getenv("FIREBASE_AUTH_PROVIDER_X509_CERT_URL"),
-    "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_X509_CERT_URL"),
-}
-
-# Initialize Firebase
-if not firebase_admin._apps:
-    cred = credentials.Certificate(firebase_credentials)
-    firebase_admin.initialize_app(cred)
-db = firestore.client()
+db = None
+_db_lock = threading.Lock()
+def get_db():
+    global db
+    # Firebase is initialized on first use by the warm-up threads, not at import time
+    with _db_lock:
+        if db is None:
+            # Create Firebase credentials dictionary
+            firebase_credentials = {
+                "type": "service_account",
+                "project_id": os.getenv("FIREBASE_PROJECT_ID"),
+                "private_key": (os.getenv("FIREBASE_PRIVATE_KEY") or "").replace("\\n", "\n"),  # Handle newlines in private key
+                "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
+                "client_id": os.getenv("FIREBASE_CLIENT_ID"),
+                "auth_uri": os.getenv("FIREBASE_AUTH_URI"),
+                "token_uri": os.getenv("FIREBASE_TOKEN_URI"),
+                "auth_provider_x509_cert_url": os.getenv("FIREBASE_AUTH_PROVIDER_X509_CERT_URL"),
+                "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_X509_CERT_URL"),
+            }
 
-# Initialize Google Maps client
-gmaps = googlemaps.Client(key=os.getenv("GOOGLE_MAPS_API_KEY"))
+            # Initialize Firebase
+            if not firebase_admin._apps:
+                cred = credentials.Certificate(firebase_credentials)
+                firebase_admin.initialize_app(cred)
+            db = firestore.client()
+    return db
+
+# Each action gets one latency budget for all of its Maps calls; transient errors are
+# retried only while the budget lasts, and the breaker fails calls fast during outages
+ACTION_BUDGET_SECONDS = float(os.getenv("ACTION_BUDGET_SECONDS", DEFAULT_BUDGET_SECONDS))
+MAPS_BREAKER = CircuitBreaker(
+    failure_ratio=float(os.getenv("MAPS_BREAKER_FAILURE_RATIO", "0.5")),
+    min_calls=int(os.getenv("MAPS_BREAKER_MIN_CALLS", "10")),
+    window=float(os.getenv("MAPS_BREAKER_WINDOW_SECONDS", "30")),
+    cooldown=float(os.getenv("MAPS_BREAKER_COOLDOWN_SECONDS", "15"))
+)
+MAPS_MAX_ATTEMPTS = int(os.getenv("MAPS_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+
+# Initialize Google Maps client (non-blocking, with a per-call timeout)
+gmaps = ResilientMapsClient(
+    AsyncMapsClient(
+        key=os.getenv("GOOGLE_MAPS_API_KEY"),
+        timeout=float(os.getenv("MAPS_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS))
+    ),
+    breaker=MAPS_BREAKER,
+    max_attempts=MAPS_MAX_ATTEMPTS
+)
+
+# Identical Maps requests that are already in flight are shared instead of repeated
+MAPS_FLIGHTS = SingleFlight()
+
+# Places/Geocoding answers shared by users standing in the same geohash cell
+GEO_CACHE = GeoCache(
+    precision=int(os.getenv("GEO_CACHE_PRECISION", DEFAULT_PRECISION)),
+    ttl=float(os.getenv("GEO_CACHE_TTL", DEFAULT_TTL)),
+    max_entries=int(os.getenv("GEO_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+)
+
+# Precomputed distances between known landmarks, built offline with
+# `python -m actions.landmark_matrix` and memory-mapped here
+LANDMARK_MATRIX = LandmarkMatrix.open(os.getenv("LANDMARK_MATRIX_PATH", DEFAULT_MATRIX_PATH))
+
+# Travel times are cached per (canonical pair, weekday/weekend, time-of-day bucket)
+# with a TTL per bucket, so a rush-hour ETA is never served at midnight. Pairs that
+# are asked often are re-fetched shortly before their entry or bucket runs out, and
+# when Google is slow the ETA comes from the distance and the speed recently seen
+# in the same bucket.
+ETA_BUCKET_TTLS = parse_bucket_ttls(os.getenv("ETA_BUCKET_TTLS"))
+ETA_API_TIMEOUT = float(os.getenv("ETA_API_TIMEOUT_SECONDS", "1.5"))
+ETA_REFRESH_AHEAD = float(os.getenv("ETA_REFRESH_AHEAD_SECONDS", DEFAULT_REFRESH_AHEAD))
+ETA_TRAFFIC = os.getenv("ETA_TRAFFIC", "true").lower() == "true"
+ETA_HOT_PAIRS = HotPairs(
+    hits=int(os.getenv("ETA_HOT_HITS", DEFAULT_HOT_HITS)),
+    window=float(os.getenv("ETA_HOT_WINDOW_SECONDS", DEFAULT_HOT_WINDOW))
+)
+ETA_SPEEDS = SpeedModel()
+# Background refreshes are kept referenced until they finish
+ETA_REFRESHES = set()
+
+# Reference data is kept as raw Firestore documents keyed by document id, plus
+# structures derived from them; a local snapshot of the raw documents lets later
+# boots start without re-reading whole collections
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH)
+SNAPSHOT_UPDATED_FIELD = os.getenv("SNAPSHOT_UPDATED_FIELD", "updated_at")
+# A delta load only sees documents whose update-time field changed, so it is only
+# used when every snapshot document has that field; otherwise the snapshot is
+# served while the whole collection is re-read. Deletions only show on a full
+# reload, which happens at least this often.
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", 24 * 3600))
+SNAPSHOT = Snapshot.load(SNAPSHOT_PATH)
+REFERENCE_DOCS = {"fares": {}, "locations": {}, "routes": {}}
+
+def load_collection(name: str, apply: Any) -> int:
+    cached = SNAPSHOT.collections.get(name)
+    # Check if a recent enough snapshot of this collection exists on disk
+    if cached is not None and time.time() - cached.loaded_at < SNAPSHOT_MAX_AGE:
+        docs = dict(cached.docs)
+        # Serve the snapshot right away, then ask Firestore for what changed
+        apply(docs)
+        # Check if the documents carry no update time to ask for changes by
+        has_watermark = cached.updated_at > 0 and all(SNAPSHOT_UPDATED_FIELD in doc for doc in docs.values())
+        try:
+            collection_ref = get_db().collection(name)
+            if has_watermark:
+                since = datetime.datetime.fromtimestamp(cached.updated_at, tz=datetime.timezone.utc)
+                with observe_call("firestore", f"{name}.delta"):
+                    changed = list(collection_ref.where(SNAPSHOT_UPDATED_FIELD, ">", since).stream())
+            else:
+                with observe_call("firestore", f"{name}.stream"):
+                    changed = list(collection_ref.stream())
+        except Exception as e:
+            # Firestore is unreachable: keep serving the snapshot
+            logger.warning("Serving %s from snapshot, reload failed: %s", name, e)
+            return len(docs)
+        if has_watermark:
+            for doc in changed:
+                docs[doc.id] = doc.to_dict()
+            loaded_at = cached.loaded_at
+        else:
+            docs = {doc.id: doc.to_dict() for doc in changed}
+            loaded_at = time.time()
+    else:
+        with observe_call("firestore", f"{name}.stream"):
+            docs = {doc.id: doc.to_dict() for doc in get_db().collection(name).stream()}
+        loaded_at = time.time()
+    apply(docs)
+    SNAPSHOT.collections[name] = CollectionSnapshot(docs, updated_watermark(docs, SNAPSHOT_UPDATED_FIELD), loaded_at)
+    return len(docs)
+
+def write_snapshot() -> None:
+    # Check if nothing was loaded, e.g. Firestore was down and no snapshot existed,
+    # or if another process owns the reference data
+    if not SNAPSHOT.collections or is_shared_follower():
+        return
+    SNAPSHOT.write(SNAPSHOT_PATH)
 
 # Preload fare data into memory
-FARE_CACHE = {}
-def preload_fares():
+FARE_ROUNDING = os.getenv("FARE_ROUNDING", "round")
+FARE_INTERPOLATION = os.getenv("FARE_INTERPOLATION", "nearest")
+FARE_TABLE = FareTable({}, FARE_ROUNDING, FARE_INTERPOLATION)
+def apply_fares(docs: Dict[str, Dict[str, Any]]) -> None:
+    global FARE_TABLE
+    fares = {}
+    for fare_data in docs.values():
+        fares[fare_data["distance"]] = {
+            "regular": fare_data["regular"],
+            "discounted": fare_data["discounted"]
+        }
+    # Compile the fare matrix into sorted arrays for bisection lookups
+    FARE_TABLE = FareTable(fares, FARE_ROUNDING, FARE_INTERPOLATION)
+    ROUTE_PLANNER.use_fares(FARE_TABLE)
+    REFERENCE_DOCS["fares"] = docs
+
+def preload_fares() -> int:
+    # Check if another process loads the data and this one only maps it
+    if is_shared_follower():
+        return attach_shared("fares")
+    return load_collection("fares", apply_fares)
+
+LOCATIONS_CACHE = LocationTable([])
+LOCATIONS_INDEX = SpatialIndex(LOCATIONS_CACHE)
+def apply_locations(docs: Dict[str, Dict[str, Any]]) -> None:
+    global LOCATIONS_CACHE, LOCATIONS_INDEX
+    # Places are stored as columns; LOCATIONS_CACHE[i] is a lightweight view of row i
+    locations = LocationTable(docs.values())
+    # Build the nearest-place index once instead of scanning every place per request
+    LOCATIONS_INDEX = SpatialIndex(locations)
+    LOCATIONS_CACHE = locations
+    REFERENCE_DOCS["locations"] = docs
+
+def preload_locations() -> int:
+    if is_shared_follower():
+        return attach_shared("locations")
+    return load_collection("locations", apply_locations)
+
+ROUTE_INDEX = RouteIndex([])
+def apply_routes(docs: Dict[str, Dict[str, Any]]) -> None:
+    global ROUTE_INDEX
+    ROUTE_INDEX = RouteIndex(docs.values())
+    REFERENCE_DOCS["routes"] = docs
+
+def preload_routes() -> int:
+    if is_shared_follower():
+        return attach_shared("routes")
+    return load_collection("routes", apply_routes)
+
+# Free-text origins and destinations are resolved to one canonical name per place
+# before any cache, the landmark matrix or the route index is consulted, so
+# "sm legazpi" and "SM City Legazpi" share one Maps cache entry and match the same
+# routes. Built from the NLU lookup table, the locations and the route landmarks,
+# and rebuilt whenever locations or routes change.
+LANDMARK_LOOKUP_PATH = os.getenv("LANDMARK_LOOKUP_PATH", DEFAULT_LOOKUP_PATH)
+LANDMARK_THRESHOLD = float(os.getenv("LANDMARK_MATCH_THRESHOLD", DEFAULT_LANDMARK_THRESHOLD))
+
+def load_lookup_names(path: str = LANDMARK_LOOKUP_PATH) -> List[str]:
     try:
-        fares_ref = db.collection("fares")
-        docs = fares_ref.stream()
-        for doc in docs:
-            fare_data = doc.to_dict()
-            FARE_CACHE[fare_data["distance"]] = {
-                "regular": fare_data["regular"],
-                "discounted": fare_data["discounted"]
-            }
-    except Exception as e:
-        pass
-
-# Load fares at startup
-preload_fares()
-
-LOCATIONS_CACHE = {}
-def preload_locations():
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    except OSError as e:
+        logger.warning("Landmark lookup table %s is unavailable: %s", path, e)
+        return []
+
+LANDMARK_LOOKUP_NAMES = load_lookup_names()
+RESOLVER = LandmarkResolver(LANDMARK_LOOKUP_NAMES, threshold=LANDMARK_THRESHOLD)
+def rebuild_resolver() -> None:
+    global RESOLVER
+    # Firestore spellings come first: they are what Maps and the route data know
+    names = [location.name for location in LOCATIONS_CACHE.values()]
+    names.extend(ROUTE_INDEX.stop_names)
+    names.extend(LANDMARK_LOOKUP_NAMES)
+    RESOLVER = LandmarkResolver(names, threshold=LANDMARK_THRESHOLD)
+
+def canonical_place(text: str) -> str:
+    name = RESOLVER.canonical_name(text)
+    record_cache("landmark_resolver", name is not None)
+    # Places nobody listed (shops, streets) are passed on as typed
+    return name if name is not None else text
+
+# Offline road distances: a small graph over the route landmarks, searched with A*,
+# prices trips when Google cannot be reached (or, with ROAD_DISTANCE_MODE=primary,
+# before Google is asked at all). Graph distances are scaled by a detour factor
+# calibrated against the landmark matrix and every distance Google returns.
+ROAD_DISTANCE_MODE = os.getenv("ROAD_DISTANCE_MODE", "fallback")
+ROAD_CALIBRATION = DetourCalibration(samples=int(os.getenv("ROAD_CALIBRATION_SAMPLES", DEFAULT_CALIBRATION_SAMPLES)))
+ROAD_GRAPH = RoadGraph([], [], [])
+register(Gauge(
+    "legazpin_road_detour_factor", "Calibrated ratio of Google driving distance to road graph distance.", [],
+    lambda: {(): ROAD_CALIBRATION.factor}
+))
+
+def rebuild_road_graph() -> None:
+    global ROAD_GRAPH
+    graph = RoadGraph.build(LOCATIONS_CACHE, ROUTE_INDEX)
+    calibrate_from_matrix(graph)
+    ROAD_GRAPH = graph
+    logger.info("Road graph has %s nodes, detour factor %.2f", len(graph), ROAD_CALIBRATION.factor)
+
+def calibrate_from_matrix(graph: RoadGraph) -> None:
+    # Landmark matrix pairs are Google driving distances that are already paid for
+    places = [(name, place_coords(name)) for name in LANDMARK_MATRIX.names]
+    places = [(name, coords) for name, coords in places if coords is not None]
+    # Check if fewer than two landmarks can be placed on the map
+    if len(places) < 2:
+        return
+    rng = random.Random(0)
+    for _ in range(ROAD_CALIBRATION.samples.maxlen):
+        (origin, origin_coords), (destination, destination_coords) = rng.sample(places, 2)
+        known_pair = LANDMARK_MATRIX.lookup(origin, destination)
+        if known_pair is not None:
+            ROAD_CALIBRATION.add(graph.path_km(origin_coords, destination_coords), known_pair[0])
+
+def place_coords(name: str) -> Optional[tuple]:
+    location_id = LOCATIONS_CACHE.find(name)
+    if location_id is None:
+        return None
+    location = LOCATIONS_CACHE[location_id]
+    return location.lat, location.lon
+
+def estimate_distance(origin: str, destination: str) -> Optional[float]:
+    origin_coords = place_coords(origin)
+    destination_coords = place_coords(destination)
+    # Check if either place has no known coordinates
+    if origin_coords is None or destination_coords is None:
+        return None
+    return ROAD_GRAPH.path_km(origin_coords, destination_coords) * ROAD_CALIBRATION.factor
+
+def observe_road_distance(origin: str, destination: str, distance_km: float) -> None:
+    origin_coords = place_coords(origin)
+    destination_coords = place_coords(destination)
+    if origin_coords is not None and destination_coords is not None:
+        ROAD_CALIBRATION.add(ROAD_GRAPH.path_km(origin_coords, destination_coords), distance_km)
+
+# Trips no single jeepney covers are planned over the compiled routes, with up to
+# ROUTE_MAX_TRANSFERS changes at shared or nearby landmarks and every ride priced
+# from the fare table; no Maps or Firestore call is involved
+ROUTE_MAX_TRANSFERS = int(os.getenv("ROUTE_MAX_TRANSFERS", DEFAULT_MAX_TRANSFERS))
+ROUTE_PLAN_LIMIT = int(os.getenv("ROUTE_PLAN_LIMIT", DEFAULT_PLAN_LIMIT))
+ROUTE_TRANSFER_RADIUS_KM = float(os.getenv("ROUTE_TRANSFER_RADIUS_KM", DEFAULT_TRANSFER_RADIUS_KM))
+ROUTE_PLANNER = RoutePlanner(ROUTE_INDEX, LOCATIONS_CACHE, fare_table=FARE_TABLE)
+def rebuild_route_planner() -> None:
+    global ROUTE_PLANNER
+    ROUTE_PLANNER = RoutePlanner(
+        ROUTE_INDEX,
+        LOCATIONS_CACHE,
+        detour=ROAD_CALIBRATION.factor,
+        transfer_radius_km=ROUTE_TRANSFER_RADIUS_KM,
+        fare_table=FARE_TABLE
+    )
+
+def rebuild_place_indexes() -> None:
+    # Everything derived from locations and routes together; the planner uses the
+    # detour factor calibrated while the road graph is built
+    rebuild_resolver()
+    rebuild_road_graph()
+    rebuild_route_planner()
+
+# Live updates: Firestore change listeners patch the raw documents and rebuild the
+# derived structures off the request path. Every apply_* function builds new objects
+# and only then rebinds the module globals, so readers always see either the old or
+# the new table, never a half-updated one, and never wait for a reload.
+REFERENCE_APPLIERS = {"fares": apply_fares, "locations": apply_locations, "routes": apply_routes}
+REFERENCE_LISTENERS = os.getenv("REFERENCE_LISTENERS", "true").lower() == "true"
+REFERENCE_WATCHES = {}
+_reference_lock = threading.Lock()
+
+def apply_document_changes(name: str, changes: List[Any]) -> None:
+    # Writers are serialized; readers never take this lock
+    with _reference_lock:
+        docs = dict(REFERENCE_DOCS[name])
+        for change in changes:
+            # Check if the document was deleted from the collection
+            if change.type.name == "REMOVED":
+                docs.pop(change.document.id, None)
+            else:
+                docs[change.document.id] = change.document.to_dict()
+        REFERENCE_APPLIERS[name](docs)
+        previous = SNAPSHOT.collections.get(name)
+        loaded_at = previous.loaded_at if previous is not None else time.time()
+        SNAPSHOT.collections[name] = CollectionSnapshot(docs, updated_watermark(docs, SNAPSHOT_UPDATED_FIELD), loaded_at)
+    logger.info("Applied %s change(s) to %s", len(changes), name)
+
+def make_change_listener(name: str) -> Any:
+    def on_snapshot(collection_snapshot: Any, changes: List[Any], read_time: Any) -> None:
+        # Runs on a Firestore background thread; an exception here would stop the watch
+        try:
+            if changes:
+                apply_document_changes(name, changes)
+                if name in ("locations", "routes"):
+                    rebuild_place_indexes()
+                write_snapshot()
+                if SHARED is not None:
+                    publish_shared(name)
+        except Exception as e:
+            logger.exception("Failed to apply %s changes", name)
+    return on_snapshot
+
+def start_change_listeners() -> None:
+    # Check if live updates are disabled, the listeners are already running, or
+    # another process owns the reference data
+    if not REFERENCE_LISTENERS or REFERENCE_WATCHES or is_shared_follower():
+        return
     try:
-        count = 0
-        locations_ref = db.collection("locations")
-        docs = locations_ref.stream()
-        for doc in docs:
-            location_data = doc.to_dict()
-            LOCATIONS_CACHE[count] = {
-                "name": location_data["name"],
-                "description": location_data["description"],
-                "tags": location_data["tags"],
-                "coords": location_data["coords"],
-            }
-            count = count + 1
+        for name in REFERENCE_APPLIERS:
+            REFERENCE_WATCHES[name] = get_db().collection(name).on_snapshot(make_change_listener(name))
     except Exception as e:
-        pass
-
-preload_locations()
+        logger.warning("Live reference data updates are disabled: %s", e)
+
+# Multi-process mode: with LEGAZPIN_SHARED_DIR set, the first process to start (the
+# first Sanic worker when ACTION_SERVER_SANIC_WORKERS > 1) loads Firestore and publishes
+# fares, locations and routes there as column files; every worker memory-maps the
+# same files instead of holding its own copy. A tmpfs such as /dev/shm/legazpin
+# keeps them in shared memory. Workers pick up new generations by polling.
+SHARED_DIR = os.getenv("LEGAZPIN_SHARED_DIR")
+SHARED = SharedReference(
+    SHARED_DIR,
+    poll_seconds=float(os.getenv("SHARED_POLL_SECONDS", DEFAULT_SHARED_POLL_SECONDS))
+) if SHARED_DIR else None
+SHARED_ATTACH_TIMEOUT = float(os.getenv("SHARED_ATTACH_TIMEOUT", "120"))
+SHARED_GENERATIONS = {}
+_shared_watch_pid = None
+
+def attach_fares(arrays: Dict[str, Any]) -> int:
+    global FARE_TABLE
+    FARE_TABLE = FareTable.from_arrays(arrays, FARE_ROUNDING, FARE_INTERPOLATION)
+    ROUTE_PLANNER.use_fares(FARE_TABLE)
+    return len(FARE_TABLE)
+
+def attach_locations(arrays: Dict[str, Any]) -> int:
+    global LOCATIONS_CACHE, LOCATIONS_INDEX
+    LOCATIONS_INDEX = SpatialIndex.from_arrays(arrays)
+    LOCATIONS_CACHE = LOCATIONS_INDEX.table
+    return len(LOCATIONS_INDEX)
+
+def attach_routes(arrays: Dict[str, Any]) -> int:
+    global ROUTE_INDEX
+    ROUTE_INDEX = RouteIndex.from_arrays(arrays)
+    return len(ROUTE_INDEX)
+
+SHARED_ATTACHERS = {"fares": attach_fares, "locations": attach_locations, "routes": attach_routes}
+SHARED_EXPORTERS = {
+    "fares": lambda: FARE_TABLE.to_arrays(),
+    "locations": lambda: LOCATIONS_INDEX.to_arrays(),
+    "routes": lambda: ROUTE_INDEX.to_arrays(),
+}
 
-def get_nearest_poi(lat: float, lng: float, poi_type: str, max_results: int = 1) -> str:
+def is_shared_follower() -> bool:
+    # claim() is a no-op after the first call; a forked child of the leader never leads
+    return SHARED is not None and not SHARED.claim()
+
+def attach_shared(name: str) -> int:
+    generation, arrays, meta = SHARED.attach(name, timeout=SHARED_ATTACH_TIMEOUT)
+    count = SHARED_ATTACHERS[name](arrays)
+    SHARED_GENERATIONS[name] = generation
+    return count
+
+def publish_shared(name: str) -> None:
+    SHARED.publish(name, SHARED_EXPORTERS[name]())
+    # The leader serves from the mapped files too, sharing their pages with the other workers
+    attach_shared(name)
+    logger.info("Published shared %s generation %s", name, SHARED_GENERATIONS[name])
+
+def share_reference_data() -> None:
+    if SHARED is None:
+        return
+    if is_shared_follower():
+        start_shared_watch()
+        return
+    for name in SHARED_EXPORTERS:
+        # Check if the load failed; workers keep the last good generation instead
+        if WARMUP.states[name].status == "ready":
+            publish_shared(name)
+
+def start_shared_watch() -> None:
+    global _shared_watch_pid
+    # Check if this process already polls for new generations
+    if _shared_watch_pid == os.getpid():
+        return
+    _shared_watch_pid = os.getpid()
+    threading.Thread(target=watch_shared, name="shared-reference-watch", daemon=True).start()
+
+def watch_shared() -> None:
+    while True:
+        time.sleep(SHARED.poll_seconds)
+        for name in SHARED_ATTACHERS:
+            try:
+                generation = SHARED.generation(name)
+                if generation is not None and generation != SHARED_GENERATIONS.get(name):
+                    attach_shared(name)
+                    if name in ("locations", "routes"):
+                        rebuild_place_indexes()
+                    logger.info("Attached shared %s generation %s", name, generation)
+            except Exception as e:
+                logger.exception("Failed to attach shared %s", name)
+
+def restart_after_fork() -> None:
+    global PROCESS_ROLE
+    # Only runs under fork-based servers (Sanic's legacy mode); spawned workers import
+    # this module anew. A child of the Sanic main process is a worker and starts what
+    # the main process skipped. Any other child inherits module state but none of its
+    # threads, so a warm-up started before the fork would never finish there.
+    if PROCESS_ROLE == "supervisor":
+        PROCESS_ROLE = "worker"
+        if AUTOSTART:
+            start_services()
+    elif WARMUP.is_started():
+        WARMUP.reset()
+        WARMUP.start()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=restart_after_fork)
+
+# Load reference data in parallel in the background; /ready on the status server
+# reports per-cache state so traffic is only routed here once the caches are warm
+WARMUP = Warmup(
+    mode=os.getenv("WARMUP_MODE", "strict"),
+    retries=int(os.getenv("WARMUP_RETRIES", "3"))
+)
+WARMUP_WAIT_SECONDS = float(os.getenv("WARMUP_WAIT_SECONDS", "30"))
+WARMUP.register("fares", preload_fares)
+WARMUP.register("locations", preload_locations)
+WARMUP.register("routes", preload_routes)
+WARMUP.add_done_callback(rebuild_place_indexes)
+WARMUP.add_done_callback(write_snapshot)
+WARMUP.add_done_callback(start_change_listeners)
+WARMUP.add_done_callback(share_reference_data)
+
+register_route("/ready", WARMUP.readiness_response)
+register_route("/health", WARMUP.health_response)
+register_route("/metrics", metrics_response)
+
+def use_clients(maps_client: Any = None, firestore_client: Any = None) -> None:
+    # Swap in other Maps/Firestore clients, e.g. the local stand-ins used by the benchmarks
+    global gmaps, db
+    if maps_client is not None:
+        gmaps = ResilientMapsClient(maps_client, breaker=MAPS_BREAKER, max_attempts=MAPS_MAX_ATTEMPTS)
+    if firestore_client is not None:
+        db = firestore_client
+
+# /ready, /health and /metrics describe the process that serves them, so they run
+# in the processes that answer actions. rasa_sdk serves actions from Sanic worker
+# processes, even with a single worker; the Sanic main process that spawns them
+# imports this module too but only supervises, so it loads nothing and serves no
+# status. Every worker takes the first free port from STATUS_PORT on
+# (STATUS_PORT .. STATUS_PORT + ACTION_SERVER_SANIC_WORKERS - 1): probe and scrape
+# each of those ports, not only STATUS_PORT.
+STATUS_PORT = int(os.getenv("STATUS_PORT", DEFAULT_STATUS_PORT))
+SANIC_WORKERS = max(1, int(os.getenv("ACTION_SERVER_SANIC_WORKERS", "1")))
+SANIC_APP_NAME = "rasa_sdk"
+SANIC_WORKER_PREFIX = "Sanic-Server"
+
+def process_role() -> str:
+    # "worker" answers actions in a Sanic worker process, "supervisor" is the Sanic
+    # main process, "standalone" anything else importing this module (tools,
+    # benchmarks, a server without Sanic workers)
+    if multiprocessing.current_process().name.startswith(SANIC_WORKER_PREFIX):
+        return "worker"
+    # rasa_sdk creates its Sanic app before it imports the action package
+    if Sanic is not None:
+        try:
+            Sanic.get_app(SANIC_APP_NAME)
+            return "supervisor"
+        except SanicException:
+            pass
+    return "standalone"
+
+PROCESS_ROLE = process_role()
+
+def start_services() -> None:
+    # Check if this is the Sanic main process; its workers start their own
+    if PROCESS_ROLE == "supervisor":
+        return
+    WARMUP.start()
+    start_status_server(port=STATUS_PORT, attempts=SANIC_WORKERS if PROCESS_ROLE == "worker" else 1)
+
+# ACTIONS_AUTOSTART=false lets tools import this module and inject clients first
+AUTOSTART = os.getenv("ACTIONS_AUTOSTART", "true").lower() == "true"
+if AUTOSTART:
+    start_services()
+
+async def wait_for_warmup() -> None:
+    # Check if this worker must not answer from half-loaded caches
+    if WARMUP.mode == "strict" and not WARMUP.is_done():
+        await asyncio.get_running_loop().run_in_executor(None, WARMUP.wait, WARMUP_WAIT_SECONDS)
+
+async def get_nearby_place_names(lat: float, lng: float, poi_type: str) -> Optional[List[str]]:
+    key = GEO_CACHE.key(lat, lng, "places_nearby", poi_type)
+    place_names = GEO_CACHE.get(key)
+    # Serve users in the same geohash cell from memory
+    if place_names is not None:
+        return place_names
+    return await MAPS_FLIGHTS.do(key, lambda: fetch_nearby_place_names(lat, lng, poi_type, key))
+
+async def fetch_nearby_place_names(lat: float, lng: float, poi_type: str, key: tuple) -> Optional[List[str]]:
     try:
-        places_result = gmaps.places_nearby(
+        places_result = await gmaps.places_nearby(
             location=(lat, lng),
             type=poi_type,
             rank_by="distance"
         )
-        # Check if the API returned any results and if there are places in the results
-        if places_result.get("results") and len(places_result["results"]) > 0:
-            nearest_places = places_result["results"][:max_results]
-            place_names = [place["name"] for place in nearest_places]
-            return ", ".join(place_names) if place_names else f"No {poi_type} found nearby"
-        # Handle case where no results are returned
-        else:
-            return f"No {poi_type} found nearby"
-    except Exception as e:
-        return f"No {poi_type} found nearby"
-
-def get_user_current_location(lat: float, lng: float) -> str:
-    try:
-        places_result = gmaps.places_nearby(
-            location=(lat, lng),
-            type="point_of_interest",
-            rank_by="distance"
-        )
-        # Check if the API returned results and if there are places in the results
-        if places_result.get("results") and len(places_result["results"]) > 0:
-            nearest_place = places_result["results"][0]
-            return nearest_place["name"]
-        # Handle case where no results are found
-        return "Unknown Location"
     except Exception as e:
-        return "Unknown Location"
-    
-def get_user_reverse_geocode(lat: float, lng: float) -> str:
+        logger.warning("Nearby %s lookup failed: %s", poi_type, e)
+        # Failed lookups are not cached so the next message retries; until then the
+        # last known answer for this cell is better than none
+        stale = GEO_CACHE.get_stale(key)
+        if stale is not None:
+            STALE_RESPONSES.inc(lookup="places_nearby")
+        return stale
+    place_names = [place["name"] for place in places_result.get("results", [])]
+    GEO_CACHE.set(key, place_names)
+    return place_names
+
+async def get_nearest_poi(lat: float, lng: float, poi_type: str, max_results: int = 1) -> Optional[str]:
+    place_names = await get_nearby_place_names(lat, lng, poi_type)
+    # Check if the lookup failed, as opposed to finding nothing
+    if place_names is None:
+        return None
+    # Check if the API returned any places nearby
+    if place_names:
+        return ", ".join(place_names[:max_results])
+    return f"No {poi_type} found nearby"
+
+async def get_user_current_location(lat: float, lng: float) -> str:
+    place_names = await get_nearby_place_names(lat, lng, "point_of_interest")
+    # Check if the API returned results and if there are places in the results
+    if place_names:
+        return place_names[0]
+    # Handle case where no results are found
+    return "Unknown Location"
+
+async def get_user_reverse_geocode(lat: float, lng: float) -> str:
+    key = GEO_CACHE.key(lat, lng, "reverse_geocode")
+    address = GEO_CACHE.get(key)
+    if address is not None:
+        return address
+    return await MAPS_FLIGHTS.do(key, lambda: fetch_user_reverse_geocode(lat, lng, key))
+
+async def fetch_user_reverse_geocode(lat: float, lng: float, key: tuple) -> str:
     try:
         # Call Google Maps Reverse Geocoding API
-        geocode_result = gmaps.reverse_geocode((lat, lng))
-        if geocode_result and len(geocode_result) > 0:
-            # Get the formatted address
-            formatted_address = geocode_result[0]["formatted_address"]
-            # Remove the country (e.g., ", Philippines") if present
-            parts = formatted_address.split(", ")
-            if len(parts) > 1 and parts[-1].lower() in ["philippines", "ph"]:
-                return ", ".join(parts[:-1])
-            return formatted_address
-        return "Unknown Address"
+        geocode_result = await gmaps.reverse_geocode((lat, lng))
     except Exception as e:
+        logger.warning("Reverse geocoding failed: %s", e)
+        stale = GEO_CACHE.get_stale(key)
+        if stale is not None:
+            STALE_RESPONSES.inc(lookup="reverse_geocode")
+            return stale
         return "Unknown Address"
-        
+    if geocode_result and len(geocode_result) > 0:
+        # Get the formatted address
+        address = geocode_result[0]["formatted_address"]
+        # Remove the country (e.g., ", Philippines") if present
+        parts = address.split(", ")
+        if len(parts) > 1 and parts[-1].lower() in ["philippines", "ph"]:
+            address = ", ".join(parts[:-1])
+    else:
+        address = "Unknown Address"
+    GEO_CACHE.set(key, address)
+    return address
+
+# Google place types that our own `locations` tags cover, mapped to those tags
+GOOGLE_TYPE_TAGS = {
+    "hospital": ["hospital"],
+    "church": ["church"],
+    "park": ["park"],
+    "shopping_mall": ["commercial"],
+    "market": ["market"],
+    "school": ["school", "college"],
+    "university": ["university", "college"],
+    "restaurant": ["restaurant"],
+    "bank": ["banking"],
+    "bus_station": ["terminal"],
+    "tourist_attraction": ["sightseeing"],
+    "hotel": ["hotel"],
+    "lodging": ["accommodation"],
+    "museum": ["museum"],
+    "local_government_office": ["barangay"],
+    "gas_station": ["fuel"],
+}
+LOCAL_POI_RADIUS_KM = float(os.getenv("LOCAL_POI_RADIUS_KM", "3"))
+LOCAL_POI_MIN_CANDIDATES = int(os.getenv("LOCAL_POI_MIN_CANDIDATES", "1"))
+
+def find_local_poi(lat: float, lng: float, poi_type: str, max_results: int = 1) -> Optional[str]:
+    tags = GOOGLE_TYPE_TAGS.get(poi_type)
+    # Check if our locations collection has no tags for this place type
+    if not tags:
+        return None
+    locations_index = LOCATIONS_INDEX
+    candidate_ids = locations_index.ids_with_tags(tags)
+    nearby_places = locations_index.within(lat, lng, LOCAL_POI_RADIUS_KM, candidate_ids)
+    # Check if local coverage is too thin to answer without the Places API
+    if len(nearby_places) < max(max_results, LOCAL_POI_MIN_CANDIDATES):
+        record_cache("local_poi", False)
+        return None
+    record_cache("local_poi", True)
+    return ", ".join(locations_index.names[place_id] for _, place_id in nearby_places[:max_results])
 
 def set_location_slots(tracker: Tracker) -> List[Dict[Text, Any]]:
     latest_message = tracker.latest_message.get("metadata", {})
@@ -147,7 +703,7 @@ def set_location_slots(tracker: Tracker) -> List[Dict[Text, Any]]:
 
     return slots
 
-def handle_location_input(
+async def handle_location_input(
     origin: str,
     destination: str,
     tracker: Tracker,
@@ -170,7 +726,7 @@ def handle_location_input(
         user_lng = next((slot["value"] for slot in loc_slots if slot["name"] == "longitude"), None)
         # Check if user latitude and longitude are valid
         if user_lat and user_lng and user_lat != 0 and user_lng != 0:
-            origin = get_user_current_location(user_lat, user_lng)
+            origin = await get_user_current_location(user_lat, user_lng)
             # Check if the current location could not be determined
             if origin == "Unknown Location":
                 dispatcher.utter_message(text="Could not determine your current location. Please specify a nearby landmark.")
@@ -182,52 +738,366 @@ def handle_location_input(
     return origin, destination, True
 
 def get_fare_data(distance: float) -> Dict[str, float]:
-    rounded_distance = round(distance)
-    fare_data = FARE_CACHE.get(rounded_distance)
-    # Check if fare data is not found for the exact distance
-    if not fare_data:
-        min_diff = float("inf")
-        for dist, data in FARE_CACHE.items():
-            diff = abs(dist - rounded_distance)
-            # Check if the distance difference is minimal and within 1 km
-            if diff < min_diff and diff <= 1:
-                min_diff = diff
-                fare_data = data
+    fare_data = FARE_TABLE.lookup(distance)
+    record_cache("fare_table", fare_data is not None)
     return fare_data
 
+def get_fare_data_batch(distances: List[float]) -> tuple:
+    # Prices many distances in one vectorized call; returns (regular, discounted) arrays
+    return FARE_TABLE.price(distances)
+
+def stale_or_error(kind: str, key: str, error: tuple) -> tuple:
+    stale = MAPS_CACHE.get_stale(kind, key)
+    # Check if an expired but successful answer is still around to fall back on
+    if stale is not None and stale[-1] == "OK":
+        STALE_RESPONSES.inc(lookup=kind)
+        return tuple(stale)
+    return error
+
+async def get_cached_distance(origin: str, destination: str, region: str = "ph") -> tuple:
+    origin = canonical_place(origin)
+    destination = canonical_place(destination)
+    key = distance_key(origin, destination, region)
+    known = lookup_known_distance(origin, destination, key)
+    if known is not None:
+        return known
+    result = await MAPS_FLIGHTS.do(("distance", key), lambda: fetch_distance(origin, destination, region, key))
+    return estimate_on_error(origin, destination, result)
+
+def distance_key(origin: str, destination: str, region: str) -> str:
+    return normalize_key(normalize_landmark(origin), normalize_landmark(destination), region)
+
+def lookup_known_distance(origin: str, destination: str, key: str) -> Optional[tuple]:
+    # Everything that can answer a distance without calling Google, cheapest first
+    known_pair = LANDMARK_MATRIX.lookup(origin, destination)
+    record_cache("landmark_matrix", known_pair is not None)
+    # Check if both places are known landmarks with a precomputed distance
+    if known_pair is not None:
+        return known_pair[0], "OK"
+    # Check if local estimates are trusted for quotes, leaving Google for unknown places
+    if ROAD_DISTANCE_MODE == "primary":
+        estimate = estimate_distance(origin, destination)
+        if estimate is not None:
+            LOOKUP_RESULTS.inc(lookup="distance", status="ESTIMATED")
+            return estimate, "ESTIMATED"
+    cached = MAPS_CACHE.get("distance", key)
+    # Serve repeat questions from the shared cache, including recent NOT_FOUND answers
+    if cached is not None:
+        return tuple(cached)
+    return None
+
+def estimate_on_error(origin: str, destination: str, result: tuple) -> tuple:
+    distance_km, status = result
+    # Check if Google failed with nothing stale to fall back on; the road graph can
+    # still price the trip
+    if status == "ERROR":
+        estimate = estimate_distance(origin, destination)
+        if estimate is not None:
+            LOOKUP_RESULTS.inc(lookup="distance", status="ESTIMATED")
+            return estimate, "ESTIMATED"
+    return distance_km, status
+
+async def fetch_distance(origin: str, destination: str, region: str, key: str) -> tuple:
+    try:
+        distance_matrix = await gmaps.distance_matrix(
+            origins=origin,
+            destinations=destination,
+            mode="driving",
+            units="metric",
+            region=region
+        )
+        element = distance_matrix["rows"][0]["elements"][0]
+        status = element["status"]
+        distance_km = element["distance"]["value"] / 1000.0 if status == "OK" else None
+    except Exception as e:
+        logger.warning("Distance lookup from %s to %s failed: %s", origin, destination, e)
+        # Errors are transient, so they are never cached
+        LOOKUP_RESULTS.inc(lookup="distance", status="ERROR")
+        return stale_or_error("distance", key, (None, "ERROR"))
+    LOOKUP_RESULTS.inc(lookup="distance", status=status)
+    MAPS_CACHE.set("distance", key, [distance_km, status], status)
+    if status == "OK":
+        observe_road_distance(origin, destination, distance_km)
+    return distance_km, status
+
+def format_itineraries(origin: str, destination: str, itineraries: List[Dict[str, Any]], priced: bool = True) -> str:
+    lines = [f"No single route goes from {origin} to {destination}, but you can transfer:"]
+    for number, itinerary in enumerate(itineraries, 1):
+        steps = []
+        for leg in itinerary["legs"]:
+            # Check if this part of the trip is on foot
+            if leg["route"] is None:
+                steps.append(f"walk from {leg['from']} to {leg['to']}")
+            else:
+                steps.append(f"ride {leg['route']} from {leg['from']} to {leg['to']}")
+        trip = ", then ".join(steps)
+        # Check if the fare matrix is missing; every leg would be quoted at ₱0.00
+        if not priced:
+            lines.append(f"{number}. {trip[0].upper()}{trip[1:]}")
+            continue
+        lines.append(
+            f"{number}. {trip[0].upper()}{trip[1:]} "
+            f"(regular fare ₱{round(itinerary['regular']):.2f}, discounted ₱{round(itinerary['discounted']):.2f})"
+        )
+    if not priced:
+        lines.append("Fare information is not available right now.")
+    return "\n".join(lines)
+
+# Bulk pricing for the map screen and partner integrations (see actions/batch_server.py).
+# Pairs the caches can answer are priced first; the rest are packed into
+# multi-element Distance Matrix requests within Google's per-request limits.
+MATRIX_MAX_PLACES = 25
+MATRIX_MAX_ELEMENTS = 100
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+def distance_blocks(missing: Dict[str, List[str]]) -> List[tuple]:
+    # Origins that lack the same destinations share requests, so "one terminal to
+    # every barangay hall" and full grids both need few calls
+    origins_by_destinations: Dict[tuple, List[str]] = {}
+    for origin, destinations in missing.items():
+        for start in range(0, len(destinations), MATRIX_MAX_PLACES):
+            chunk = tuple(destinations[start:start + MATRIX_MAX_PLACES])
+            origins_by_destinations.setdefault(chunk, []).append(origin)
+    blocks = []
+    for destinations, origins in origins_by_destinations.items():
+        step = max(1, min(MATRIX_MAX_PLACES, MATRIX_MAX_ELEMENTS // len(destinations)))
+        for start in range(0, len(origins), step):
+            blocks.append((origins[start:start + step], list(destinations)))
+    return blocks
+
+async def fetch_distance_block(origins: List[str], destinations: List[str], region: str) -> List[tuple]:
+    # Returns (origin, destination, distance_km, status) for every element of the block
+    try:
+        distance_matrix = await gmaps.distance_matrix(
+            origins=origins,
+            destinations=destinations,
+            mode="driving",
+            units="metric",
+            region=region
+        )
+        rows = distance_matrix["rows"]
+    except Exception as e:
+        logger.warning("Distance matrix lookup for %s origins and %s destinations failed: %s", len(origins), len(destinations), e)
+        rows = None
+    results = []
+    answers = []
+    for i, origin in enumerate(origins):
+        for j, destination in enumerate(destinations):
+            key = distance_key(origin, destination, region)
+            try:
+                element = rows[i]["elements"][j]
+                status = element["status"]
+                distance_km = element["distance"]["value"] / 1000.0 if status == "OK" else None
+            except (TypeError, LookupError, ValueError) as e:
+                # Check if the whole request failed; that was logged above
+                if rows is not None:
+                    logger.warning("Malformed distance matrix element for %s to %s: %s", origin, destination, e)
+                element = None
+            # Check if the request failed or its answer has no usable element for this
+            # pair; each pair falls back on its own
+            if element is None:
+                LOOKUP_RESULTS.inc(lookup="distance", status="ERROR")
+                result = stale_or_error("distance", key, (None, "ERROR"))
+            else:
+                LOOKUP_RESULTS.inc(lookup="distance", status=status)
+                answers.append((key, [distance_km, status], status))
+                if status == "OK":
+                    observe_road_distance(origin, destination, distance_km)
+                result = (distance_km, status)
+            results.append((origin, destination) + estimate_on_error(origin, destination, result))
+    MAPS_CACHE.set_many("distance", answers)
+    return results
+
+def price_trip_rows(rows: List[tuple], requested: Dict[tuple, List[tuple]], fare_table: FareTable, route_index: RouteIndex) -> List[Dict[str, Any]]:
+    # Prices the distances of all rows in one vectorized fare lookup
+    distances = np.asarray([np.nan if row[2] is None else row[2] for row in rows], dtype=np.float64)
+    regular, discounted = fare_table.price(distances)
+    priced = np.isfinite(distances) & np.isfinite(regular)
+    regular = np.round(regular).tolist()
+    discounted = np.round(discounted).tolist()
+    trips = []
+    for i, (origin, destination, distance_km, status) in enumerate(rows):
+        routes = route_index.find_routes(origin, destination)
+        for requested_origin, requested_destination in requested[(origin, destination)]:
+            trips.append({
+                "origin": requested_origin,
+                "destination": requested_destination,
+                "distance_km": None if distance_km is None else round(distance_km, 2),
+                "status": status,
+                "regular": regular[i] if priced[i] else None,
+                "discounted": discounted[i] if priced[i] else None,
+                "routes": routes,
+            })
+    return trips
+
+async def price_trips(origins: List[str], destinations: List[str], region: str = "ph"):
+    # Async generator over lists of priced trips, one list per step as it completes,
+    # covering every origin/destination combination once
+    fare_table = FARE_TABLE
+    route_index = ROUTE_INDEX
+    origins = list(dict.fromkeys(origins))
+    destinations = list(dict.fromkeys(destinations))
+    places = {name: canonical_place(name) for name in origins + destinations}
+
+    # Names that resolve to the same place are looked up and priced once
+    requested: Dict[tuple, List[tuple]] = {}
+    same_place = []
+    for origin in origins:
+        for destination in destinations:
+            pair = (places[origin], places[destination])
+            # Check if both names mean the same place; there is no trip to price
+            if normalize_landmark(pair[0]) == normalize_landmark(pair[1]):
+                same_place.append({
+                    "origin": origin, "destination": destination, "distance_km": 0.0, "status": "SAME_PLACE",
+                    "regular": None, "discounted": None, "routes": [],
+                })
+                continue
+            requested.setdefault(pair, []).append((origin, destination))
+
+    known_rows = []
+    missing: Dict[str, List[str]] = {}
+    for origin, destination in requested:
+        known = lookup_known_distance(origin, destination, distance_key(origin, destination, region))
+        if known is not None:
+            known_rows.append((origin, destination) + tuple(known))
+        else:
+            missing.setdefault(origin, []).append(destination)
+    first = same_place + (price_trip_rows(known_rows, requested, fare_table, route_index) if known_rows else [])
+    if first:
+        yield first
+
+    limit = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    async def fetch_block(block: tuple) -> List[tuple]:
+        async with limit:
+            return await fetch_distance_block(block[0], block[1], region)
+    tasks = [asyncio.ensure_future(fetch_block(block)) for block in distance_blocks(missing)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield price_trip_rows(await finished, requested, fare_table, route_index)
+    finally:
+        # The client may hang up halfway; its remaining requests are not needed
+        for task in tasks:
+            task.cancel()
+
+def directions_key(origin: str, destination: str, region: str, bucket: tuple) -> str:
+    return normalize_key(normalize_landmark(origin), normalize_landmark(destination), region, *bucket)
+
+async def get_cached_directions(origin: str, destination: str, region: str = "ph") -> tuple:
+    origin = canonical_place(origin)
+    destination = canonical_place(destination)
+    bucket = time_bucket()
+    key = directions_key(origin, destination, region, bucket)
+    hot = ETA_HOT_PAIRS.record(key)
+    cached = MAPS_CACHE.get("directions", key)
+    if cached is not None:
+        if hot:
+            refresh_hot_pair(origin, destination, region, bucket, key)
+        return tuple(cached)
+    flight = MAPS_FLIGHTS.do(("directions", key), lambda: fetch_directions(origin, destination, region, key, bucket))
+    try:
+        # The request keeps running after a timeout and fills the cache for the next user
+        result = await asyncio.wait_for(flight, ETA_API_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Directions from %s to %s took over %ss; estimating", origin, destination, ETA_API_TIMEOUT)
+        result = (None, None, "ERROR")
+    # Check if Google was too slow or failed with nothing stale to fall back on
+    if result[2] == "ERROR":
+        estimate = estimate_duration(origin, destination, region, bucket)
+        if estimate is not None:
+            LOOKUP_RESULTS.inc(lookup="directions", status="ESTIMATED")
+            return estimate
+    return result
+
+def refresh_hot_pair(origin: str, destination: str, region: str, bucket: tuple, key: str) -> None:
+    now = time.time()
+    expires_at = MAPS_CACHE.expires_at("directions", key)
+    # Check if the entry runs out soon
+    if expires_at is not None and expires_at - now < ETA_REFRESH_AHEAD:
+        start_refresh(origin, destination, region, bucket, key, "now")
+    # Check if the next bucket starts soon; fetch it for the time it starts
+    next_start = bucket_end(now)
+    if next_start - now < ETA_REFRESH_AHEAD:
+        next_bucket = time_bucket(next_start)
+        next_key = directions_key(origin, destination, region, next_bucket)
+        if MAPS_CACHE.expires_at("directions", next_key) is None:
+            start_refresh(origin, destination, region, next_bucket, next_key, int(next_start))
+
+def start_refresh(origin: str, destination: str, region: str, bucket: tuple, key: str, departure_time: Any) -> None:
+    task = asyncio.ensure_future(MAPS_FLIGHTS.do(
+        ("directions", key), lambda: fetch_directions(origin, destination, region, key, bucket, departure_time)
+    ))
+    ETA_REFRESHES.add(task)
+    task.add_done_callback(ETA_REFRESHES.discard)
+
+def estimate_duration(origin: str, destination: str, region: str, bucket: tuple) -> Optional[tuple]:
+    known_pair = LANDMARK_MATRIX.lookup(origin, destination)
+    cached = MAPS_CACHE.get_stale("distance", distance_key(origin, destination, region))
+    if known_pair is not None:
+        distance_km = known_pair[0]
+    elif cached is not None and cached[1] == "OK":
+        distance_km = cached[0]
+    else:
+        distance_km = estimate_distance(origin, destination)
+    # Check if there is no distance to derive a travel time from
+    if distance_km is None:
+        return None
+    duration_seconds = int(round(ETA_SPEEDS.estimate_seconds(bucket, distance_km)))
+    return duration_seconds, format_duration(duration_seconds), "ESTIMATED"
+
+async def fetch_directions(origin: str, destination: str, region: str, key: str, bucket: tuple, departure_time: Any = "now") -> tuple:
+    try:
+        directions_result = await gmaps.directions(
+            origin=origin,
+            destination=destination,
+            mode="driving",
+            region=region,
+            departure_time=departure_time if ETA_TRAFFIC else None
+        )
+        # Check if directions result is valid and contains data
+        if directions_result and len(directions_result) > 0:
+            leg = directions_result[0]["legs"][0]
+            # Only requests with a departure time carry the traffic-aware duration
+            duration = leg.get("duration_in_traffic") or leg["duration"]
+            result = [duration["value"], duration["text"], "OK"]
+            if "distance" in leg:
+                ETA_SPEEDS.add(bucket, leg["distance"]["value"] / 1000.0, duration["value"])
+        # Handle case where no directions are found
+        else:
+            result = [None, None, "ZERO_RESULTS"]
+    except googlemaps.exceptions.ApiError as e:
+        # Check if Google could not geocode one of the places
+        if e.status not in ("NOT_FOUND", "ZERO_RESULTS"):
+            logger.warning("Directions lookup from %s to %s failed: %s", origin, destination, e)
+            LOOKUP_RESULTS.inc(lookup="directions", status="ERROR")
+            return stale_or_error("directions", key, (None, None, "ERROR"))
+        result = [None, None, e.status]
+    except Exception as e:
+        logger.warning("Directions lookup from %s to %s failed: %s", origin, destination, e)
+        LOOKUP_RESULTS.inc(lookup="directions", status="ERROR")
+        return stale_or_error("directions", key, (None, None, "ERROR"))
+    LOOKUP_RESULTS.inc(lookup="directions", status=result[2])
+    MAPS_CACHE.set("directions", key, result, result[2], ttl=ETA_BUCKET_TTLS[bucket[1]])
+    return tuple(result)
+
 class ActionHandleFareInquiry(Action):
     def name(self) -> Text:
         return "action_handle_fare_inquiry"
 
-    @lru_cache(maxsize=1000)
-    def get_cached_distance(self, origin: str, destination: str, region: str = "ph") -> tuple:
-        try:
-            distance_matrix = gmaps.distance_matrix(
-                origins=origin,
-                destinations=destination,
-                mode="driving",
-                units="metric",
-                region=region
-            )
-            element = distance_matrix["rows"][0]["elements"][0]
-            status = element["status"]
-            distance_km = element["distance"]["value"] / 1000.0 if status == "OK" else None
-            return distance_km, status
-        except Exception as e:
-            return None, "ERROR"
-
-    def run(
+    @track_action
+    @with_latency_budget(ACTION_BUDGET_SECONDS)
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
         domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
+        await wait_for_warmup()
         origin = tracker.get_slot("origin")
         destination = tracker.get_slot("destination")
         route = tracker.get_slot("route")
         discount = tracker.get_slot("discount")
 
-        origin, destination, is_valid = handle_location_input(origin, destination, tracker, dispatcher)
+        origin, destination, is_valid = await handle_location_input(origin, destination, tracker, dispatcher)
         # Check if the location input is invalid
         if not is_valid:
             return [SlotSet("origin", None), SlotSet("destination", None)]
@@ -235,7 +1105,7 @@ class ActionHandleFareInquiry(Action):
         region = "ph"
 
         try:
-            distance_km, status = self.get_cached_distance(origin, destination, region)
+            distance_km, status = await get_cached_distance(origin, destination, region)
             # Check if one of the locations was not found
             if status == "NOT_FOUND":
                 dispatcher.utter_message(text=f"One of the locations ({origin} or {destination}) was not found. Please provide more specific names.")
@@ -290,10 +1160,16 @@ class ActionHandleFareInquiry(Action):
                     f"The regular fare from {origin} to {destination} is ₱{regular_fare:.2f}. For a discount, it's ₱{discounted_fare:.2f}."
                 )
 
+            # Check if the distance came from the offline road graph instead of Google
+            if status == "ESTIMATED":
+                response_parts.append(f"This is based on an estimated road distance of about {distance_km:.1f} km.")
+
             dispatcher.utter_message(text=" ".join(response_parts))
             return []
 
         except Exception as e:
+            logger.exception("%s failed", self.name())
+            ACTION_ERRORS.inc(action=self.name())
             dispatcher.utter_message(text="An error occurred while calculating the fare. Please try again.")
             return []
 
@@ -301,12 +1177,15 @@ class ActionHandleFindNearest(Action):
     def name(self) -> Text:
         return "action_handle_find_nearest"
 
-    def run(
+    @track_action
+    @with_latency_budget(ACTION_BUDGET_SECONDS)
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
         domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
+        await wait_for_warmup()
         poi_type = tracker.get_slot("poi")
         
         # Check if the point of interest (POI) type is not specified
@@ -449,7 +1328,14 @@ class ActionHandleFindNearest(Action):
         is_list_request = "list" in user_input or poi_type.lower() in plural_poi
 
         max_results = 5 if is_list_request else 1
-        location = get_nearest_poi(user_lat, user_lng, google_poi_type, max_results)
+        # Answer from our own locations when they cover the area, otherwise ask Places
+        location = find_local_poi(user_lat, user_lng, google_poi_type, max_results)
+        if location is None:
+            location = await get_nearest_poi(user_lat, user_lng, google_poi_type, max_results)
+        # Check if Places could not be reached and nothing was cached for this area
+        if location is None:
+            dispatcher.utter_message(text=f"I can't look up nearby {poi_type}s right now. Please try again in a moment.")
+            return []
 
         # Check if the request is for a list of POIs (plural or explicit list request)
         if is_list_request and ", " in location:
@@ -466,34 +1352,19 @@ class ActionHandleRouteFinder(Action):
     def name(self) -> Text:
         return "action_handle_route_finder"
     
-    @lru_cache(maxsize=1000)
-    def get_cached_distance(self, origin: str, destination: str, region: str = "ph") -> tuple:
-        try:
-            distance_matrix = gmaps.distance_matrix(
-                origins=origin,
-                destinations=destination,
-                mode="driving",
-                units="metric",
-                region=region
-            )
-            element = distance_matrix["rows"][0]["elements"][0]
-            status = element["status"]
-            distance_km = element["distance"]["value"] / 1000.0 if status == "OK" else None
-            return distance_km, status
-        except Exception as e:
-            return None, "ERROR"
-
-
-    def run(
+    @track_action
+    @with_latency_budget(ACTION_BUDGET_SECONDS)
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
         domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
+        await wait_for_warmup()
         origin = tracker.get_slot("origin")
         destination = tracker.get_slot("destination")
 
-        origin, destination, is_valid = handle_location_input(origin, destination, tracker, dispatcher)
+        origin, destination, is_valid = await handle_location_input(origin, destination, tracker, dispatcher)
         # Check if the location input is invalid
         if not is_valid:
             return []
@@ -501,7 +1372,24 @@ class ActionHandleRouteFinder(Action):
         region = "ph"
 
         try:
-            distance_km, status = self.get_cached_distance(origin, destination, region)
+            list_of_routes = ROUTE_INDEX.find_routes(canonical_place(origin), canonical_place(destination))
+
+            # Check if no single route serves both places; a trip with transfers may
+            if not list_of_routes:
+                itineraries = ROUTE_PLANNER.plan(
+                    canonical_place(origin), canonical_place(destination), ROUTE_MAX_TRANSFERS, ROUTE_PLAN_LIMIT
+                )
+                record_cache("route_planner", bool(itineraries))
+                # Check if the places cannot be connected even with transfers
+                if not itineraries:
+                    dispatcher.utter_message(
+                        text=f"No routes found from {origin} to {destination}. Please try different locations."
+                    )
+                    return []
+                dispatcher.utter_message(text=format_itineraries(origin, destination, itineraries, len(FARE_TABLE) > 0))
+                return []
+
+            distance_km, status = await get_cached_distance(origin, destination, region)
             # Check if one of the locations was not found
             if status == "NOT_FOUND":
                 dispatcher.utter_message(text=f"One of the locations ({origin} or {destination}) was not found. Please provide more specific names.")
@@ -523,38 +1411,6 @@ class ActionHandleRouteFinder(Action):
 
             regular_fare = round(fare_data["regular"])
             discounted_fare = round(fare_data["discounted"])
-        
-            list_of_routes = []
-            routes_ref = db.collection("routes")
-            routes_docs = routes_ref.stream()
-
-            for doc in routes_docs:
-                route_data = doc.to_dict()
-                landmarks = route_data.get("landmarks", [])
-
-                origin_found = False
-                destination_found = False
-                for landmark in landmarks:
-                    # Check if the current landmark matches the origin
-                    if landmark.lower() == origin.lower():
-                        origin_found = True
-                    # Check if the current landmark matches the destination
-                    elif landmark.lower() == destination.lower():
-                        destination_found = True
-                        # Check if destination was found before origin (invalid order)
-                        if not origin_found:
-                            break
-                    # Check if both origin and destination were found in correct order
-                    if origin_found and destination_found:
-                        list_of_routes.append(route_data["name"])
-                        break
-
-            # Check if any valid routes were found
-            if not list_of_routes:
-                dispatcher.utter_message(
-                    text=f"No routes found from {origin} to {destination}. Please try different locations."
-                )
-                return []
 
             routes_string = "\n".join([f"- {list_of_routes[i]}" for i in range(len(list_of_routes))])
             response = (
@@ -567,6 +1423,8 @@ class ActionHandleRouteFinder(Action):
             return []
 
         except Exception as e:
+            logger.exception("%s failed", self.name())
+            ACTION_ERRORS.inc(action=self.name())
             dispatcher.utter_message(text="An error occurred while finding routes. Please try again.")
             return []
 
@@ -574,27 +1432,15 @@ class ActionHandleRecommendPlace(Action):
     def name(self) -> Text:
         return "action_handle_recommend_place"
     
-    def haversine_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        R = 6371.0  # Earth's radius in kilometers
-        lat1_rad = math.radians(lat1)
-        lon1_rad = math.radians(lon1)
-        lat2_rad = math.radians(lat2)
-        lon2_rad = math.radians(lon2)
-
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-
-        a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        distance = R * c
-        return distance
-
-    def run(
+    @track_action
+    @with_latency_budget(ACTION_BUDGET_SECONDS)
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
         domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
+        await wait_for_warmup()
         activity = tracker.get_slot("activity")
         activity = activity.lower() if activity else None
         location = tracker.get_slot("location")
@@ -756,37 +1602,13 @@ class ActionHandleRecommendPlace(Action):
         location_tag = location_mapping.get(location, [location]) if location else []
 
         try:
-            locations_with_distance = []
-            for _, location_data in LOCATIONS_CACHE.items():
-                coords = location_data.get("coords", {})
-                place_lat = coords.get("lat")
-                place_lng = coords.get("lon")
-                # Skip if place coordinates are invalid
-                if place_lat is None or place_lng is None:
-                    continue
-
-                distance = self.haversine_distance(user_lat, user_lng, place_lat, place_lng)
-                locations_with_distance.append({
-                    "name": location_data["name"],
-                    "description": location_data["description"],
-                    "tags": [tag.lower() for tag in location_data["tags"]],
-                    "distance": distance
-                })
+            locations_index = LOCATIONS_INDEX
+            # Only places tagged for the activity or location type are candidates
+            candidate_ids = locations_index.ids_with_tags(activity_tags + location_tag)
+            nearest_places = locations_index.nearest(user_lat, user_lng, 5, candidate_ids)
 
-            locations_with_distance.sort(key=lambda x: x["distance"])
-
-            recommended_places = []
-            description_places = []
-            for locs in locations_with_distance:
-                loc_tags = locs["tags"]
-                # Check if activity or location tags match the location's tags
-                if (activity and any(tag.lower() in loc_tags for tag in activity_tags)) or \
-                   (location and any(tag.lower() in loc_tags for tag in location_tag)):
-                    recommended_places.append(locs["name"])
-                    description_places.append(locs["description"])
-                    # Stop after collecting 5 recommendations
-                    if len(recommended_places) >= 5:
-                        break
+            recommended_places = [locations_index.names[place_id] for _, place_id in nearest_places]
+            description_places = [locations_index.descriptions[place_id] for _, place_id in nearest_places]
 
             # Check if any recommended places were found
             if recommended_places:
@@ -803,6 +1625,8 @@ class ActionHandleRecommendPlace(Action):
                 return [SlotSet("activity", None), SlotSet("location", None)]
 
         except Exception as e:
+            logger.exception("%s failed", self.name())
+            ACTION_ERRORS.inc(action=self.name())
             dispatcher.utter_message(text=f"An error occurred while finding places for {activity or location}. Please try again.")
             return [SlotSet("activity", None), SlotSet("location", None)]
         
@@ -810,33 +1634,15 @@ class ActionHandleTravelTimeEstimate(Action):
     def name(self) -> Text:
         return "action_handle_travel_time_estimate"
 
-    @lru_cache(maxsize=1000)
-    def get_cached_directions(self, origin: str, destination: str, region: str = "ph") -> tuple:
-        try:
-            directions_result = gmaps.directions(
-                origin=origin,
-                destination=destination,
-                mode="driving",
-                region=region
-            )
-            # Check if directions result is valid and contains data
-            if directions_result and len(directions_result) > 0:
-                leg = directions_result[0]["legs"][0]
-                duration = leg["duration"]["value"]
-                duration_text = leg["duration"]["text"]
-                return duration, duration_text, "OK"
-            # Handle case where no directions are found
-            else:
-                return None, None, "ZERO_RESULTS"
-        except Exception as e:
-            return None, None, "ERROR"
-
-    def run(
+    @track_action
+    @with_latency_budget(ACTION_BUDGET_SECONDS)
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
         domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
+        await wait_for_warmup()
         destination = tracker.get_slot("destination")
         origin = tracker.get_slot("origin")
 
@@ -845,7 +1651,7 @@ class ActionHandleTravelTimeEstimate(Action):
             dispatcher.utter_message(text="Please specify a destination.")
             return []
 
-        origin, destination, is_valid = handle_location_input(origin, destination, tracker, dispatcher)
+        origin, destination, is_valid = await handle_location_input(origin, destination, tracker, dispatcher)
         # Check if the location input is invalid
         if not is_valid:
             return []
@@ -853,10 +1659,9 @@ class ActionHandleTravelTimeEstimate(Action):
         region = "ph"
 
         try:
-            duration_seconds, duration_text, status = self.get_cached_directions(origin, destination, region)
+            duration_seconds, duration_text, status = await get_cached_directions(origin, destination, region)
             # Check if one of the locations was not found
             if status == "NOT_FOUND":
-                self.get_cached_directions.cache_clear()
                 dispatcher.utter_message(text=f"One of the locations ({origin} or {destination}) was not found. Please provide more specific names.")
                 return [SlotSet("origin", None), SlotSet("destination", None)]
             # Check if no driving route exists
@@ -876,12 +1681,17 @@ class ActionHandleTravelTimeEstimate(Action):
             response_parts.append(
                 f"The estimated travel time from {origin} to {destination} is {duration_text}."
             )
+            # Check if Google was too slow and the time comes from typical traffic
+            if status == "ESTIMATED":
+                response_parts.append("This is based on typical traffic at this time of day.")
 
             dispatcher.utter_message(text=" ".join(response_parts))
             eta_minutes = duration_seconds / 60.0
             return [SlotSet("eta", eta_minutes)]
 
         except Exception as e:
+            logger.exception("%s failed", self.name())
+            ACTION_ERRORS.inc(action=self.name())
             dispatcher.utter_message(text="An error occurred while calculating the travel time. Please try again.")
             return []
 
@@ -889,12 +1699,15 @@ class ActionHandleLocationInquiry(Action):
     def name(self) -> Text:
         return "action_handle_location_inquiry"
 
-    def run(
+    @track_action
+    @with_latency_budget(ACTION_BUDGET_SECONDS)
+    async def run(
         self,
         dispatcher: CollectingDispatcher,
         tracker: Tracker,
         domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
+        await wait_for_warmup()
         loc_slots = set_location_slots(tracker)
         user_lat = next((slot["value"] for slot in loc_slots if slot["name"] == "latitude"), None)
         user_lng = next((slot["value"] for slot in loc_slots if slot["name"] == "longitude"), None)
@@ -904,15 +1717,18 @@ class ActionHandleLocationInquiry(Action):
             return []
 
         try:
-            current_location = get_user_reverse_geocode(user_lat, user_lng)
+            # The address and the nearest landmark are independent, so fetch them concurrently
+            current_location, nearest_landmark = await asyncio.gather(
+                get_user_reverse_geocode(user_lat, user_lng),
+                get_nearest_poi(user_lat, user_lng, "point_of_interest", max_results=1)
+            )
             # Check if address could not be determined
             if current_location == "Unknown Address":
                 dispatcher.utter_message(text="Sorry, I couldn't identify your current address. Please try again or share your location.")
                 return []
 
-            nearest_landmark = get_nearest_poi(user_lat, user_lng, "point_of_interest", max_results=1)
-            # Check if no nearby landmark was found
-            if nearest_landmark.startswith("No "):
+            # Check if no nearby landmark was found or Places could not be reached
+            if nearest_landmark is None or nearest_landmark.startswith("No "):
                 nearest_landmark = "a notable landmark"
                 
 
@@ -925,5 +1741,7 @@ class ActionHandleLocationInquiry(Action):
             return []
 
         except Exception as e:
+            logger.exception("%s failed", self.name())
+            ACTION_ERRORS.inc(action=self.name())
             dispatcher.utter_message(text="An error occurred while determining your location. Please try again.")
             return []
\ No newline at end of file
@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Dict, Optional, Text, Tuple
+
+import aiohttp
+from googlemaps.exceptions import ApiError, HTTPError, Timeout, TransportError
+
+from actions.metrics import observe_call
+
+BASE_URL = "https://maps.googleapis.com"
+DEFAULT_TIMEOUT_SECONDS = 5.0
+
+
+def _latlng(location: Tuple[float, float]) -> Text:
+    return f"{location[0]},{location[1]}"
+
+
+def _join(places: Any) -> Text:
+    # distance_matrix accepts one place or a list of places
+    if isinstance(places, (list, tuple)):
+        return "|".join(str(place) for place in places)
+    return str(places)
+
+
+class AsyncMapsClient:
+    # Non-blocking counterpart of googlemaps.Client for the endpoints the actions use.
+    # Responses and errors mirror googlemaps.Client so callers handle both the same way.
+    def __init__(self, key: Optional[Text], timeout: float = DEFAULT_TIMEOUT_SECONDS, base_url: Text = BASE_URL) -> None:
+        self.key = key
+        self.timeout = timeout
+        self.base_url = base_url
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        # A session is bound to the loop it was created on
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._session_loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _request(self, path: Text, params: Dict[Text, Any], timeout: Optional[float] = None) -> Dict[Text, Any]:
+        params = {name: value for name, value in params.items() if value is not None}
+        params["key"] = self.key
+        request_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        method = path.split("/")[-2]
+        with observe_call("google_maps", method) as outcome:
+            try:
+                async with self._get_session().get(self.base_url + path, params=params, timeout=request_timeout) as response:
+                    if response.status != 200:
+                        outcome["status"] = f"HTTP_{response.status}"
+                        raise HTTPError(response.status)
+                    body = await response.json(content_type=None)
+            except asyncio.TimeoutError:
+                outcome["status"] = "TIMEOUT"
+                raise Timeout()
+            except aiohttp.ClientError as e:
+                outcome["status"] = "TRANSPORT_ERROR"
+                raise TransportError(e)
+
+            api_status = body.get("status")
+            outcome["status"] = api_status or "ERROR"
+            # Same rule as googlemaps.Client: OK and ZERO_RESULTS are answers, the rest are errors
+            if api_status in ("OK", "ZERO_RESULTS"):
+                return body
+            raise ApiError(api_status, body.get("error_message"))
+
+    async def distance_matrix(
+        self,
+        origins: Any,
+        destinations: Any,
+        mode: Optional[Text] = None,
+        units: Optional[Text] = None,
+        region: Optional[Text] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[Text, Any]:
+        params = {
+            "origins": _join(origins),
+            "destinations": _join(destinations),
+            "mode": mode,
+            "units": units,
+            "region": region,
+        }
+        return await self._request("/maps/api/distancematrix/json", params, timeout)
+
+    async def directions(
+        self,
+        origin: Text,
+        destination: Text,
+        mode: Optional[Text] = None,
+        region: Optional[Text] = None,
+        departure_time: Optional[Any] = None,
+        timeout: Optional[float] = None,
+    ) -> list:
+        # departure_time ("now" or a Unix time) makes Google include duration_in_traffic
+        params = {"origin": origin, "destination": destination, "mode": mode, "region": region, "departure_time": departure_time}
+        body = await self._request("/maps/api/directions/json", params, timeout)
+        return body.get("routes", [])
+
+    async def places_nearby(
+        self,
+        location: Tuple[float, float],
+        type: Optional[Text] = None,
+        rank_by: Optional[Text] = None,
+        radius: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[Text, Any]:
+        params = {"location": _latlng(location), "type": type, "rankby": rank_by, "radius": radius}
+        return await self._request("/maps/api/place/nearbysearch/json", params, timeout)
+
+    async def reverse_geocode(self, latlng: Tuple[float, float], timeout: Optional[float] = None) -> list:
+        body = await self._request("/maps/api/geocode/json", {"latlng": _latlng(latlng)}, timeout)
+        return body.get("results", [])
@@ -0,0 +1,100 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Any, List, Optional, Text
+
+from aiohttp import web
+
+if __name__ == "__main__":
+    # Run on its own, this process starts only what the endpoint needs (see main);
+    # the action server next to it already owns the status port. Imported by the
+    # action server, the actions module has started its services already.
+    os.environ["ACTIONS_AUTOSTART"] = "false"
+
+from actions import actions
+
+logger = logging.getLogger(__name__)
+
+# Bulk fare/route endpoint that runs next to the Rasa action server, for callers
+# that need many trips priced at once (the map screen, partner integrations):
+#   python -m actions.batch_server --port 5057
+#   POST /batch/fares {"origins": [...], "destinations": [...], "region": "ph"}
+# Every origin/destination combination comes back as one JSON object per line,
+# streamed as soon as its distance is known:
+#   {"origin", "destination", "distance_km", "status", "regular", "discounted", "routes"}
+DEFAULT_PORT = 5057
+MAX_PAIRS = int(os.getenv("BATCH_MAX_PAIRS", "2500"))
+NDJSON = "application/x-ndjson"
+# Region biases passed on to Google; Legazpi only needs the Philippines
+REGIONS = frozenset(region.strip().lower() for region in os.getenv("BATCH_REGIONS", "ph").split(",") if region.strip())
+
+
+def bad_request(message: Text) -> web.Response:
+    return web.json_response({"error": message}, status=400)
+
+
+def place_list(value: Any) -> Optional[List[Text]]:
+    # Check if the value is a non-empty list of place names
+    if not isinstance(value, list) or not value:
+        return None
+    if not all(isinstance(name, str) and name.strip() for name in value):
+        return None
+    return [name.strip() for name in value]
+
+
+async def batch_fares(request: web.Request) -> web.StreamResponse:
+    try:
+        body = await request.json()
+    except ValueError:
+        return bad_request("Body must be JSON.")
+    if not isinstance(body, dict):
+        return bad_request("Body must be a JSON object.")
+    origins = place_list(body.get("origins"))
+    destinations = place_list(body.get("destinations"))
+    # Check if either side is missing or malformed
+    if origins is None or destinations is None:
+        return bad_request("'origins' and 'destinations' must be non-empty lists of place names.")
+    pairs = len(set(origins)) * len(set(destinations))
+    if pairs > MAX_PAIRS:
+        return bad_request(f"{pairs} trips requested; at most {MAX_PAIRS} per call.")
+    region = body.get("region", "ph")
+    if not isinstance(region, str) or region.lower() not in REGIONS:
+        return bad_request(f"'region' must be one of: {', '.join(sorted(REGIONS))}.")
+    region = region.lower()
+
+    await actions.wait_for_warmup()
+    response = web.StreamResponse(headers={"Content-Type": NDJSON})
+    await response.prepare(request)
+    async for trips in actions.price_trips(origins, destinations, region):
+        lines = "".join(json.dumps(trip, ensure_ascii=False) + "\n" for trip in trips)
+        await response.write(lines.encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def close_maps_client(app: web.Application) -> None:
+    await actions.gmaps.close()
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_post("/batch/fares", batch_fares)
+    app.on_cleanup.append(close_maps_client)
+    return app
+
+
+def main(argv: Optional[List[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk fare and route pricing next to the action server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("BATCH_PORT", DEFAULT_PORT)))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    actions.WARMUP.start()
+    web.run_app(create_app(), host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Text, Tuple
+
+# Travel times depend on when people travel, so cached directions are keyed on the
+# kind of day and a time-of-day bucket in Legazpi local time (UTC+8 all year).
+LOCAL_TIMEZONE = datetime.timezone(datetime.timedelta(hours=8))
+# (name, first hour, end hour)
+TIME_BUCKETS = [
+    ("night", 0, 6),
+    ("am_peak", 6, 9),
+    ("midday", 9, 16),
+    ("pm_peak", 16, 19),
+    ("evening", 19, 24),
+]
+# Rush-hour traffic changes quickly, so those answers expire sooner
+DEFAULT_BUCKET_TTLS = {
+    "night": 6 * 3600,
+    "am_peak": 30 * 60,
+    "midday": 2 * 3600,
+    "pm_peak": 30 * 60,
+    "evening": 2 * 3600,
+}
+# Average door-to-door driving speeds used until real answers have been seen
+DEFAULT_SPEEDS_KMH = {
+    "night": 35.0,
+    "am_peak": 18.0,
+    "midday": 24.0,
+    "pm_peak": 16.0,
+    "evening": 22.0,
+}
+SPEED_SMOOTHING = 0.1
+MIN_SPEED_KMH = 5.0
+MAX_SPEED_KMH = 80.0
+# A pair asked this often within the window is refreshed before its entry expires
+DEFAULT_HOT_HITS = 3
+DEFAULT_HOT_WINDOW = 3600.0
+DEFAULT_REFRESH_AHEAD = 300.0
+MAX_TRACKED_PAIRS = 10000
+
+
+def day_type(when: datetime.datetime) -> Text:
+    return "weekend" if when.weekday() >= 5 else "weekday"
+
+
+def time_bucket(timestamp: Optional[float] = None) -> Tuple[Text, Text]:
+    when = datetime.datetime.fromtimestamp(time.time() if timestamp is None else timestamp, LOCAL_TIMEZONE)
+    for name, start, end in TIME_BUCKETS:
+        if start <= when.hour < end:
+            return day_type(when), name
+    return day_type(when), TIME_BUCKETS[-1][0]
+
+
+def bucket_end(timestamp: Optional[float] = None) -> float:
+    # When the bucket that `timestamp` falls in is over
+    when = datetime.datetime.fromtimestamp(time.time() if timestamp is None else timestamp, LOCAL_TIMEZONE)
+    for _, start, end in TIME_BUCKETS:
+        if start <= when.hour < end:
+            midnight = when.replace(hour=0, minute=0, second=0, microsecond=0)
+            return (midnight + datetime.timedelta(hours=end)).timestamp()
+    return when.timestamp()
+
+
+def parse_bucket_ttls(spec: Optional[Text]) -> Dict[Text, float]:
+    # "am_peak=900,night=21600" overrides single buckets
+    ttls = dict(DEFAULT_BUCKET_TTLS)
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, seconds = item.split("=", 1)
+            if name.strip() not in ttls:
+                raise ValueError(f"Unknown time bucket '{name.strip()}'")
+            ttls[name.strip()] = float(seconds)
+    return ttls
+
+
+class HotPairs:
+    # Counts recent requests per cache key so only pairs people keep asking about
+    # are refreshed ahead of expiry. Bounded; the least recently asked pairs go first.
+    def __init__(self, hits: int = DEFAULT_HOT_HITS, window: float = DEFAULT_HOT_WINDOW, max_pairs: int = MAX_TRACKED_PAIRS) -> None:
+        self.hits = hits
+        self.window = window
+        self.max_pairs = max_pairs
+        self._pairs: "OrderedDict[Text, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, key: Text) -> bool:
+        # Returns whether the pair is hot after counting this request
+        now = time.monotonic()
+        with self._lock:
+            started, count = self._pairs.pop(key, (now, 0))
+            # Check if the counting window for this pair has run out
+            if now - started > self.window:
+                started, count = now, 0
+            count += 1
+            self._pairs[key] = (started, count)
+            while len(self._pairs) > self.max_pairs:
+                self._pairs.popitem(last=False)
+        return count >= self.hits
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+
+class SpeedModel:
+    # Smoothed driving speed per (day type, bucket), learned from the distance and
+    # duration of every directions answer; estimates ETAs when Google is too slow
+    def __init__(self, smoothing: float = SPEED_SMOOTHING) -> None:
+        self.smoothing = smoothing
+        self.speeds: Dict[Tuple[Text, Text], float] = {}
+        self.samples: Dict[Tuple[Text, Text], int] = {}
+        self._lock = threading.Lock()
+
+    def speed(self, bucket: Tuple[Text, Text]) -> float:
+        return self.speeds.get(bucket, DEFAULT_SPEEDS_KMH[bucket[1]])
+
+    def add(self, bucket: Tuple[Text, Text], distance_km: float, duration_seconds: float) -> None:
+        # Check if the answer is too short to say anything about traffic
+        if distance_km <= 0.5 or duration_seconds <= 0:
+            return
+        observed = min(MAX_SPEED_KMH, max(MIN_SPEED_KMH, distance_km / (duration_seconds / 3600.0)))
+        with self._lock:
+            current = self.speeds.get(bucket)
+            self.speeds[bucket] = observed if current is None else current + self.smoothing * (observed - current)
+            self.samples[bucket] = self.samples.get(bucket, 0) + 1
+
+    def estimate_seconds(self, bucket: Tuple[Text, Text], distance_km: float) -> float:
+        return distance_km / self.speed(bucket) * 3600.0
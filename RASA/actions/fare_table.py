@@ -0,0 +1,159 @@
+import math
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Optional, Text, Tuple
+
+import numpy as np
+
+ROUNDING_MODES = ("round", "ceil", "floor", "none")
+INTERPOLATION_MODES = ("nearest", "step", "linear")
+# How far "nearest" may reach for a row before the distance counts as not covered
+NEAREST_MAX_GAP_KM = 1.0
+
+
+class FareTable:
+    # Fare matrix as parallel sorted arrays of distance, regular and discounted fare.
+    # Distances resolve by bisection. "nearest" takes the closest row within 1 km and
+    # has no fare otherwise. "step" and "linear" charge shorter trips the base fare and
+    # add the per-km increment of the last bracket past the last row, the way LTFRB
+    # fare matrices are built (base fare for the first kilometres, then a fixed amount
+    # per succeeding km).
+    def __init__(
+        self,
+        fares: Dict[Any, Dict[Text, float]],
+        rounding: Text = "round",
+        interpolation: Text = "nearest",
+    ) -> None:
+        if rounding not in ROUNDING_MODES:
+            raise ValueError(f"Unknown fare rounding mode '{rounding}'")
+        if interpolation not in INTERPOLATION_MODES:
+            raise ValueError(f"Unknown fare interpolation mode '{interpolation}'")
+        self.rounding = rounding
+        self.interpolation = interpolation
+
+        rows = sorted((float(distance), float(data["regular"]), float(data["discounted"])) for distance, data in fares.items())
+        self._set_columns(
+            np.asarray([row[0] for row in rows], dtype=np.float64),
+            np.asarray([row[1] for row in rows], dtype=np.float64),
+            np.asarray([row[2] for row in rows], dtype=np.float64),
+        )
+
+    def _set_columns(self, distances: np.ndarray, regular: np.ndarray, discounted: np.ndarray) -> None:
+        self.distances = distances
+        self.regular = regular
+        self.discounted = discounted
+        # Plain lists keep single lookups free of NumPy call overhead
+        self._distance_list = self.distances.tolist()
+        self._regular_list = self.regular.tolist()
+        self._discounted_list = self.discounted.tolist()
+
+        # Per-km increment of the last bracket, used beyond the end of the table
+        dists = self._distance_list
+        if len(dists) >= 2 and dists[-1] > dists[-2]:
+            span = dists[-1] - dists[-2]
+            self.regular_increment = (self._regular_list[-1] - self._regular_list[-2]) / span
+            self.discounted_increment = (self._discounted_list[-1] - self._discounted_list[-2]) / span
+        else:
+            self.regular_increment = 0.0
+            self.discounted_increment = 0.0
+
+    def to_arrays(self) -> Dict[Text, np.ndarray]:
+        return {"distances": self.distances, "regular": self.regular, "discounted": self.discounted}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[Text, np.ndarray], rounding: Text = "round", interpolation: Text = "nearest") -> "FareTable":
+        table = cls({}, rounding, interpolation)
+        table._set_columns(arrays["distances"], arrays["regular"], arrays["discounted"])
+        return table
+
+    def __len__(self) -> int:
+        return len(self._distance_list)
+
+    def _round(self, distance: float) -> float:
+        if self.rounding == "round":
+            return float(round(distance))
+        if self.rounding == "ceil":
+            return float(math.ceil(distance))
+        if self.rounding == "floor":
+            return float(math.floor(distance))
+        return float(distance)
+
+    def _round_array(self, distances: np.ndarray) -> np.ndarray:
+        if self.rounding == "round":
+            return np.round(distances)
+        if self.rounding == "ceil":
+            return np.ceil(distances)
+        if self.rounding == "floor":
+            return np.floor(distances)
+        return distances
+
+    def lookup(self, distance: float) -> Optional[Dict[Text, float]]:
+        # Check if the fare matrix has not been loaded
+        if not self._distance_list:
+            return None
+        d = self._round(distance)
+        dists = self._distance_list
+        last = len(dists) - 1
+
+        if self.interpolation == "nearest":
+            i = bisect_left(dists, d)
+            # Nearest row, preferring the shorter distance on ties
+            if i > last or (i > 0 and d - dists[i - 1] <= dists[i] - d):
+                i -= 1
+            # Check if the nearest row is too far away to quote its fare
+            if abs(dists[i] - d) > NEAREST_MAX_GAP_KM:
+                return None
+            return {"regular": self._regular_list[i], "discounted": self._discounted_list[i]}
+
+        # Check if the distance is past the longest distance in the matrix
+        if d > dists[last]:
+            extra = d - dists[last]
+            return {
+                "regular": self._regular_list[last] + extra * self.regular_increment,
+                "discounted": self._discounted_list[last] + extra * self.discounted_increment,
+            }
+        # Shorter trips than the first row still pay the base fare
+        if d <= dists[0]:
+            return {"regular": self._regular_list[0], "discounted": self._discounted_list[0]}
+
+        if self.interpolation == "step":
+            i = bisect_right(dists, d) - 1
+            return {"regular": self._regular_list[i], "discounted": self._discounted_list[i]}
+
+        i = bisect_left(dists, d)
+        if dists[i] == d:
+            return {"regular": self._regular_list[i], "discounted": self._discounted_list[i]}
+        ratio = (d - dists[i - 1]) / (dists[i] - dists[i - 1])
+        return {
+            "regular": self._regular_list[i - 1] + ratio * (self._regular_list[i] - self._regular_list[i - 1]),
+            "discounted": self._discounted_list[i - 1] + ratio * (self._discounted_list[i] - self._discounted_list[i - 1]),
+        }
+
+    def price(self, distances: Any) -> Tuple[np.ndarray, np.ndarray]:
+        # Vectorized lookup(): prices a whole array of distances in one call.
+        # Returns (regular, discounted) arrays; NaN where lookup() has no fare.
+        d = self._round_array(np.asarray(distances, dtype=np.float64))
+        if len(self) == 0:
+            empty = np.full(d.shape, np.nan)
+            return empty, empty.copy()
+        dists = self.distances
+        last = len(dists) - 1
+
+        if self.interpolation == "nearest":
+            i = np.searchsorted(dists, d, side="left")
+            lower = np.clip(i - 1, 0, last)
+            upper = np.clip(i, 0, last)
+            i = np.where(np.abs(d - dists[lower]) <= np.abs(dists[upper] - d), lower, upper)
+            covered = np.abs(dists[i] - d) <= NEAREST_MAX_GAP_KM
+            return np.where(covered, self.regular[i], np.nan), np.where(covered, self.discounted[i], np.nan)
+
+        clipped = np.clip(d, dists[0], dists[last])
+        if self.interpolation == "linear":
+            regular = np.interp(clipped, dists, self.regular)
+            discounted = np.interp(clipped, dists, self.discounted)
+        else:
+            i = np.clip(np.searchsorted(dists, clipped, side="right") - 1, 0, last)
+            regular = self.regular[i]
+            discounted = self.discounted[i]
+
+        extra = np.maximum(d - dists[last], 0.0)
+        return regular + extra * self.regular_increment, discounted + extra * self.discounted_increment
@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Text
+
+from actions.metrics import record_cache
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Precision 7 cells are about 150 m x 150 m, roughly one city block in downtown Legazpi
+DEFAULT_PRECISION = 7
+DEFAULT_TTL = 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def geohash(lat: float, lng: float, precision: int = DEFAULT_PRECISION) -> Text:
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    use_lng = True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value_range = lng_range if use_lng else lat_range
+        value = lng if use_lng else lat
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = (bits << 1) | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+        use_lng = not use_lng
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+class GeoCache:
+    # LRU cache keyed on (geohash cell, query kind) so users standing close together
+    # share one Places/Geocoding answer.
+    def __init__(
+        self,
+        precision: int = DEFAULT_PRECISION,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        name: Text = "geo",
+    ) -> None:
+        self.name = name
+        self.precision = precision
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def key(self, lat: float, lng: float, *kind: Any) -> tuple:
+        return (geohash(lat, lng, self.precision),) + kind
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        # Check if the entry is missing or has expired; expired entries stay until
+        # they fall out of the LRU so get_stale() can still use them
+        if entry is None or entry[0] <= time.time():
+            self.misses += 1
+            record_cache(self.name, False)
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        record_cache(self.name, True)
+        return entry[1]
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        # Drop the least recently used entry once the cache is full
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[Text, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
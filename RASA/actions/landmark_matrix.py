@@ -0,0 +1,179 @@
+import argparse
+import json
+import logging
+import os
+import struct
+import time
+from typing import List, Optional, Sequence, Text, Tuple
+
+import numpy as np
+
+from actions.route_index import normalize_landmark
+
+logger = logging.getLogger(__name__)
+
+# File layout: header, UTF-8 JSON list of landmark names, padding to 8 bytes, then a
+# float32 array of shape (n, n, 2) holding [distance_km, duration_s] per
+# origin/destination pair. NaN marks pairs Google could not route.
+MAGIC = b"LGZM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+# Distance Matrix API limits: 25 origins, 25 destinations, 100 elements per request
+MAX_ELEMENTS_PER_REQUEST = 100
+MAX_PLACES_PER_SIDE = 25
+
+DEFAULT_MATRIX_PATH = os.path.join(os.path.dirname(__file__), "..", ".cache", "landmark_matrix.bin")
+DEFAULT_LOOKUP_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "lookups", "locations.txt")
+
+
+def format_duration(seconds: float) -> Text:
+    # Same wording as the Directions API duration text, e.g. "1 hour 5 mins"
+    minutes = max(1, int(round(seconds / 60.0)))
+    hours, minutes = divmod(minutes, 60)
+    parts = []
+    if hours:
+        parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
+    if minutes:
+        parts.append(f"{minutes} min{'s' if minutes != 1 else ''}")
+    return " ".join(parts)
+
+
+class LandmarkMatrix:
+    def __init__(self, names: Sequence[Text], data: np.ndarray) -> None:
+        self.names = list(names)
+        self.data = data
+        self.index = {normalize_landmark(name): i for i, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def empty(cls) -> "LandmarkMatrix":
+        return cls([], np.zeros((0, 0, 2), dtype=np.float32))
+
+    @classmethod
+    def open(cls, path: Text) -> "LandmarkMatrix":
+        # Check if the matrix has not been built for this deployment
+        if not os.path.exists(path):
+            return cls.empty()
+        try:
+            with open(path, "rb") as f:
+                magic, version, _, count, names_length = struct.unpack(HEADER.format, f.read(HEADER.size))
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"{path} is not a version {VERSION} landmark matrix")
+                names = json.loads(f.read(names_length).decode("utf-8"))
+            offset = _data_offset(names_length)
+            # Memory-mapped so every worker shares the same pages and startup stays instant
+            data = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(count, count, 2))
+        # A truncated or corrupt file must not stop the actions module from importing;
+        # lookups then go to the Maps cache and API as if no matrix had been built
+        except (OSError, ValueError, struct.error) as e:
+            logger.error("Ignoring landmark matrix %s: %s", path, e)
+            return cls.empty()
+        if len(names) != count:
+            logger.error("Ignoring landmark matrix %s: %s names for %s rows", path, len(names), count)
+            return cls.empty()
+        return cls(names, data)
+
+    def write(self, path: Text) -> None:
+        encoded_names = json.dumps(self.names).encode("utf-8")
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(self.names), len(encoded_names)))
+            f.write(encoded_names)
+            f.write(b"\0" * (_data_offset(len(encoded_names)) - HEADER.size - len(encoded_names)))
+            f.write(np.ascontiguousarray(self.data, dtype=np.float32).tobytes())
+        # Replace atomically so running workers never map a half-written file
+        os.replace(tmp_path, path)
+
+    def lookup(self, origin: Text, destination: Text) -> Optional[Tuple[float, float]]:
+        i = self.index.get(normalize_landmark(origin))
+        j = self.index.get(normalize_landmark(destination))
+        # Check if either place is not a known landmark
+        if i is None or j is None:
+            return None
+        distance_km, duration_s = self.data[i, j]
+        if np.isnan(distance_km):
+            return None
+        return float(distance_km), float(duration_s)
+
+
+def _data_offset(names_length: int) -> int:
+    end = HEADER.size + names_length
+    return (end + 7) // 8 * 8
+
+
+def build_matrix(client, names: Sequence[Text], region: Text = "ph", pause: float = 0.0) -> np.ndarray:
+    count = len(names)
+    data = np.full((count, count, 2), np.nan, dtype=np.float32)
+    side = min(MAX_PLACES_PER_SIDE, int(MAX_ELEMENTS_PER_REQUEST ** 0.5))
+    for row in range(0, count, side):
+        for col in range(0, count, side):
+            origins = list(names[row:row + side])
+            destinations = list(names[col:col + side])
+            result = client.distance_matrix(
+                origins=origins,
+                destinations=destinations,
+                mode="driving",
+                units="metric",
+                region=region
+            )
+            for i, result_row in enumerate(result["rows"]):
+                for j, element in enumerate(result_row["elements"]):
+                    # Check if Google found a driving route for this pair
+                    if element.get("status") == "OK":
+                        data[row + i, col + j] = (element["distance"]["value"] / 1000.0, element["duration"]["value"])
+            # Stay under the per-second element quota on large builds
+            if pause:
+                time.sleep(pause)
+    np.fill_diagonal(data[:, :, 0], 0.0)
+    np.fill_diagonal(data[:, :, 1], 0.0)
+    return data
+
+
+def load_landmark_names(lookup_path: Text, include_locations: bool = False) -> List[Text]:
+    names = []
+    with open(lookup_path, encoding="utf-8") as f:
+        names.extend(line.strip() for line in f if line.strip())
+    if include_locations:
+        # Importing the actions module starts loading the Firestore `locations` collection
+        from actions import actions as action_module
+        # Under ACTIONS_AUTOSTART=false nothing has started it yet
+        action_module.WARMUP.start()
+        if not action_module.WARMUP.wait(action_module.WARMUP_WAIT_SECONDS):
+            logger.warning("Locations still loading after %ss; using the places loaded so far", action_module.WARMUP_WAIT_SECONDS)
+        names.extend(location.name for location in action_module.LOCATIONS_CACHE.values())
+
+    unique_names = []
+    seen = set()
+    for name in names:
+        key = normalize_landmark(name)
+        if key not in seen:
+            seen.add(key)
+            unique_names.append(name)
+    return unique_names
+
+
+def main(argv: Optional[List[Text]] = None) -> None:
+    import googlemaps
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Build the landmark-to-landmark distance matrix file.")
+    parser.add_argument("--output", default=os.getenv("LANDMARK_MATRIX_PATH", DEFAULT_MATRIX_PATH))
+    parser.add_argument("--lookup", default=DEFAULT_LOOKUP_PATH)
+    parser.add_argument("--include-locations", action="store_true", help="also include the Firestore locations collection")
+    parser.add_argument("--pause", type=float, default=0.1, help="seconds to wait between requests")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    names = load_landmark_names(args.lookup, args.include_locations)
+    client = googlemaps.Client(key=os.getenv("GOOGLE_MAPS_API_KEY"))
+    data = build_matrix(client, names, pause=args.pause)
+    LandmarkMatrix(names, data).write(args.output)
+    print(f"Wrote {len(names)}x{len(names)} landmark matrix to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import functools
+from typing import Dict, Iterable, List, Optional, Text
+
+import numpy as np
+
+from actions.route_index import normalize_landmark
+from actions.shared_reference import StringTable, csr
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_MAX_CANDIDATES = 8
+DEFAULT_MEMO_SIZE = 4096
+# Trigrams carried by more than this share of all names ("leg", "gaz", "all") say
+# little about which place is meant and make candidate lists long, so they are
+# only used when a query has nothing rarer
+COMMON_GRAM_RATIO = 0.2
+
+
+def trigrams(key: Text) -> List[Text]:
+    padded = f"  {key} "
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def similarity(a: Text, b: Text, floor: float = 0.0) -> float:
+    # 1 - Levenshtein distance / length of the longer string; gives up with 0.0 as
+    # soon as the result can no longer reach `floor`
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    longest = max(len(a), len(b))
+    max_distance = int((1.0 - floor) * longest)
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        # Distances never shrink from one row to the next
+        if min(current) > max_distance:
+            return 0.0
+        previous = current
+    return 1.0 - previous[-1] / longest
+
+
+class LandmarkResolver:
+    # Maps free-text place names to one canonical name per place. The canonical id is
+    # normalize_landmark(name), the same key RouteIndex, LandmarkMatrix and the Maps
+    # cache use, so "SM City Legazpi", "sm legazpi" and "SM Legazpi." share entries.
+    # Exact keys are a dict lookup; anything else goes through a trigram index to a
+    # few candidates, which are accepted only above an edit-distance similarity.
+    # Names earlier in the input win when two of them normalize to the same id.
+    def __init__(
+        self,
+        names: Iterable[Text],
+        threshold: float = DEFAULT_THRESHOLD,
+        max_candidates: int = DEFAULT_MAX_CANDIDATES,
+        memo_size: int = DEFAULT_MEMO_SIZE,
+    ) -> None:
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        canonical: Dict[Text, Text] = {}
+        for name in names:
+            key = normalize_landmark(name)
+            if key and key not in canonical:
+                canonical[key] = str(name).strip()
+        self.ids = {key: place_id for place_id, key in enumerate(canonical)}
+        self.keys = StringTable.from_strings(canonical)
+        self.names = StringTable.from_strings(canonical.values())
+
+        gram_ids: Dict[Text, int] = {}
+        postings: List[List[int]] = []
+        gram_counts = []
+        for place_id, key in enumerate(canonical):
+            grams = trigrams(key)
+            gram_counts.append(len(grams))
+            for gram in grams:
+                gram_id = gram_ids.setdefault(gram, len(gram_ids))
+                if gram_id == len(postings):
+                    postings.append([])
+                postings[gram_id].append(place_id)
+        self.gram_ids = gram_ids
+        self.gram_counts = np.asarray(gram_counts, dtype=np.int32)
+        self.gram_offsets, self.gram_places = csr(postings, dtype=np.int32)
+        self.common_gram_size = max(1, int(len(self) * COMMON_GRAM_RATIO))
+
+        # Users repeat the same few phrasings, so answers are memoized per resolver;
+        # a rebuild starts with an empty memo
+        self.resolve = functools.lru_cache(maxsize=memo_size)(self._resolve)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def canonical_id(self, text: Text) -> Optional[Text]:
+        place_id = self.resolve(text)
+        return None if place_id is None else self.keys[place_id]
+
+    def canonical_name(self, text: Text) -> Optional[Text]:
+        place_id = self.resolve(text)
+        return None if place_id is None else self.names[place_id]
+
+    def _resolve(self, text: Text) -> Optional[int]:
+        key = normalize_landmark(text)
+        if not key:
+            return None
+        place_id = self.ids.get(key)
+        if place_id is not None:
+            return place_id
+        return self._fuzzy(key)
+
+    def _fuzzy(self, key: Text) -> Optional[int]:
+        grams = [self.gram_ids[gram] for gram in trigrams(key) if gram in self.gram_ids]
+        # Check if the text shares no trigram with any known place
+        if not grams:
+            return None
+        spans = [(self.gram_offsets[gram], self.gram_offsets[gram + 1]) for gram in grams]
+        rare = [span for span in spans if span[1] - span[0] <= self.common_gram_size]
+        places = np.concatenate([self.gram_places[start:end] for start, end in (rare or spans)])
+        candidates, shared = np.unique(places, return_counts=True)
+        # Dice coefficient over the trigrams looked at, best first
+        scores = 2.0 * shared / (len(grams) + self.gram_counts[candidates])
+        order = np.argsort(-scores, kind="stable")[:self.max_candidates]
+
+        best_id = None
+        best_score = self.threshold
+        for place_id in candidates[order].tolist():
+            candidate = self.keys[place_id]
+            score = similarity(key, candidate, best_score)
+            if score > best_score or (score == best_score and best_id is None):
+                best_id, best_score = place_id, score
+        return best_id
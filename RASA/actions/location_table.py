@@ -0,0 +1,176 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Text, Tuple
+
+import numpy as np
+
+from actions.route_index import normalize_landmark
+from actions.shared_reference import InternedStrings, StringTable, csr
+
+
+class Location:
+    # Read-only view of one row of a LocationTable; holds no data of its own.
+    # Item access ("name", "coords", ...) mirrors the Firestore document shape.
+    __slots__ = ("table", "id")
+
+    def __init__(self, table: "LocationTable", location_id: int) -> None:
+        self.table = table
+        self.id = location_id
+
+    @property
+    def name(self) -> Text:
+        return self.table.names[self.id]
+
+    @property
+    def description(self) -> Text:
+        return self.table.descriptions[self.id]
+
+    @property
+    def lat(self) -> float:
+        return float(self.table.lats[self.id])
+
+    @property
+    def lon(self) -> float:
+        return float(self.table.lons[self.id])
+
+    @property
+    def coords(self) -> Dict[Text, float]:
+        return {"lat": self.lat, "lon": self.lon}
+
+    @property
+    def tags(self) -> List[Text]:
+        return sorted(self.table.tags_of(self.id))
+
+    def __getitem__(self, field: Text) -> Any:
+        if field not in ("name", "description", "coords", "tags"):
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field: Text, default: Any = None) -> Any:
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> Text:
+        return f"Location({self.id}, {self.name!r})"
+
+
+class LocationTable:
+    # Places stored as columns: float64 coordinates, interned names and descriptions,
+    # and tags as ids into a sorted vocabulary, packed per place and per tag. Rows are
+    # addressed by position, which is also the place id used by SpatialIndex.
+    def __init__(self, locations: Iterable[Dict[Text, Any]]) -> None:
+        names = []
+        descriptions = []
+        place_tags: List[List[Text]] = []
+        lats = []
+        lons = []
+        for location_data in locations:
+            coords = location_data.get("coords") or {}
+            place_lat = coords.get("lat")
+            place_lng = coords.get("lon")
+            # Skip places without usable coordinates
+            if place_lat is None or place_lng is None:
+                continue
+            names.append(location_data["name"])
+            descriptions.append(location_data.get("description", ""))
+            # Tags are lowercased once here instead of on every request
+            place_tags.append(sorted({tag.lower() for tag in location_data.get("tags", [])}))
+            lats.append(float(place_lat))
+            lons.append(float(place_lng))
+        self.names = InternedStrings.from_strings(names)
+        self.descriptions = InternedStrings.from_strings(descriptions)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+
+        self.tag_names: List[Text] = sorted({tag for tags in place_tags for tag in tags})
+        tag_index = {tag: tag_id for tag_id, tag in enumerate(self.tag_names)}
+        self.place_tag_offsets, self.place_tag_ids = csr(
+            ([tag_index[tag] for tag in tags] for tags in place_tags), dtype=np.int32
+        )
+        postings: List[List[int]] = [[] for _ in self.tag_names]
+        for place_id, tags in enumerate(place_tags):
+            for tag in tags:
+                postings[tag_index[tag]].append(place_id)
+        self.tag_offsets, self.tag_place_ids = csr(postings, dtype=np.int32)
+        self._index_tags()
+        self._name_ids: Optional[Dict[Text, int]] = None
+
+    def _index_tags(self) -> None:
+        # Views into the packed postings; the ids themselves are not copied
+        self.tag_ids = {
+            tag: self.tag_place_ids[self.tag_offsets[tag_id]:self.tag_offsets[tag_id + 1]]
+            for tag_id, tag in enumerate(self.tag_names)
+        }
+
+    def to_arrays(self) -> Dict[Text, np.ndarray]:
+        arrays = {
+            "lats": self.lats,
+            "lons": self.lons,
+            "place_tag_offsets": self.place_tag_offsets,
+            "place_tag_ids": self.place_tag_ids,
+            "tag_offsets": self.tag_offsets,
+            "tag_place_ids": self.tag_place_ids,
+        }
+        arrays.update(self.names.to_arrays("names"))
+        arrays.update(self.descriptions.to_arrays("descriptions"))
+        arrays.update(StringTable.from_strings(self.tag_names).to_arrays("tag_names"))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[Text, np.ndarray]) -> "LocationTable":
+        table = cls.__new__(cls)
+        table.names = InternedStrings.from_arrays(arrays, "names")
+        table.descriptions = InternedStrings.from_arrays(arrays, "descriptions")
+        # The vocabulary is small and looked up by value, so it is decoded once
+        table.tag_names = list(StringTable.from_arrays(arrays, "tag_names"))
+        for column in ("lats", "lons", "place_tag_offsets", "place_tag_ids", "tag_offsets", "tag_place_ids"):
+            setattr(table, column, arrays[column])
+        table._index_tags()
+        table._name_ids = None
+        return table
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def __getitem__(self, location_id: int) -> Location:
+        if not 0 <= location_id < len(self):
+            raise KeyError(location_id)
+        return Location(self, location_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def keys(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def values(self) -> Iterator[Location]:
+        return (Location(self, location_id) for location_id in range(len(self)))
+
+    def items(self) -> Iterator[Tuple[int, Location]]:
+        return ((location_id, Location(self, location_id)) for location_id in range(len(self)))
+
+    def find(self, name: Text) -> Optional[int]:
+        # Place id by canonical name; the first place wins when names collide. The
+        # index is built on first use, so processes that never ask pay nothing.
+        if self._name_ids is None:
+            name_ids: Dict[Text, int] = {}
+            for location_id, location_name in enumerate(self.names):
+                name_ids.setdefault(normalize_landmark(location_name), location_id)
+            self._name_ids = name_ids
+        return self._name_ids.get(normalize_landmark(name))
+
+    def tags_of(self, location_id: int) -> frozenset:
+        tag_ids = self.place_tag_ids[self.place_tag_offsets[location_id]:self.place_tag_offsets[location_id + 1]]
+        return frozenset(self.tag_names[tag_id] for tag_id in tag_ids.tolist())
+
+    def ids_with_tags(self, tags: Iterable[Text]) -> np.ndarray:
+        posting_lists = [self.tag_ids[tag.lower()] for tag in tags if tag.lower() in self.tag_ids]
+        if not posting_lists:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(posting_lists)).astype(np.int64)
+
+    def tag_mask(self, tags: Iterable[Text]) -> np.ndarray:
+        # Boolean column: True for places carrying any of the tags
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.ids_with_tags(tags)] = True
+        return mask
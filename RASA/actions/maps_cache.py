@@ -0,0 +1,201 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Text, Tuple
+
+from actions.metrics import record_cache
+
+# Time-to-live (seconds) per result type. Road distances barely change, directions
+# durations drift with traffic, so they expire sooner.
+DEFAULT_TTLS = {
+    "distance": 30 * 24 * 3600,
+    "directions": 24 * 3600,
+}
+# Statuses that mean "Google has no answer for this pair"; cached only briefly so a
+# corrected place name in Google's data is picked up again soon.
+NEGATIVE_STATUSES = ("NOT_FOUND", "ZERO_RESULTS")
+DEFAULT_NEGATIVE_TTL = 10 * 60
+DEFAULT_MAX_ENTRIES = 50000
+# Expired answers are kept this much longer as a last known good value for when
+# Google is failing
+DEFAULT_STALE_TTL = 7 * 24 * 3600
+
+
+def normalize_key(*parts: Any) -> Text:
+    # Case and whitespace differences should not create separate cache entries
+    return "|".join(" ".join(str(part).lower().split()) for part in parts)
+
+
+class MapsCache:
+    def __init__(
+        self,
+        path: Text,
+        ttls: Optional[dict] = None,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        stale_ttl: float = DEFAULT_STALE_TTL,
+    ) -> None:
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        # WAL lets every action-server worker read while another one writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS maps_cache ("
+            " kind TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (kind, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS maps_cache_accessed ON maps_cache (accessed_at)")
+        return conn
+
+    def ttl_for(self, kind: Text, status: Optional[Text] = None) -> float:
+        if status in NEGATIVE_STATUSES:
+            return self.negative_ttl
+        return self.ttls.get(kind, DEFAULT_TTLS["directions"])
+
+    def get(self, kind: Text, key: Text) -> Optional[Any]:
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM maps_cache WHERE kind = ? AND key = ?",
+                    (kind, key),
+                ).fetchone()
+                # Check if the entry is missing or has expired
+                if row is None or row[1] <= now:
+                    record_cache(f"maps_{kind}", False)
+                    return None
+                self._conn.execute(
+                    "UPDATE maps_cache SET accessed_at = ? WHERE kind = ? AND key = ?",
+                    (now, kind, key),
+                )
+            record_cache(f"maps_{kind}", True)
+            return json.loads(row[0])
+        except sqlite3.Error:
+            return None
+
+    def get_stale(self, kind: Text, key: Text) -> Optional[Any]:
+        # Returns the entry even if it has expired, as long as it was not evicted yet
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM maps_cache WHERE kind = ? AND key = ?",
+                    (kind, key),
+                ).fetchone()
+            # Check if the entry is gone or past its stale grace period
+            if row is None or row[1] + self.stale_ttl <= now:
+                return None
+            return json.loads(row[0])
+        except sqlite3.Error:
+            return None
+
+    def expires_at(self, kind: Text, key: Text) -> Optional[float]:
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT expires_at FROM maps_cache WHERE kind = ? AND key = ?",
+                    (kind, key),
+                ).fetchone()
+            return None if row is None else row[0]
+        except sqlite3.Error:
+            return None
+
+    def set(self, kind: Text, key: Text, value: Any, status: Optional[Text] = None, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        # A caller-supplied TTL applies to answers; negative answers always expire quickly
+        if ttl is None or status in NEGATIVE_STATUSES:
+            ttl = self.ttl_for(kind, status)
+        expires_at = now + ttl
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO maps_cache (kind, key, value, expires_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (kind, key, json.dumps(value), expires_at, now),
+                )
+                self._writes_since_evict += 1
+                # Check the table size every so often instead of on each write
+                if self._writes_since_evict >= 100:
+                    self._writes_since_evict = 0
+                    self._evict(now)
+        except sqlite3.Error:
+            pass
+
+    def set_many(self, kind: Text, items: List[Tuple[Text, Any, Optional[Text]]]) -> None:
+        # (key, value, status) for each answer of a multi-element request, in one transaction
+        now = time.time()
+        rows = [(kind, key, json.dumps(value), now + self.ttl_for(kind, status), now) for key, value, status in items]
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO maps_cache (kind, key, value, expires_at, accessed_at)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._conn.execute("COMMIT")
+                except sqlite3.Error:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._writes_since_evict += len(rows)
+                if self._writes_since_evict >= 100:
+                    self._writes_since_evict = 0
+                    self._evict(now)
+        except sqlite3.Error:
+            pass
+
+    def invalidate(self, kind: Text, key: Text) -> None:
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM maps_cache WHERE kind = ? AND key = ?", (kind, key))
+        except sqlite3.Error:
+            pass
+
+    def clear(self) -> None:
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM maps_cache")
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM maps_cache WHERE expires_at <= ?", (now - self.stale_ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM maps_cache").fetchone()[0]
+        # Drop the least recently used entries once the cache grows past its bound
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM maps_cache WHERE rowid IN ("
+                " SELECT rowid FROM maps_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+MAPS_CACHE = MapsCache(
+    path=os.getenv("MAPS_CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", ".cache", "maps_cache.sqlite3")),
+    ttls={
+        "distance": float(os.getenv("MAPS_CACHE_DISTANCE_TTL", DEFAULT_TTLS["distance"])),
+        "directions": float(os.getenv("MAPS_CACHE_DIRECTIONS_TTL", DEFAULT_TTLS["directions"])),
+    },
+    negative_ttl=float(os.getenv("MAPS_CACHE_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL)),
+    max_entries=int(os.getenv("MAPS_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+    stale_ttl=float(os.getenv("MAPS_CACHE_STALE_TTL", DEFAULT_STALE_TTL)),
+)
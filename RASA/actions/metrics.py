@@ -0,0 +1,201 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Text, Tuple
+
+# Minimal Prometheus-format metrics: counters and histograms with labels, rendered in
+# the text exposition format on the status server's /metrics endpoint.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Any) -> Text:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[Text], values: Sequence[Any], extra: Text = "") -> Text:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: Text, documentation: Text, labelnames: Sequence[Text] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0.0)
+
+    def render(self) -> List[Text]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: Text,
+        documentation: Text,
+        labelnames: Sequence[Text] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., sum, count]
+        self._values: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[Text]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        for key, series in items:
+            for i, bound in enumerate(self.buckets):
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {series[i]}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    # Value computed when /metrics is scraped, e.g. cache sizes and hit ratios
+    def __init__(self, name: Text, documentation: Text, labelnames: Sequence[Text], collect: Callable[[], Dict[Tuple, float]]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> List[Text]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+REGISTRY: List[Any] = []
+
+
+def register(metric: Any) -> Any:
+    REGISTRY.append(metric)
+    return metric
+
+
+ACTION_LATENCY = register(Histogram(
+    "legazpin_action_duration_seconds", "Time spent in each custom action's run().", ["action"]
+))
+ACTION_ERRORS = register(Counter(
+    "legazpin_action_errors_total", "Custom action runs that ended in an error reply.", ["action"]
+))
+EXTERNAL_LATENCY = register(Histogram(
+    "legazpin_external_call_duration_seconds", "Latency of Google Maps and Firestore calls.", ["service", "method"]
+))
+EXTERNAL_CALLS = register(Counter(
+    "legazpin_external_calls_total", "Google Maps and Firestore calls by outcome status.", ["service", "method", "status"]
+))
+LOOKUP_RESULTS = register(Counter(
+    "legazpin_lookup_results_total", "Distance/directions lookup results by status (OK, NOT_FOUND, ZERO_RESULTS, ERROR).", ["lookup", "status"]
+))
+STALE_RESPONSES = register(Counter(
+    "legazpin_stale_responses_total", "Answers served from expired cache entries because Google Maps failed.", ["lookup"]
+))
+CACHE_LOOKUPS = register(Counter(
+    "legazpin_cache_lookups_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"]
+))
+
+
+def _hit_ratios() -> Dict[Tuple, float]:
+    totals: Dict[Text, List[float]] = {}
+    for (cache, result), value in list(CACHE_LOOKUPS._values.items()):
+        counts = totals.setdefault(cache, [0.0, 0.0])
+        counts[0 if result == "hit" else 1] += value
+    return {(cache,): hits / (hits + misses) for cache, (hits, misses) in totals.items() if hits + misses}
+
+
+CACHE_HIT_RATIO = register(Gauge(
+    "legazpin_cache_hit_ratio", "Share of cache lookups served from the cache since start.", ["cache"], _hit_ratios
+))
+
+
+def record_cache(cache: Text, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def observe_call(service: Text, method: Text) -> Iterator[Dict[Text, Text]]:
+    # The caller may overwrite outcome["status"]; exceptions are counted as ERROR
+    outcome = {"status": "OK"}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except Exception:
+        if outcome["status"] == "OK":
+            outcome["status"] = "ERROR"
+        raise
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - started, service=service, method=method)
+        EXTERNAL_CALLS.inc(service=service, method=method, status=outcome["status"])
+
+
+def track_action(run: Callable) -> Callable:
+    @functools.wraps(run)
+    async def wrapper(self, dispatcher, tracker, domain):
+        action_name = self.name()
+        started = time.perf_counter()
+        try:
+            return await run(self, dispatcher, tracker, domain)
+        except Exception:
+            ACTION_ERRORS.inc(action=action_name)
+            raise
+        finally:
+            ACTION_LATENCY.observe(time.perf_counter() - started, action=action_name)
+    return wrapper
+
+
+def render_metrics() -> Text:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_response() -> Tuple[int, Text, bytes]:
+    return 200, "text/plain; version=0.0.4; charset=utf-8", render_metrics().encode("utf-8")
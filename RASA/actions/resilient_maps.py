@@ -0,0 +1,230 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Text, Tuple
+
+from googlemaps.exceptions import ApiError, HTTPError, Timeout, TransportError
+
+from actions.metrics import Counter, Gauge, register
+
+# Google statuses that say "try again later" rather than "this request is wrong"
+RETRYABLE_API_STATUSES = ("OVER_QUERY_LIMIT", "UNKNOWN_ERROR")
+DEFAULT_BUDGET_SECONDS = 4.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.1
+DEFAULT_MAX_DELAY = 1.0
+# Attempts with less time than this left are not worth starting
+MIN_ATTEMPT_SECONDS = 0.05
+
+# Absolute deadline (time.monotonic) of the action currently running in this task.
+# asyncio.gather and ensure_future copy the context, so helper tasks share it.
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("maps_deadline", default=None)
+
+MAPS_RETRIES = register(Counter(
+    "legazpin_maps_retries_total", "Google Maps calls retried after a transient error.", ["method"]
+))
+MAPS_REJECTED = register(Counter(
+    "legazpin_maps_rejected_total", "Google Maps calls not made because the budget ran out or the breaker was open.", ["method", "reason"]
+))
+BREAKERS: List["CircuitBreaker"] = []
+register(Gauge(
+    "legazpin_maps_circuit_open", "1 while the Google Maps circuit breaker is open or probing.", ["breaker"],
+    lambda: {(breaker.name,): 0.0 if breaker.state == "closed" else 1.0 for breaker in BREAKERS}
+))
+
+
+class CircuitOpen(TransportError):
+    # A TransportError, so callers that already handle network failures handle this too
+    def __init__(self, name: Text) -> None:
+        super().__init__(f"circuit breaker '{name}' is open")
+
+
+@contextmanager
+def latency_budget(seconds: float) -> Iterator[None]:
+    # A nested budget can only shorten the deadline, never extend it
+    deadline = time.monotonic() + seconds
+    outer = _DEADLINE.get()
+    token = _DEADLINE.set(deadline if outer is None else min(deadline, outer))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def with_latency_budget(seconds: float) -> Callable:
+    # Decorator for Action.run: every Maps call made while the action runs shares one budget
+    def decorator(run: Callable) -> Callable:
+        @functools.wraps(run)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with latency_budget(seconds):
+                return await run(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class CircuitBreaker:
+    # Opens when at least `failure_ratio` of the calls in the last `window` seconds
+    # failed (and there were at least `min_calls`). After `cooldown` seconds one probe
+    # call is let through: success closes the breaker, failure opens it again.
+    def __init__(
+        self,
+        name: Text = "google_maps",
+        failure_ratio: float = 0.5,
+        min_calls: int = 10,
+        window: float = 30.0,
+        cooldown: float = 15.0,
+    ) -> None:
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._outcomes: "deque[Tuple[float, bool]]" = deque()
+        self._probing = False
+        self._lock = threading.Lock()
+        BREAKERS.append(self)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # Check if the cool-down is over and nobody else is probing yet
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = False
+                if ok:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._trip(now)
+                return
+            self._outcomes.append((now, ok))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            # Check if this failure pushes the recent error rate over the limit
+            if ok or len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if failures >= self.failure_ratio * len(self._outcomes):
+                self._trip(now)
+
+    def abandon(self) -> None:
+        # The call never finished (e.g. its task was cancelled). A half-open probe
+        # counts as failed, so the next one is let through after the cool-down
+        # instead of the breaker waiting forever for this one.
+        with self._lock:
+            if self.state == "half_open" and self._probing:
+                self._probing = False
+                self._trip(time.monotonic())
+
+    def _trip(self, now: float) -> None:
+        self.state = "open"
+        self.opened_at = now
+        self._outcomes.clear()
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, ApiError):
+        return error.status in RETRYABLE_API_STATUSES
+    if isinstance(error, HTTPError):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, (Timeout, TransportError, asyncio.TimeoutError))
+
+
+class ResilientMapsClient:
+    # Wraps a Maps client (AsyncMapsClient or a stand-in with the same methods) so
+    # every call respects the caller's latency budget, retries transient errors with
+    # jittered backoff while time is left, and fails fast while the breaker is open.
+    def __init__(
+        self,
+        client: Any,
+        breaker: Optional[CircuitBreaker] = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ) -> None:
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = getattr(client, "timeout", None)
+
+    async def _call(self, method: Text, *args: Any, **kwargs: Any) -> Any:
+        attempt = 0
+        while True:
+            remaining = remaining_budget()
+            # Check if the action has no time left for another request
+            if remaining is not None and remaining < MIN_ATTEMPT_SECONDS:
+                MAPS_REJECTED.inc(method=method, reason="budget")
+                raise Timeout()
+            if not self.breaker.allow():
+                MAPS_REJECTED.inc(method=method, reason="circuit_open")
+                raise CircuitOpen(self.breaker.name)
+
+            timeout = self.timeout
+            if remaining is not None:
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            try:
+                call = getattr(self.client, method)(*args, timeout=timeout, **kwargs)
+                result = await (asyncio.wait_for(call, timeout) if timeout is not None else call)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = Timeout()
+                retryable = is_retryable(e)
+                # A "no such place" answer is a healthy upstream, not a failure
+                self.breaker.record(not retryable)
+                attempt += 1
+                if not retryable or attempt >= self.max_attempts:
+                    raise e
+                # Full jitter: sleep somewhere between 0 and the exponential step
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                remaining = remaining_budget()
+                if remaining is not None and remaining - delay < MIN_ATTEMPT_SECONDS:
+                    raise e
+                MAPS_RETRIES.inc(method=method)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            self.breaker.record(True)
+            return result
+
+    async def distance_matrix(self, origins: Any, destinations: Any, **kwargs: Any) -> Dict[Text, Any]:
+        return await self._call("distance_matrix", origins, destinations, **kwargs)
+
+    async def directions(self, origin: Text, destination: Text, **kwargs: Any) -> list:
+        return await self._call("directions", origin, destination, **kwargs)
+
+    async def places_nearby(self, location: Tuple[float, float], **kwargs: Any) -> Dict[Text, Any]:
+        return await self._call("places_nearby", location, **kwargs)
+
+    async def reverse_geocode(self, latlng: Tuple[float, float], **kwargs: Any) -> list:
+        return await self._call("reverse_geocode", latlng, **kwargs)
+
+    async def close(self) -> None:
+        await self.client.close()
@@ -0,0 +1,216 @@
+import functools
+import heapq
+import math
+import statistics
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Text, Tuple
+
+import numpy as np
+
+from actions.location_table import LocationTable
+from actions.route_index import RouteIndex
+from actions.spatial_index import haversine_np
+
+# Jeepneys drive along roads, so consecutive stops of a route are a known road
+# segment. Every place is also linked to its nearest neighbours, priced higher
+# because the road between them is not known.
+DEFAULT_NEIGHBOURS = 4
+NEIGHBOUR_PENALTY = 1.25
+# Straight hops from an endpoint onto its nearest graph nodes, and the direct hop
+# between the two endpoints when no path through the graph is shorter
+ACCESS_NODES = 3
+ACCESS_PENALTY = 1.3
+# ALT: exact graph distances from a few far-apart nodes give a much tighter A*
+# lower bound than the straight line does
+DEFAULT_LANDMARKS = 8
+DEFAULT_MEMO_SIZE = 4096
+# Road distance over graph distance before anything is calibrated
+DEFAULT_DETOUR = 1.2
+MIN_DETOUR = 1.0
+MAX_DETOUR = 2.5
+DEFAULT_CALIBRATION_SAMPLES = 500
+# Short hops are dominated by where Google puts the pin, not by the roads
+MIN_CALIBRATION_KM = 0.3
+
+
+class RoadGraph:
+    # Compact road graph of Legazpi: nodes are route landmarks with coordinates,
+    # edges are packed per node into (offsets, targets, weights) columns, and all
+    # weights are at least the great-circle distance between their ends, so the
+    # straight line stays an admissible A* heuristic. Built once per load and never
+    # mutated. path_km() is the graph distance; multiply by a DetourCalibration
+    # factor for an estimate of the driving distance.
+    def __init__(
+        self,
+        lats: Sequence[float],
+        lons: Sequence[float],
+        segments: Iterable[Tuple[int, int]],
+        neighbours: int = DEFAULT_NEIGHBOURS,
+        landmarks: int = DEFAULT_LANDMARKS,
+        memo_size: int = DEFAULT_MEMO_SIZE,
+    ) -> None:
+        self.names: List[Text] = []
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        count = len(self.lats)
+
+        edges: Dict[Tuple[int, int], float] = {}
+        def add_edge(a: int, b: int, weight: float) -> None:
+            key = (a, b) if a < b else (b, a)
+            if a != b and weight < edges.get(key, math.inf):
+                edges[key] = weight
+
+        for a, b in segments:
+            add_edge(a, b, float(haversine_np(self.lats[a], self.lons[a], self.lats[b:b + 1], self.lons[b:b + 1])[0]))
+        nearest = min(neighbours, count - 1)
+        for node in range(count if nearest > 0 else 0):
+            distances = haversine_np(self.lats[node], self.lons[node], self.lats, self.lons)
+            distances[node] = math.inf
+            for other in np.argpartition(distances, nearest - 1)[:nearest].tolist():
+                add_edge(node, other, float(distances[other]) * NEIGHBOUR_PENALTY)
+
+        adjacency: List[List[Tuple[int, float]]] = [[] for _ in range(count)]
+        for (a, b), weight in edges.items():
+            adjacency[a].append((b, weight))
+            adjacency[b].append((a, weight))
+        self.offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum([len(items) for items in adjacency], out=self.offsets[1:])
+        self.targets = np.asarray([target for items in adjacency for target, _ in items], dtype=np.int32)
+        self.weights = np.asarray([weight for items in adjacency for _, weight in items], dtype=np.float64)
+        # The search loop is plain Python, which indexes lists much faster than arrays
+        self._offsets = self.offsets.tolist()
+        self._targets = self.targets.tolist()
+        self._weights = self.weights.tolist()
+
+        self.landmark_ids, self.landmark_distances = self._select_landmarks(min(landmarks, count))
+        self.path_km = functools.lru_cache(maxsize=memo_size)(self._path_km)
+
+    @classmethod
+    def build(cls, locations: LocationTable, routes: RouteIndex, **kwargs) -> "RoadGraph":
+        stop_places = [locations.find(name) for name in routes.stop_names]
+        node_ids: Dict[int, int] = {}
+        segments = []
+        for route_id in range(len(routes)):
+            previous = None
+            for stop in routes.stop_ids[routes.stop_offsets[route_id]:routes.stop_offsets[route_id + 1]].tolist():
+                place = stop_places[stop]
+                # Stops without coordinates are skipped; the stops on either side stay linked
+                if place is None:
+                    continue
+                node = node_ids.setdefault(place, len(node_ids))
+                if previous is not None:
+                    segments.append((previous, node))
+                previous = node
+        places = np.asarray(list(node_ids), dtype=np.int64)
+        graph = cls(locations.lats[places], locations.lons[places], segments, **kwargs)
+        graph.names = [locations.names[place] for place in places.tolist()]
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def _dijkstra(self, source: int) -> np.ndarray:
+        distances = [math.inf] * len(self)
+        distances[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            for edge in range(self._offsets[node], self._offsets[node + 1]):
+                target = self._targets[edge]
+                candidate = distance + self._weights[edge]
+                if candidate < distances[target]:
+                    distances[target] = candidate
+                    heapq.heappush(heap, (candidate, target))
+        return np.asarray(distances, dtype=np.float64)
+
+    def _select_landmarks(self, count: int) -> Tuple[List[int], np.ndarray]:
+        # Farthest-first: each landmark is the node farthest from those already chosen
+        if count == 0:
+            return [], np.empty((0, len(self)), dtype=np.float64)
+        rows = []
+        chosen: List[int] = []
+        closest = self._dijkstra(0)
+        for _ in range(count):
+            reachable = np.where(np.isfinite(closest), closest, -1.0)
+            node = int(np.argmax(reachable))
+            if node in chosen:
+                break
+            chosen.append(node)
+            rows.append(self._dijkstra(node))
+            closest = np.minimum(closest, rows[-1]) if len(chosen) > 1 else rows[-1]
+        return chosen, np.vstack(rows)
+
+    def _nearest(self, distances: np.ndarray) -> List[int]:
+        count = min(ACCESS_NODES, len(self))
+        return np.argpartition(distances, count - 1)[:count].tolist()
+
+    def _path_km(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> float:
+        direct = float(haversine_np(origin[0], origin[1], np.asarray([destination[0]]), np.asarray([destination[1]]))[0])
+        best = direct * ACCESS_PENALTY
+        # Check if there is no graph to route through
+        if len(self) == 0:
+            return best
+        from_origin = haversine_np(origin[0], origin[1], self.lats, self.lons)
+        to_destination = haversine_np(destination[0], destination[1], self.lats, self.lons)
+        exits = {node: float(to_destination[node]) * ACCESS_PENALTY for node in self._nearest(to_destination)}
+
+        # Lower bound on the remaining distance from every node: the straight line to
+        # the destination, or the ALT bound to the nearest exit plus the hop off it
+        bound = to_destination
+        if len(self.landmark_ids):
+            via_exits = [
+                np.nan_to_num(
+                    np.fmax.reduce(np.abs(self.landmark_distances[:, [node]] - self.landmark_distances), axis=0),
+                    nan=0.0, posinf=math.inf
+                ) + hop
+                for node, hop in exits.items()
+            ]
+            bound = np.maximum(bound, np.min(via_exits, axis=0))
+        heuristic = bound.tolist()
+
+        settled: Dict[int, float] = {}
+        heap = []
+        for node in self._nearest(from_origin):
+            hop = float(from_origin[node]) * ACCESS_PENALTY
+            settled[node] = hop
+            heapq.heappush(heap, (hop + heuristic[node], hop, node))
+        while heap:
+            estimate, distance, node = heapq.heappop(heap)
+            # Nothing left on the heap can beat the best complete path
+            if estimate >= best:
+                break
+            if distance > settled[node]:
+                continue
+            if node in exits:
+                best = min(best, distance + exits[node])
+            for edge in range(self._offsets[node], self._offsets[node + 1]):
+                target = self._targets[edge]
+                candidate = distance + self._weights[edge]
+                if candidate < settled.get(target, math.inf):
+                    settled[target] = candidate
+                    heapq.heappush(heap, (candidate + heuristic[target], candidate, target))
+        return best
+
+
+class DetourCalibration:
+    # Ratio of Google's driving distance to the graph distance, as the median of the
+    # most recent samples. Kept apart from RoadGraph so it survives rebuilds.
+    def __init__(self, default: float = DEFAULT_DETOUR, samples: int = DEFAULT_CALIBRATION_SAMPLES) -> None:
+        self.default = default
+        self.samples: "deque[float]" = deque(maxlen=samples)
+        self.factor = default
+        self._lock = threading.Lock()
+
+    def add(self, graph_km: float, road_km: float) -> None:
+        # Check if the pair is too close to say anything about the roads
+        if graph_km < MIN_CALIBRATION_KM or road_km <= 0:
+            return
+        with self._lock:
+            self.samples.append(road_km / graph_km)
+            self.factor = min(MAX_DETOUR, max(MIN_DETOUR, statistics.median(self.samples)))
+
+    def __len__(self) -> int:
+        return len(self.samples)
@@ -0,0 +1,114 @@
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Text, Tuple
+
+import numpy as np
+
+from actions.shared_reference import StringTable, csr
+
+
+# Words people add or leave out without meaning another place ("SM City Legazpi")
+FILLER_WORDS = frozenset({"the", "city"})
+
+
+def normalize_landmark(name: Text) -> Text:
+    # Canonical place key: case, accents ("Bañag"), apostrophes, punctuation and
+    # filler words do not tell two places apart
+    text = unicodedata.normalize("NFKD", str(name).lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    tokens = re.findall(r"\w+", text.replace("'", "").replace("\u2019", ""))
+    kept = [token for token in tokens if token not in FILLER_WORDS]
+    return " ".join(kept or tokens)
+
+
+class RouteIndex:
+    # Inverted index from normalized landmark to (route id, position) postings.
+    # Built once per load and never mutated, so readers can use it without locking.
+    # Stops and postings are packed into integer columns so the index can be shared
+    # between processes through memory-mapped files.
+    def __init__(self, routes: Iterable[Dict[Text, Any]]) -> None:
+        self.route_names: Any = []
+        stop_names: Dict[Text, int] = {}
+        route_stops: List[List[int]] = []
+        postings: Dict[Text, List[Tuple[int, int]]] = {}
+        for route_data in routes:
+            route_id = len(self.route_names)
+            landmarks = route_data.get("landmarks", []) or []
+            self.route_names.append(route_data["name"])
+            route_stops.append([stop_names.setdefault(landmark, len(stop_names)) for landmark in landmarks])
+            seen = set()
+            for position, landmark in enumerate(landmarks):
+                key = normalize_landmark(landmark)
+                # Only the first stop at a landmark matters for ordering
+                if key in seen:
+                    continue
+                seen.add(key)
+                postings.setdefault(key, []).append((route_id, position))
+
+        self.stop_names: Any = list(stop_names)
+        self.stop_offsets, self.stop_ids = csr(route_stops)
+        self.posting_keys: Any = sorted(postings)
+        self.posting_offsets, self.posting_routes = csr(
+            [route_id for route_id, _ in postings[key]] for key in self.posting_keys
+        )
+        _, self.posting_positions = csr([position for _, position in postings[key]] for key in self.posting_keys)
+        self._index_postings()
+
+    def _index_postings(self) -> None:
+        self.postings = {
+            key: (int(self.posting_offsets[i]), int(self.posting_offsets[i + 1]))
+            for i, key in enumerate(self.posting_keys)
+        }
+
+    def to_arrays(self) -> Dict[Text, np.ndarray]:
+        arrays = {
+            "stop_offsets": self.stop_offsets,
+            "stop_ids": self.stop_ids,
+            "posting_offsets": self.posting_offsets,
+            "posting_routes": self.posting_routes,
+            "posting_positions": self.posting_positions,
+        }
+        arrays.update(StringTable.from_strings(self.route_names).to_arrays("route_names"))
+        arrays.update(StringTable.from_strings(self.stop_names).to_arrays("stop_names"))
+        arrays.update(StringTable.from_strings(self.posting_keys).to_arrays("posting_keys"))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[Text, np.ndarray]) -> "RouteIndex":
+        index = cls.__new__(cls)
+        index.route_names = StringTable.from_arrays(arrays, "route_names")
+        index.stop_names = StringTable.from_arrays(arrays, "stop_names")
+        index.posting_keys = list(StringTable.from_arrays(arrays, "posting_keys"))
+        for column in ("stop_offsets", "stop_ids", "posting_offsets", "posting_routes", "posting_positions"):
+            setattr(index, column, arrays[column])
+        index._index_postings()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.route_names)
+
+    def landmarks_of(self, route_id: int) -> List[Text]:
+        stop_ids = self.stop_ids[self.stop_offsets[route_id]:self.stop_offsets[route_id + 1]]
+        return [self.stop_names[stop_id] for stop_id in stop_ids.tolist()]
+
+    def find_routes(self, origin: Text, destination: Text) -> List[Text]:
+        origin_span = self.postings.get(normalize_landmark(origin))
+        destination_span = self.postings.get(normalize_landmark(destination))
+        # Check if either landmark is not served by any route
+        if origin_span is None or destination_span is None:
+            return []
+
+        # Posting lists are sorted by route id with one entry per route, so the routes
+        # serving both landmarks come out of one sorted intersection
+        common, origin_at, destination_at = np.intersect1d(
+            self.posting_routes[origin_span[0]:origin_span[1]],
+            self.posting_routes[destination_span[0]:destination_span[1]],
+            assume_unique=True,
+            return_indices=True,
+        )
+        # Check if the route reaches the origin before the destination
+        forward = (
+            self.posting_positions[origin_span[0]:origin_span[1]][origin_at]
+            < self.posting_positions[destination_span[0]:destination_span[1]][destination_at]
+        )
+        return [self.route_names[route_id] for route_id in common[forward].tolist()]
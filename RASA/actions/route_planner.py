@@ -0,0 +1,353 @@
+import functools
+import math
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+import numpy as np
+
+from actions.fare_table import FareTable
+from actions.location_table import LocationTable
+from actions.route_index import RouteIndex, normalize_landmark
+from actions.spatial_index import haversine_np
+
+# Landmarks this close are one walk apart, both for changing jeepneys and for
+# getting on or off near a place no route passes
+DEFAULT_TRANSFER_RADIUS_KM = 0.3
+DEFAULT_MAX_TRANSFERS = 2
+DEFAULT_LIMIT = 3
+# Labels kept per landmark; a few more than the answers asked for, so the
+# cheapest itinerary does not crowd out every alternative
+BAG_EXTRA = 2
+DEFAULT_MEMO_SIZE = 1024
+WALK = -1
+
+
+class Label:
+    # One way of reaching a landmark: total regular fare, distance and rides so far,
+    # plus the step that got here (a ride on `route`, or a walk when route is WALK)
+    __slots__ = ("cost", "km", "rides", "parent", "route", "board", "alight")
+
+    def __init__(self, cost: float, km: float, rides: int, parent: Optional["Label"], route: int, board: int, alight: int) -> None:
+        self.cost = cost
+        self.km = km
+        self.rides = rides
+        self.parent = parent
+        self.route = route
+        self.board = board
+        self.alight = alight
+
+    def last_route(self) -> int:
+        label = self
+        while label is not None and label.route == WALK:
+            label = label.parent
+        return WALK if label is None else label.route
+
+
+class RoutePlanner:
+    # Jeepney routes compiled once into RAPTOR-style lists: the landmark sequence and
+    # cumulative kilometres of every route, the (route, position) pairs serving every
+    # landmark, and walking transfers between landmarks close to each other. Round k
+    # of plan() extends the itineraries of round k - 1 by one more ride, pricing each
+    # ride on its own through the fare table, so a transfer costs a new base fare.
+    # Built once per load of routes and locations; fare updates swap the fare table
+    # in place through use_fares().
+    def __init__(
+        self,
+        routes: RouteIndex,
+        locations: LocationTable,
+        detour: float = 1.0,
+        transfer_radius_km: float = DEFAULT_TRANSFER_RADIUS_KM,
+        memo_size: int = DEFAULT_MEMO_SIZE,
+        fare_table: Optional[FareTable] = None,
+    ) -> None:
+        self.fare_table = fare_table if fare_table is not None else FareTable({})
+        self._fares_version = 0
+        self.route_names = routes.route_names
+        self.locations = locations
+        self.transfer_radius_km = transfer_radius_km
+        self.stop_ids: Dict[Text, int] = {}
+        self.stop_names: List[Text] = []
+        coords: List[Optional[Tuple[float, float]]] = []
+        stop_places = []
+        for name in routes.stop_names:
+            key = normalize_landmark(name)
+            if key not in self.stop_ids:
+                self.stop_ids[key] = len(self.stop_names)
+                self.stop_names.append(name)
+                location_id = locations.find(name)
+                coords.append(None if location_id is None else (float(locations.lats[location_id]), float(locations.lons[location_id])))
+            stop_places.append(self.stop_ids[key])
+
+        self.route_stops: List[List[int]] = []
+        self.route_km: List[List[float]] = []
+        self.stop_routes: List[List[Tuple[int, int]]] = [[] for _ in self.stop_names]
+        for route_id in range(len(routes)):
+            stops = []
+            for stop in routes.stop_ids[routes.stop_offsets[route_id]:routes.stop_offsets[route_id + 1]].tolist():
+                # Repeated names in a row are one stop
+                if not stops or stops[-1] != stop_places[stop]:
+                    stops.append(stop_places[stop])
+            cumulative = []
+            total = 0.0
+            last = None
+            for position, stop in enumerate(stops):
+                self.stop_routes[stop].append((route_id, position))
+                # Stops without coordinates add no distance; the next known stop makes up for it
+                if coords[stop] is not None:
+                    if last is not None:
+                        total += _km(last, coords[stop]) * detour
+                    last = coords[stop]
+                cumulative.append(total)
+            self.route_stops.append(stops)
+            self.route_km.append(cumulative)
+
+        placed = [stop for stop, point in enumerate(coords) if point is not None]
+        self.lats = np.asarray([coords[stop][0] for stop in placed], dtype=np.float64)
+        self.lons = np.asarray([coords[stop][1] for stop in placed], dtype=np.float64)
+        self.placed = np.asarray(placed, dtype=np.int64)
+        self.footpaths: List[List[Tuple[int, float]]] = [[] for _ in self.stop_names]
+        for stop in placed:
+            for other, walk_km in self._within(coords[stop]):
+                if other != stop:
+                    self.footpaths[stop].append((other, walk_km))
+        # Itineraries are memoized per build and fare table; callers must not modify them
+        self._memo = functools.lru_cache(maxsize=memo_size)(self._plan)
+
+    def __len__(self) -> int:
+        return len(self.stop_names)
+
+    def use_fares(self, fare_table: FareTable) -> None:
+        # The memo is keyed on a version number rather than the table, so it holds no
+        # reference to replaced tables; a search still running on the old table stores
+        # its answer under the old version, where no caller looks it up again
+        self.fare_table = fare_table
+        self._fares_version += 1
+        self._memo.cache_clear()
+
+    def plan(
+        self,
+        origin: Text,
+        destination: Text,
+        max_transfers: int = DEFAULT_MAX_TRANSFERS,
+        limit: int = DEFAULT_LIMIT,
+    ) -> List[Dict[Text, Any]]:
+        return self._memo(origin, destination, self._fares_version, max_transfers, limit)
+
+    def _within(self, point: Tuple[float, float]) -> List[Tuple[int, float]]:
+        if not len(self.placed):
+            return []
+        distances = haversine_np(point[0], point[1], self.lats, self.lons)
+        close = np.flatnonzero(distances <= self.transfer_radius_km)
+        return list(zip(self.placed[close].tolist(), distances[close].tolist()))
+
+    def _access(self, place: Text) -> Dict[int, float]:
+        # Landmarks a traveller can start or end a ride at: the place itself when a
+        # route stops there, otherwise the route landmarks within walking distance
+        stop = self.stop_ids.get(normalize_landmark(place))
+        if stop is not None:
+            return {stop: 0.0}
+        location_id = self.locations.find(place)
+        if location_id is None:
+            return {}
+        return dict(self._within((float(self.locations.lats[location_id]), float(self.locations.lons[location_id]))))
+
+    def _walk_in(self, stops: set) -> set:
+        # The stops plus every landmark one walk away from them
+        reached = set(stops)
+        for stop in stops:
+            reached.update(other for other, _ in self.footpaths[stop])
+        return reached
+
+    def _finishing(self, targets: Dict[int, float], max_rides: int) -> List[set]:
+        # finishing[k]: landmarks from which the destination is at most k rides away.
+        # Used to drop arrivals that cannot finish in the rides left.
+        levels = [set(targets)]
+        for rides in range(1, max_rides + 1):
+            goal = set(targets) if rides == 1 else self._walk_in(levels[-1])
+            level = set(levels[-1])
+            for stops in self.route_stops:
+                # Everything before the last stop of this route that leads on
+                for position in range(len(stops) - 1, 0, -1):
+                    if stops[position] in goal:
+                        level.update(stops[:position])
+                        break
+            levels.append(level)
+        return levels
+
+    def _plan(self, origin: Text, destination: Text, fares_version: int, max_transfers: int, limit: int) -> List[Dict[Text, Any]]:
+        fare_table = self.fare_table
+        sources = self._access(origin)
+        targets = self._access(destination)
+        # Check if either place is too far from every route
+        if not sources or not targets:
+            return []
+        max_rides = max_transfers + 1
+        finishing = self._finishing(targets, max_rides)
+        bag_size = limit + BAG_EXTRA
+        # Fares are looked up per 100 m; rides in one query repeat the same few distances
+        fares: Dict[int, float] = {}
+        def leg_fare(km: float) -> float:
+            tenths = int(km * 10 + 0.5)
+            if tenths not in fares:
+                fare = fare_table.lookup(tenths / 10)
+                fares[tenths] = fare["regular"] if fare else 0.0
+            return fares[tenths]
+        # Every further ride costs at least the base fare
+        base_fare = leg_fare(0.0)
+
+        bags: Dict[int, List[Label]] = {}
+        marked: Dict[int, List[Label]] = {}
+        for stop, walk_km in sources.items():
+            label = Label(0.0, walk_km, 0, None, WALK, WALK, stop)
+            bags[stop] = [label]
+            marked[stop] = [label]
+
+        found: Dict[Tuple[int, ...], Tuple[float, float, Label, float]] = {}
+        for rides in range(1, max_rides + 1):
+            # Answers with fewer rides rank first, so once there are enough of them
+            # a further round cannot change the list
+            if len(found) >= limit:
+                break
+            bound = _bound(found, limit)
+            can_ride_on = finishing[max_rides - rides]
+            can_walk_on = self._walk_in(can_ride_on) if rides < max_rides else set(targets)
+            boardings: Dict[int, Dict[int, Label]] = {}
+            for stop, labels in marked.items():
+                # Check if another ride could still beat the answers found so far
+                ranked = sorted((label for label in labels if label.cost + base_fare <= bound), key=lambda label: (label.cost, label.km))
+                if not ranked:
+                    continue
+                # The cheapest label boards every route here except the one it rode in
+                # on; the cheapest label that came another way boards that one
+                cheapest = ranked[0]
+                cheapest_route = cheapest.last_route()
+                runner_up = next((label for label in ranked[1:] if label.last_route() != cheapest_route), None)
+                for route_id, position in self.stop_routes[stop]:
+                    label = cheapest if route_id != cheapest_route else runner_up
+                    if label is None:
+                        continue
+                    board = boardings.setdefault(route_id, {})
+                    if position not in board or label.cost < board[position].cost:
+                        board[position] = label
+
+            next_marked: Dict[int, List[Label]] = {}
+            for route_id, board in boardings.items():
+                stops = self.route_stops[route_id]
+                cumulative = self.route_km[route_id]
+                # One pass along the route. Fares grow with distance, so boarding later
+                # for no more money beats boarding earlier; the active boardings are
+                # kept with positions rising and costs strictly falling.
+                active: List[Tuple[int, Label]] = []
+                for position in range(min(board), len(stops)):
+                    # Check if the traveller could still reach the destination from here
+                    if active and stops[position] in can_walk_on:
+                        best = None
+                        for at, boarded in active:
+                            cost = boarded.cost + leg_fare(cumulative[position] - cumulative[at])
+                            if best is None or cost < best[0]:
+                                best = (cost, at, boarded)
+                        cost, at, boarded = best
+                        if cost <= bound:
+                            ride_km = cumulative[position] - cumulative[at]
+                            arrival = Label(cost, boarded.km + ride_km, rides, boarded, route_id, stops[at], stops[position])
+                            if _insert(bags, stops[position], arrival, bag_size):
+                                next_marked.setdefault(stops[position], []).append(arrival)
+                    label = board.get(position)
+                    if label is not None:
+                        active = [(at, boarded) for at, boarded in active if boarded.cost < label.cost]
+                        active.append((position, label))
+
+            # One walk between nearby landmarks after each ride
+            for stop, labels in list(next_marked.items()):
+                for other, walk_km in self.footpaths[stop]:
+                    if other not in can_ride_on or rides == max_rides:
+                        continue
+                    for label in labels:
+                        if label.route == WALK:
+                            continue
+                        walked = Label(label.cost, label.km + walk_km, label.rides, label, WALK, stop, other)
+                        if _insert(bags, other, walked, bag_size):
+                            next_marked.setdefault(other, []).append(walked)
+
+            for stop, walk_km in targets.items():
+                for label in next_marked.get(stop, []):
+                    if label.route == WALK:
+                        continue
+                    signature = _signature(label)
+                    # Keep the cheapest way of riding the same sequence of routes
+                    if signature not in found or (label.cost, label.km) < found[signature][:2]:
+                        found[signature] = (label.cost, label.km + walk_km, label, walk_km)
+            marked = next_marked
+            if not marked:
+                break
+
+        ranked = sorted(found.values(), key=lambda item: (item[2].rides, item[0], item[1]))[:limit]
+        return [self._itinerary(label, walk_km, origin, destination, fare_table) for _, _, label, walk_km in ranked]
+
+    def _itinerary(self, label: Label, exit_km: float, origin: Text, destination: Text, fare_table: FareTable) -> Dict[Text, Any]:
+        legs = []
+        if exit_km > 0:
+            legs.append({"route": None, "from": self.stop_names[label.alight], "to": destination, "km": exit_km})
+        while label is not None:
+            if label.route == WALK:
+                # The first label is where the traveller starts: at a stop, or a walk away from one
+                if label.parent is None:
+                    if label.km > 0:
+                        legs.append({"route": None, "from": origin, "to": self.stop_names[label.alight], "km": label.km})
+                else:
+                    legs.append({"route": None, "from": self.stop_names[label.board], "to": self.stop_names[label.alight], "km": label.km - label.parent.km})
+            else:
+                ride_km = label.km - label.parent.km
+                fare = fare_table.lookup(int(ride_km * 10 + 0.5) / 10) or {}
+                legs.append({
+                    "route": self.route_names[label.route],
+                    "from": self.stop_names[label.board],
+                    "to": self.stop_names[label.alight],
+                    "km": ride_km,
+                    "regular": fare.get("regular"),
+                    "discounted": fare.get("discounted"),
+                })
+            label = label.parent
+        legs.reverse()
+        rides = [leg for leg in legs if leg["route"] is not None]
+        return {
+            "legs": legs,
+            "transfers": len(rides) - 1,
+            "km": sum(leg["km"] for leg in rides),
+            "regular": sum(leg["regular"] or 0.0 for leg in rides),
+            "discounted": sum(leg["discounted"] or 0.0 for leg in rides),
+        }
+
+
+def _km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    return float(haversine_np(a[0], a[1], np.asarray([b[0]]), np.asarray([b[1]]))[0])
+
+
+def _insert(bags: Dict[int, List[Label]], stop: int, label: Label, size: int) -> bool:
+    bag = bags.setdefault(stop, [])
+    for kept in bag:
+        # Check if an itinerary with no more rides is already as cheap and as short
+        if kept.rides <= label.rides and kept.cost <= label.cost and kept.km <= label.km:
+            return False
+    if len(bag) >= size:
+        if label.cost >= bag[-1].cost:
+            return False
+        bag.pop()
+    bag.append(label)
+    bag.sort(key=lambda kept: (kept.cost, kept.km))
+    return True
+
+
+def _signature(label: Label) -> Tuple[int, ...]:
+    routes = []
+    while label is not None:
+        if label.route != WALK:
+            routes.append(label.route)
+        label = label.parent
+    return tuple(reversed(routes))
+
+
+def _bound(found: Dict[Tuple[int, ...], Tuple[float, float, Label, float]], limit: int) -> float:
+    # Cost an itinerary must stay under to make the answer list
+    if len(found) < limit:
+        return math.inf
+    return sorted(cost for cost, _, _, _ in found.values())[limit - 1]
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Text, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Reference data shared between action-server processes. One process (the leader)
+# loads Firestore and publishes each derived structure as a directory of .npy
+# column files; every other process memory-maps those files read-only, so the data
+# lives once in the page cache no matter how many workers attach to it.
+#
+#   <shared dir>/manifest.json          {"fares": {"generation": 3, "path": "fares-3", "meta": {...}}, ...}
+#   <shared dir>/fares-3/<column>.npy
+#   <shared dir>/.leader                flock'ed by the leader for as long as it runs
+MANIFEST_NAME = "manifest.json"
+LEADER_LOCK_NAME = ".leader"
+DEFAULT_POLL_SECONDS = 5.0
+
+
+class StringTable:
+    # Strings packed into one UTF-8 buffer plus an offsets array, so a column of
+    # names can be memory-mapped instead of living as Python objects in every process
+    def __init__(self, data: np.ndarray, offsets: np.ndarray) -> None:
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[Text]) -> "StringTable":
+        encoded = [str(string).encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(item) for item in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> Text:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[Text]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_arrays(self, prefix: Text) -> Dict[Text, np.ndarray]:
+        return {f"{prefix}_data": self.data, f"{prefix}_offsets": self.offsets}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[Text, np.ndarray], prefix: Text) -> "StringTable":
+        return cls(arrays[f"{prefix}_data"], arrays[f"{prefix}_offsets"])
+
+
+class InternedStrings:
+    # A string column where every distinct value is stored once: a table of unique
+    # strings plus one small integer per row
+    def __init__(self, table: Any, ids: np.ndarray) -> None:
+        self.table = table
+        self.ids = ids
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[Text]) -> "InternedStrings":
+        unique: Dict[Text, int] = {}
+        ids = [unique.setdefault(string, len(unique)) for string in strings]
+        return cls(StringTable.from_strings(unique), np.asarray(ids, dtype=np.int32))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> Text:
+        return self.table[self.ids[index]]
+
+    def __iter__(self) -> Iterator[Text]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_arrays(self, prefix: Text) -> Dict[Text, np.ndarray]:
+        arrays = self.table.to_arrays(f"{prefix}_table")
+        arrays[f"{prefix}_ids"] = self.ids
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[Text, np.ndarray], prefix: Text) -> "InternedStrings":
+        return cls(StringTable.from_arrays(arrays, f"{prefix}_table"), arrays[f"{prefix}_ids"])
+
+
+def csr(groups: Iterable[Iterable[int]], dtype: Any = np.int64) -> Tuple[np.ndarray, np.ndarray]:
+    # Packs variable-length integer lists into (offsets, values); group i is values[offsets[i]:offsets[i + 1]]
+    lengths = []
+    values: List[int] = []
+    for group in groups:
+        group = list(group)
+        lengths.append(len(group))
+        values.extend(group)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets, np.asarray(values, dtype=dtype)
+
+
+class SharedReference:
+    def __init__(self, directory: Text, poll_seconds: float = DEFAULT_POLL_SECONDS) -> None:
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self._leader_pid: Optional[int] = None
+        self._lock_file = None
+        # Change listeners for different collections publish from different threads
+        self._publish_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def is_leader(self) -> bool:
+        # A forked worker inherits the lock file but is not the process that loads
+        return self._leader_pid == os.getpid()
+
+    def claim(self) -> bool:
+        if self._leader_pid is not None:
+            return self.is_leader
+        # Without flock every process loads for itself, as in single-process mode
+        if fcntl is None:
+            logger.warning("Shared reference data needs fcntl; loading in this process")
+            self._leader_pid = os.getpid()
+            return True
+        lock_file = open(os.path.join(self.directory, LEADER_LOCK_NAME), "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            self._leader_pid = -1
+            return False
+        self._lock_file = lock_file
+        self._leader_pid = os.getpid()
+        return True
+
+    def read_manifest(self) -> Dict[Text, Any]:
+        try:
+            with open(os.path.join(self.directory, MANIFEST_NAME), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def generation(self, name: Text) -> Optional[int]:
+        entry = self.read_manifest().get(name)
+        return entry["generation"] if entry else None
+
+    def publish(self, name: Text, arrays: Dict[Text, np.ndarray], meta: Optional[Dict[Text, Any]] = None) -> int:
+        with self._publish_lock:
+            return self._publish(name, arrays, meta)
+
+    def _publish(self, name: Text, arrays: Dict[Text, np.ndarray], meta: Optional[Dict[Text, Any]]) -> int:
+        manifest = self.read_manifest()
+        previous = manifest.get(name)
+        generation = previous["generation"] + 1 if previous else 1
+        relative_path = f"{name}-{generation}"
+        path = os.path.join(self.directory, relative_path)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        for column, values in arrays.items():
+            np.save(os.path.join(path, f"{column}.npy"), np.ascontiguousarray(values), allow_pickle=False)
+
+        manifest[name] = {"generation": generation, "path": relative_path, "meta": meta or {}, "published_at": time.time()}
+        tmp_path = os.path.join(self.directory, f".{MANIFEST_NAME}.{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.directory, MANIFEST_NAME))
+
+        # Processes still mapping the old files keep them until they re-attach; unlinking
+        # only drops the directory entry
+        if previous:
+            shutil.rmtree(os.path.join(self.directory, previous["path"]), ignore_errors=True)
+        return generation
+
+    def attach(self, name: Text, timeout: Optional[float] = None) -> Tuple[int, Dict[Text, np.ndarray], Dict[Text, Any]]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            entry = self.read_manifest().get(name)
+            if entry is not None:
+                try:
+                    return entry["generation"], self._open(entry["path"]), entry.get("meta", {})
+                except FileNotFoundError:
+                    # The leader replaced this generation while we were opening it
+                    pass
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"No shared {name} data was published in {self.directory}")
+            time.sleep(min(self.poll_seconds, 0.5))
+
+    def _open(self, relative_path: Text) -> Dict[Text, np.ndarray]:
+        path = os.path.join(self.directory, relative_path)
+        arrays = {}
+        for filename in os.listdir(path):
+            if filename.endswith(".npy"):
+                # mmap_mode="r": pages come straight from the shared page cache
+                arrays[filename[:-4]] = np.load(os.path.join(path, filename), mmap_mode="r", allow_pickle=False)
+        return arrays
@@ -0,0 +1,94 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, Optional, Text
+
+logger = logging.getLogger(__name__)
+
+# File layout: header (magic, format version, payload length, SHA-256 of the payload)
+# followed by a zlib-compressed JSON payload with one entry per collection.
+MAGIC = b"LGZS"
+VERSION = 1
+HEADER = struct.Struct("<4sHI32s")
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "..", ".cache", "reference_snapshot.bin")
+
+
+def _to_plain(value: Any) -> Any:
+    # Firestore timestamps and geopoints are not JSON serializable
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):
+        return {"lat": value.latitude, "lon": value.longitude}
+    return str(value)
+
+
+class CollectionSnapshot:
+    def __init__(self, docs: Dict[Text, Dict[Text, Any]], updated_at: float, loaded_at: float) -> None:
+        self.docs = docs
+        # Newest `updated_at` among the documents: the watermark for delta queries
+        self.updated_at = updated_at
+        # When this collection was last fully read from Firestore
+        self.loaded_at = loaded_at
+
+    def as_dict(self) -> Dict[Text, Any]:
+        return {"updated_at": self.updated_at, "loaded_at": self.loaded_at, "docs": self.docs}
+
+
+class Snapshot:
+    def __init__(self, collections: Optional[Dict[Text, CollectionSnapshot]] = None) -> None:
+        self.collections = collections or {}
+
+    @classmethod
+    def load(cls, path: Text) -> "Snapshot":
+        # Check if no snapshot has been written on this host yet
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, "rb") as f:
+                magic, version, length, checksum = HEADER.unpack(f.read(HEADER.size))
+                payload = f.read(length)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"unsupported snapshot format {magic!r} v{version}")
+            if len(payload) != length or hashlib.sha256(payload).digest() != checksum:
+                raise ValueError("checksum mismatch")
+            data = json.loads(zlib.decompress(payload).decode("utf-8"))
+        except Exception as e:
+            # A corrupt or outdated snapshot only costs a full reload
+            logger.warning("Ignoring reference snapshot %s: %s", path, e)
+            return cls()
+        return cls({
+            name: CollectionSnapshot(entry["docs"], entry["updated_at"], entry["loaded_at"])
+            for name, entry in data["collections"].items()
+        })
+
+    def write(self, path: Text) -> None:
+        data = {
+            "created_at": time.time(),
+            "collections": {name: collection.as_dict() for name, collection in self.collections.items()},
+        }
+        payload = zlib.compress(json.dumps(data, default=_to_plain, separators=(",", ":")).encode("utf-8"), 6)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(payload), hashlib.sha256(payload).digest()))
+            f.write(payload)
+        # Workers may write at the same time; each rename is atomic
+        os.replace(tmp_path, path)
+
+
+def updated_watermark(docs: Dict[Text, Dict[Text, Any]], field: Text) -> float:
+    newest = 0.0
+    for doc in docs.values():
+        value = doc.get(field)
+        if isinstance(value, datetime.datetime):
+            value = value.timestamp()
+        if isinstance(value, (int, float)) and value > newest:
+            newest = float(value)
+    return newest
@@ -0,0 +1,169 @@
+import heapq
+import math
+from typing import Any, Dict, Iterable, List, Optional, Set, Text, Tuple, Union
+
+import numpy as np
+
+from actions.location_table import LocationTable
+from actions.shared_reference import csr
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+# About 1.1 km per cell around Legazpi
+DEFAULT_CELL_SIZE_DEG = 0.01
+# Candidate sets this small are cheaper to scan in one vectorized pass than ring by ring
+BRUTE_FORCE_LIMIT = 2048
+MAX_RINGS = 12
+
+
+def haversine_np(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat1 = math.radians(lat)
+    lon1 = math.radians(lon)
+    lat2 = np.radians(lats)
+    lon2 = np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    # Grid index over the coordinates of a LocationTable. Built once per load and never
+    # mutated, so it can be swapped in atomically and read without locking.
+    def __init__(self, locations: Union[LocationTable, Iterable[Dict[Text, Any]]], cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> None:
+        self.cell_size_deg = cell_size_deg
+        if not isinstance(locations, LocationTable):
+            locations = LocationTable(locations)
+        self._use_table(locations)
+
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for place_id, cell in enumerate(zip(self._cell(self.lats), self._cell(self.lons))):
+            cells.setdefault(cell, []).append(place_id)
+        cell_keys = sorted(cells)
+        self.cell_keys = np.asarray(cell_keys, dtype=np.int64).reshape(len(cell_keys), 2)
+        self.cell_offsets, self.cell_place_ids = csr((cells[cell] for cell in cell_keys), dtype=np.int32)
+        self._index_cells()
+
+    def _use_table(self, table: LocationTable) -> None:
+        self.table = table
+        self.names = table.names
+        self.descriptions = table.descriptions
+        self.lats = table.lats
+        self.lons = table.lons
+
+    def _index_cells(self) -> None:
+        # Views into the packed cell postings; the ids themselves are not copied
+        self.cells = {
+            (row, col): self.cell_place_ids[self.cell_offsets[i]:self.cell_offsets[i + 1]]
+            for i, (row, col) in enumerate(self.cell_keys.tolist())
+        }
+
+    def to_arrays(self) -> Dict[Text, np.ndarray]:
+        arrays = self.table.to_arrays()
+        arrays.update({
+            "cell_keys": self.cell_keys,
+            "cell_offsets": self.cell_offsets,
+            "cell_place_ids": self.cell_place_ids,
+        })
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[Text, np.ndarray], cell_size_deg: float = DEFAULT_CELL_SIZE_DEG) -> "SpatialIndex":
+        index = cls.__new__(cls)
+        index.cell_size_deg = cell_size_deg
+        index._use_table(LocationTable.from_arrays(arrays))
+        for column in ("cell_keys", "cell_offsets", "cell_place_ids"):
+            setattr(index, column, arrays[column])
+        index._index_cells()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def tags_of(self, place_id: int) -> frozenset:
+        return self.table.tags_of(place_id)
+
+    def distances_from(self, lat: float, lon: float) -> np.ndarray:
+        # Distance in km from one point to every place, in table order
+        return haversine_np(lat, lon, self.lats, self.lons)
+
+    def _cell(self, degrees: Any) -> Any:
+        return np.floor(np.asarray(degrees) / self.cell_size_deg).astype(np.int64).tolist()
+
+    def ids_with_tags(self, tags: Iterable[Text]) -> np.ndarray:
+        return self.table.ids_with_tags(tags)
+
+    def _ring_ids(self, row: int, col: int, ring: int) -> List[np.ndarray]:
+        found = []
+        for dr in range(-ring, ring + 1):
+            # Inner rows only contribute their two edge cells
+            step = 1 if abs(dr) == ring else 2 * ring
+            for dc in range(-ring, ring + 1, max(step, 1)):
+                ids = self.cells.get((row + dr, col + dc))
+                if ids is not None:
+                    found.append(ids)
+        return found
+
+    def _covered_km(self, lat: float, ring: int) -> float:
+        # Every place outside the searched square is at least this far away
+        span = ring * self.cell_size_deg
+        return span * KM_PER_DEGREE * math.cos(math.radians(min(89.0, abs(lat) + span)))
+
+    def _scan(self, lat: float, lon: float, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return ids, haversine_np(lat, lon, self.lats[ids], self.lons[ids])
+
+    def nearest(
+        self, lat: float, lon: float, k: int, candidates: Optional[np.ndarray] = None
+    ) -> List[Tuple[float, int]]:
+        if len(self) == 0 or k <= 0:
+            return []
+        # Check if the candidate set is small enough to scan directly
+        if candidates is not None and len(candidates) <= BRUTE_FORCE_LIMIT:
+            ids, distances = self._scan(lat, lon, candidates)
+            return heapq.nsmallest(k, zip(distances.tolist(), ids.tolist()))
+
+        allowed = None
+        if candidates is not None:
+            allowed = np.zeros(len(self), dtype=bool)
+            allowed[candidates] = True
+        row, col = self._cell(lat), self._cell(lon)
+        best: List[Tuple[float, int]] = []
+        for ring in range(MAX_RINGS + 1):
+            for ids in self._ring_ids(row, col, ring):
+                if allowed is not None:
+                    ids = ids[allowed[ids]]
+                if len(ids) == 0:
+                    continue
+                ids, distances = self._scan(lat, lon, ids)
+                best = heapq.nsmallest(k, best + list(zip(distances.tolist(), ids.tolist())))
+            # Check if the k-th result is closer than anything outside the searched rings
+            if len(best) >= k and best[-1][0] <= self._covered_km(lat, ring):
+                return best
+
+        # Places are spread too thinly for the grid to help; fall back to one full pass
+        ids = candidates if candidates is not None else np.arange(len(self))
+        ids, distances = self._scan(lat, lon, ids)
+        return heapq.nsmallest(k, zip(distances.tolist(), ids.tolist()))
+
+    def within(
+        self, lat: float, lon: float, radius_km: float, candidates: Optional[np.ndarray] = None
+    ) -> List[Tuple[float, int]]:
+        if len(self) == 0:
+            return []
+        if candidates is not None and len(candidates) <= BRUTE_FORCE_LIMIT:
+            ids, distances = self._scan(lat, lon, candidates)
+        else:
+            row, col = self._cell(lat), self._cell(lon)
+            rings = 0
+            while self._covered_km(lat, rings) < radius_km and rings < MAX_RINGS:
+                rings += 1
+            # Check if the radius is wider than the grid search is worth
+            if self._covered_km(lat, rings) < radius_km:
+                ids = np.arange(len(self))
+            else:
+                found = [ids for ring in range(rings + 1) for ids in self._ring_ids(row, col, ring)]
+                ids = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+            if candidates is not None:
+                ids = np.intersect1d(ids, candidates)
+            ids, distances = self._scan(lat, lon, ids)
+        inside = distances <= radius_km
+        order = np.argsort(distances[inside], kind="stable")
+        return list(zip(distances[inside][order].tolist(), ids[inside][order].tolist()))
@@ -0,0 +1,60 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Text, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Small side-car HTTP server for operational endpoints (readiness, health, metrics).
+# It runs next to the Rasa action server on its own port, so probes keep working
+# even while the action server is busy or still starting.
+DEFAULT_PORT = 5056
+
+# path -> handler returning (status code, content type, body)
+ROUTES: Dict[Text, Callable[[], Tuple[int, Text, bytes]]] = {}
+
+
+def register_route(path: Text, handler: Callable[[], Tuple[int, Text, bytes]]) -> None:
+    ROUTES[path] = handler
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        handler = ROUTES.get(self.path.split("?", 1)[0])
+        # Check if the path is not one of the registered endpoints
+        if handler is None:
+            status, content_type, body = 404, "text/plain; charset=utf-8", b"not found\n"
+        else:
+            try:
+                status, content_type, body = handler()
+            except Exception as e:
+                logger.exception("Status endpoint %s failed", self.path)
+                status, content_type, body = 500, "text/plain; charset=utf-8", b"error\n"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: Text, *args) -> None:
+        # Probes hit these endpoints every few seconds; keep them out of the logs
+        logger.debug(format, *args)
+
+
+def start_status_server(host: Text = "0.0.0.0", port: int = DEFAULT_PORT, attempts: int = 1) -> Optional[ThreadingHTTPServer]:
+    # Binds the first free port of port .. port + attempts - 1
+    server = None
+    for candidate in range(port, port + max(1, attempts)):
+        try:
+            server = ThreadingHTTPServer((host, candidate), StatusRequestHandler)
+            break
+        except OSError as e:
+            error = e
+    if server is None:
+        # Another process on this host already serves the endpoints
+        logger.warning("Status server not started on port %s: %s", port, error)
+        return None
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="status-server", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,134 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Text, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "strict": actions wait for the caches (up to a timeout) and /ready stays 503 until
+# every cache has loaded. "degraded": serve immediately with whatever has loaded.
+WARMUP_MODES = ("strict", "degraded")
+
+
+class CacheState:
+    def __init__(self, name: Text) -> None:
+        self.name = name
+        self.status = "pending"
+        self.count = 0
+        self.error: Optional[Text] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def as_dict(self) -> Dict[Text, Any]:
+        duration = None
+        if self.started_at is not None and self.finished_at is not None:
+            duration = round(self.finished_at - self.started_at, 3)
+        return {
+            "status": self.status,
+            "count": self.count,
+            "error": self.error,
+            "load_seconds": duration,
+        }
+
+
+class Warmup:
+    # Loads reference data in parallel on background threads and tracks per-cache state.
+    # Each loader returns the number of items it loaded and raises on failure.
+    def __init__(self, mode: Text = "strict", retries: int = 3, retry_delay: float = 2.0) -> None:
+        if mode not in WARMUP_MODES:
+            raise ValueError(f"Unknown warm-up mode '{mode}'")
+        self.mode = mode
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.states: Dict[Text, CacheState] = {}
+        self._loaders: List[Tuple[Text, Callable[[], int]]] = []
+        self._done_callbacks: List[Callable[[], None]] = []
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, name: Text, loader: Callable[[], int]) -> None:
+        self.states[name] = CacheState(name)
+        self._loaders.append((name, loader))
+
+    def add_done_callback(self, callback: Callable[[], None]) -> None:
+        # Runs on the warm-up thread once every loader has finished
+        self._done_callbacks.append(callback)
+
+    def start(self) -> None:
+        # Check if the warm-up is already running or finished
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="cache-warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        if self._loaders:
+            with ThreadPoolExecutor(max_workers=len(self._loaders), thread_name_prefix="warmup") as pool:
+                list(pool.map(lambda item: self._load(*item), self._loaders))
+        for callback in self._done_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.exception("Warm-up callback failed")
+        self._done.set()
+
+    def _load(self, name: Text, loader: Callable[[], int]) -> None:
+        state = self.states[name]
+        state.status = "loading"
+        state.started_at = time.time()
+        for attempt in range(self.retries + 1):
+            try:
+                state.count = loader()
+                state.status = "ready"
+                state.error = None
+                break
+            except Exception as e:
+                state.error = f"{type(e).__name__}: {e}"
+                logger.exception("Failed to load %s (attempt %s)", name, attempt + 1)
+                # Back off before retrying, doubling the delay each time
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * (2 ** attempt))
+        else:
+            state.status = "failed"
+        state.finished_at = time.time()
+
+    def is_started(self) -> bool:
+        return self._thread is not None
+
+    def reset(self) -> None:
+        # For a forked process: the parent's warm-up thread does not exist there
+        self.states = {name: CacheState(name) for name in self.states}
+        self._done = threading.Event()
+        self._thread = None
+
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def is_ready(self) -> bool:
+        # The done callbacks build the indexes derived from the caches, so the
+        # caches alone being loaded is not enough
+        return self.is_done() and all(state.status == "ready" for state in self.states.values())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def accepting_traffic(self) -> bool:
+        return self.is_ready() or self.mode == "degraded"
+
+    def report(self) -> Dict[Text, Any]:
+        return {
+            "mode": self.mode,
+            "ready": self.is_ready(),
+            "done": self.is_done(),
+            "caches": {name: state.as_dict() for name, state in self.states.items()},
+        }
+
+    def readiness_response(self) -> Tuple[int, Text, bytes]:
+        status = 200 if self.accepting_traffic() else 503
+        return status, "application/json", json.dumps(self.report()).encode("utf-8")
+
+    def health_response(self) -> Tuple[int, Text, bytes]:
+        # Liveness: the process is up, whatever the state of the caches
+        return 200, "application/json", json.dumps(self.report()).encode("utf-8")
@@ -0,0 +1,386 @@
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Text, Tuple
+
+from rasa.engine.graph import ExecutionContext, GraphComponent
+from rasa.engine.recipes.default_recipe import DefaultV1Recipe
+from rasa.engine.storage.resource import Resource
+from rasa.engine.storage.storage import ModelStorage
+from rasa.nlu.extractors.extractor import EntityExtractorMixin
+from rasa.shared.nlu.constants import (
+    ENTITIES,
+    ENTITY_ATTRIBUTE_CONFIDENCE,
+    ENTITY_ATTRIBUTE_END,
+    ENTITY_ATTRIBUTE_START,
+    ENTITY_ATTRIBUTE_TYPE,
+    ENTITY_ATTRIBUTE_VALUE,
+    TEXT,
+)
+from rasa.shared.nlu.training_data.message import Message
+from rasa.shared.nlu.training_data.training_data import TrainingData
+
+from actions.route_index import FILLER_WORDS, normalize_landmark
+from actions.snapshot import DEFAULT_SNAPSHOT_PATH, Snapshot
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[\w'’]+")
+NAMES_FILE = "landmarks.json"
+
+
+def normalize_token(token: Text) -> Text:
+    # Same per-word normalization as normalize_landmark, so matched places line up
+    # with the keys the actions use
+    text = unicodedata.normalize("NFKD", token.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return text.replace("'", "").replace("’", "")
+
+
+def tokenize(text: Text) -> List[Tuple[Text, int, int]]:
+    # (normalized word, start, end) for every word, filler words included
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        word = normalize_token(match.group())
+        if word:
+            tokens.append((word, match.start(), match.end()))
+    return tokens
+
+
+class LandmarkAutomaton:
+    # Aho–Corasick automaton over words: every known spelling of every landmark is a
+    # path of word ids, and one left-to-right pass over a message finds all of them.
+    # A spelling is added as written and without its filler words, so "SM Legazpi"
+    # finds "SM City Legazpi" while "Tabaco City" is matched as a whole.
+    # States are numbered; goto[state] maps a word id to the next state, fail[state]
+    # is the longest proper suffix that is also a path, match[state] is the
+    # (word count, place id) of the spelling ending exactly there, if any, and
+    # output[state] is the next state down the fail chain that has a match.
+    def __init__(self, spellings: Iterable[Tuple[Text, Text]]) -> None:
+        self.places: List[Text] = []
+        place_ids: Dict[Text, int] = {}
+        self.words: Dict[Text, int] = {}
+        self.goto: List[Dict[int, int]] = [{}]
+        self.match: List[Optional[Tuple[int, int]]] = [None]
+
+        for spelling, canonical in spellings:
+            words = [word for word, _, _ in tokenize(spelling)]
+            key = normalize_landmark(canonical)
+            # Check if the spelling is only punctuation
+            if not words or not key:
+                continue
+            place_id = place_ids.setdefault(key, len(self.places))
+            if place_id == len(self.places):
+                self.places.append(canonical.strip())
+            self._add(words, place_id)
+            core = [word for word in words if word not in FILLER_WORDS]
+            if core and core != words:
+                self._add(core, place_id)
+
+        # Breadth-first, so links of shallower states are set before deeper ones
+        self.fail = [0] * len(self.goto)
+        self.output = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word_id, child in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and word_id not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(word_id, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.fail[child] if self.match[self.fail[child]] is not None else self.output[self.fail[child]]
+                queue.append(child)
+
+    def _add(self, words: List[Text], place_id: int) -> None:
+        state = 0
+        for word in words:
+            word_id = self.words.setdefault(word, len(self.words))
+            next_state = self.goto[state].get(word_id)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][word_id] = next_state
+                self.goto.append({})
+                self.match.append(None)
+            state = next_state
+        # The first spelling of a word sequence wins, like the first name of a place
+        if self.match[state] is None:
+            self.match[state] = (len(words), place_id)
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def exact(self, text: Text) -> Optional[int]:
+        # Place id when the whole text is one known spelling
+        state = 0
+        for word, _, _ in tokenize(text):
+            state = self.goto[state].get(self.words.get(word, -1))
+            if state is None:
+                return None
+        return self.match[state][1] if state and self.match[state] is not None else None
+
+    def find(self, text: Text, boundaries: FrozenSet[Text] = frozenset()) -> List[Tuple[int, int, int]]:
+        # Non-overlapping (start, end, place id) spans, leftmost-longest first. A
+        # spelling only counts when it is the whole name in the message: right next
+        # to a word that also occurs in landmark names ("Tabaco" in "Tabaco City")
+        # it is part of a longer name the automaton does not know. Boundary words
+        # ("from", "to") never continue a name.
+        tokens = tokenize(text)
+        found = []
+        state = 0
+        for position, (word, _, _) in enumerate(tokens):
+            word_id = self.words.get(word)
+            # Check if the word is in no landmark name; nothing can continue through it
+            if word_id is None:
+                state = 0
+                continue
+            while state and word_id not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(word_id, 0)
+            # Every spelling ending at this word, longest first
+            matched = state if self.match[state] is not None else self.output[state]
+            while matched:
+                length, place_id = self.match[matched]
+                first = position - length + 1
+                if self._complete(text, tokens, first, position, boundaries):
+                    found.append((first, position, place_id))
+                matched = self.output[matched]
+
+        spans = []
+        last_end = -1
+        for first, last, place_id in sorted(found, key=lambda span: (span[0], span[0] - span[1])):
+            if first > last_end:
+                spans.append((tokens[first][1], tokens[last][2], place_id))
+                last_end = last
+        return spans
+
+    def _complete(self, text: Text, tokens: List[Tuple[Text, int, int]], first: int, last: int, boundaries: FrozenSet[Text]) -> bool:
+        def continues(neighbour: int, gap: Text) -> bool:
+            word = tokens[neighbour][0]
+            # Part of the same name unless punctuation separates them ("Tabaco, Daraga")
+            return not gap.strip() and word in self.words and word not in boundaries
+        if last + 1 < len(tokens) and continues(last + 1, text[tokens[last][2]:tokens[last + 1][1]]):
+            return False
+        # An article before a name ("to the Cathedral") does not make it longer
+        if first > 0 and tokens[first - 1][0] not in FILLER_WORDS and continues(first - 1, text[tokens[first - 1][2]:tokens[first][1]]):
+            return False
+        return True
+
+
+def lookup_elements(elements: Any) -> List[Text]:
+    # Lookup tables list names inline or point at a file ("file: data/lookups/x.txt")
+    names = []
+    for element in elements if isinstance(elements, list) else [elements]:
+        element = str(element).strip()
+        if element.startswith("file:"):
+            path = element[len("file:"):].strip()
+            try:
+                with open(path, encoding="utf-8") as f:
+                    names.extend(line.strip() for line in f if line.strip())
+            except OSError as e:
+                logger.warning("Skipping lookup file %s: %s", path, e)
+        elif element:
+            names.append(element)
+    return names
+
+
+@DefaultV1Recipe.register(DefaultV1Recipe.ComponentType.ENTITY_EXTRACTOR, is_trainable=True)
+class LandmarkEntityExtractor(GraphComponent, EntityExtractorMixin):
+    # Runs after DIETClassifier and matches landmark names in one pass with an
+    # Aho–Corasick automaton. Spellings come from the landmark lookup tables and their
+    # synonyms at training time, plus the place names in the action server's
+    # reference snapshot, which is re-read when it changes so new landmarks are
+    # recognized without retraining.
+    # DIET's origin and destination entities keep their span and role; when the span
+    # is exactly a known spelling, or a part of one, it takes the whole name and its
+    # canonical value. A landmark DIET missed is added only when a cue word gives its
+    # role: "from"/"near" for the origin, "to" for the destination ("nearest bank to
+    # X" asks from X), or two places in a row read as origin then destination.
+    @staticmethod
+    def get_default_config() -> Dict[Text, Any]:
+        return {
+            "lookup_tables": ["ORIGIN", "DESTINATION"],
+            "snapshot_path": DEFAULT_SNAPSHOT_PATH,
+            "refresh_seconds": 30,
+            "origin_entity": "ORIGIN",
+            "destination_entity": "DESTINATION",
+            "origin_cues": ["from", "galing", "mula", "near", "nearby", "around", "malapit"],
+            "destination_cues": ["to", "into", "towards", "papunta", "hanggang"],
+            "nearest_cues": ["nearest", "closest", "pinakamalapit"],
+        }
+
+    def __init__(
+        self,
+        config: Dict[Text, Any],
+        model_storage: ModelStorage,
+        resource: Resource,
+        spellings: Optional[List[Tuple[Text, Text]]] = None,
+    ) -> None:
+        self._config = config
+        self._model_storage = model_storage
+        self._resource = resource
+        self.spellings = spellings or []
+        self.origin_cues = frozenset(normalize_token(cue) for cue in config["origin_cues"])
+        self.destination_cues = frozenset(normalize_token(cue) for cue in config["destination_cues"])
+        self.nearest_cues = frozenset(normalize_token(cue) for cue in config["nearest_cues"])
+        self.roles = (config["origin_entity"], config["destination_entity"])
+        self._snapshot_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.automaton = LandmarkAutomaton(self.spellings)
+
+    @classmethod
+    def create(
+        cls,
+        config: Dict[Text, Any],
+        model_storage: ModelStorage,
+        resource: Resource,
+        execution_context: ExecutionContext,
+    ) -> "LandmarkEntityExtractor":
+        return cls(config, model_storage, resource)
+
+    @classmethod
+    def load(
+        cls,
+        config: Dict[Text, Any],
+        model_storage: ModelStorage,
+        resource: Resource,
+        execution_context: ExecutionContext,
+        **kwargs: Any,
+    ) -> "LandmarkEntityExtractor":
+        try:
+            with model_storage.read_from(resource) as directory:
+                with open(os.path.join(directory, NAMES_FILE), encoding="utf-8") as f:
+                    spellings = [tuple(pair) for pair in json.load(f)]
+        except (ValueError, OSError):
+            logger.debug("No landmark names stored for %s; starting empty", cls.__name__)
+            spellings = []
+        extractor = cls(config, model_storage, resource, spellings)
+        extractor.refresh()
+        return extractor
+
+    def train(self, training_data: TrainingData) -> Resource:
+        names = []
+        for table in training_data.lookup_tables:
+            if table.get("name") in self._config["lookup_tables"]:
+                names.extend((name, name) for name in lookup_elements(table.get("elements", [])))
+        known = {normalize_landmark(name) for name, _ in names}
+        # Only synonyms of landmarks; the rest ("sleep" -> "sleeping") are other entities.
+        # They come first so a name that is also a synonym ("Daraga") resolves the way
+        # EntitySynonymMapper resolves it further down the pipeline.
+        spellings = [
+            (variant, canonical)
+            for variant, canonical in training_data.entity_synonyms.items()
+            if normalize_landmark(canonical) in known
+        ]
+        spellings.extend(names)
+        self.spellings = spellings
+        self.automaton = LandmarkAutomaton(spellings)
+        with self._model_storage.write_to(self._resource) as directory:
+            with open(os.path.join(directory, NAMES_FILE), "w", encoding="utf-8") as f:
+                json.dump(spellings, f, ensure_ascii=False)
+        return self._resource
+
+    def refresh(self) -> None:
+        # Check if the snapshot has not changed since the automaton was built
+        path = self._config["snapshot_path"]
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == self._snapshot_mtime:
+            return
+        self._snapshot_mtime = mtime
+        collection = Snapshot.load(path).collections.get("locations")
+        place_names = [doc["name"] for doc in collection.docs.values() if doc.get("name")] if collection else []
+        # Trained spellings come first so their canonical names win
+        self.automaton = LandmarkAutomaton(self.spellings + [(name, name) for name in place_names])
+
+    def process(self, messages: List[Message]) -> List[Message]:
+        now = time.monotonic()
+        if now - self._checked_at >= self._config["refresh_seconds"]:
+            self._checked_at = now
+            self.refresh()
+        automaton = self.automaton
+        for message in messages:
+            text = message.get(TEXT)
+            if not text:
+                continue
+            entities = self.extract(text, message.get(ENTITIES, []), automaton)
+            message.set(ENTITIES, entities, add_to_output=True)
+        return messages
+
+    def extract(self, text: Text, entities: List[Dict[Text, Any]], automaton: LandmarkAutomaton) -> List[Dict[Text, Any]]:
+        boundaries = self.origin_cues | self.destination_cues
+        spans = automaton.find(text, boundaries)
+        entities = [self.resolve(text, entity, spans, automaton) for entity in entities]
+        # Landmarks no other extractor tagged any part of
+        missed = [
+            span
+            for span in spans
+            if not any(
+                entity.get(ENTITY_ATTRIBUTE_START, span[1]) < span[1] and span[0] < entity.get(ENTITY_ATTRIBUTE_END, span[0])
+                for entity in entities
+            )
+        ]
+        roles = [self.cue_role(text, start) for start, _, _ in missed]
+        placed = [entity[ENTITY_ATTRIBUTE_TYPE] for entity in entities if entity.get(ENTITY_ATTRIBUTE_TYPE) in self.roles]
+        taken = set(placed) | {role for role in roles if role is not None}
+        # Check if two places come without cue words, e.g. "SM to Cathedral fare"
+        if len(missed) + len(placed) == 2 and None in roles:
+            for i, role in enumerate(roles):
+                free = [free_role for free_role in self.roles if free_role not in taken]
+                if role is None and free:
+                    roles[i] = free[0]
+                    taken.add(free[0])
+        added = [
+            {
+                ENTITY_ATTRIBUTE_TYPE: role,
+                ENTITY_ATTRIBUTE_START: start,
+                ENTITY_ATTRIBUTE_END: end,
+                ENTITY_ATTRIBUTE_VALUE: automaton.places[place_id],
+                ENTITY_ATTRIBUTE_CONFIDENCE: 1.0,
+            }
+            for (start, end, place_id), role in zip(missed, roles)
+            # Check if the cue gives no role, or one another extractor already filled
+            if role is not None and role not in placed
+        ]
+        return sorted(entities + self.add_extractor_name(added), key=lambda entity: entity.get(ENTITY_ATTRIBUTE_START, 0))
+
+    def resolve(self, text: Text, entity: Dict[Text, Any], spans: List[Tuple[int, int, int]], automaton: LandmarkAutomaton) -> Dict[Text, Any]:
+        # Check if the entity is not an origin or destination, e.g. an activity
+        if entity.get(ENTITY_ATTRIBUTE_TYPE) not in self.roles or ENTITY_ATTRIBUTE_START not in entity:
+            return entity
+        start, end = entity[ENTITY_ATTRIBUTE_START], entity[ENTITY_ATTRIBUTE_END]
+        # A name cut short ("Daraga" of "Daraga Church") takes the whole match; a
+        # longer or different span stays as tagged, canonical if it is a known spelling
+        containing = [span for span in spans if span[0] <= start and end <= span[1]]
+        if containing:
+            start, end, place_id = containing[0]
+        else:
+            place_id = automaton.exact(text[start:end])
+            if place_id is None:
+                return entity
+        entity = {
+            **entity,
+            ENTITY_ATTRIBUTE_START: start,
+            ENTITY_ATTRIBUTE_END: end,
+            ENTITY_ATTRIBUTE_VALUE: automaton.places[place_id],
+        }
+        self.add_processor_name(entity)
+        return entity
+
+    def cue_role(self, text: Text, start: int) -> Optional[Text]:
+        # The word right before the place, skipping filler words ("from the port")
+        before = [word for word, _, _ in tokenize(text[:start]) if word not in FILLER_WORDS]
+        if not before:
+            return None
+        if before[-1] in self.origin_cues:
+            return self._config["origin_entity"]
+        if before[-1] in self.destination_cues:
+            # "the closest ATM to X" asks for places around X
+            if self.nearest_cues.intersection(before):
+                return self._config["origin_entity"]
+            return self._config["destination_entity"]
+        return None
@@ -0,0 +1,293 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Text, Tuple
+
+from rasa.core.brokers.broker import EventBroker
+from rasa.core.tracker_store import TrackerStore
+from rasa.shared.core.constants import ACTION_SESSION_START_NAME
+from rasa.shared.core.domain import Domain
+from rasa.shared.core.trackers import DialogueStateTracker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = os.path.join(os.path.dirname(__file__), "..", ".cache", "trackers.sqlite3")
+# Saves that arrive within this many seconds of each other share one transaction
+DEFAULT_FLUSH_INTERVAL = 0.005
+DEFAULT_CACHE_SIZE = 1000
+# Older sessions of conversations idle this long are dropped; only the latest
+# session is kept, which is all the bot ever loads
+DEFAULT_COMPACT_AFTER_DAYS = 7.0
+# Whole conversations idle this long are deleted; 0 keeps them forever
+DEFAULT_MAX_AGE_DAYS = 0.0
+DEFAULT_COMPACT_INTERVAL = 3600.0
+
+
+class CachedConversation:
+    # Latest session of one conversation as serialized events, kept as JSON so every
+    # tracker built from it gets its own copies; events[0] has sequence number
+    # session_start, and count is the sequence number of the next event
+    __slots__ = ("events", "count", "session_start")
+
+    def __init__(self, events: List[Text], count: int, session_start: int) -> None:
+        self.events = events
+        self.count = count
+        self.session_start = session_start
+
+
+class SQLiteTrackerStore(TrackerStore):
+    # Tracker store in a local SQLite file, for nodes without Redis or Mongo.
+    # Events are appended one row each, so a save writes only what is new; saves
+    # from concurrent conversations are grouped into one transaction on a writer
+    # thread. WAL mode lets replicas on the same host read while one of them
+    # writes. The latest session of recently active conversations stays in an LRU
+    # and is checked against the event count on disk before it is used, so events
+    # written by another replica are picked up.
+    #
+    # endpoints.yml:
+    #   tracker_store:
+    #     type: addons.sqlite_tracker_store.SQLiteTrackerStore
+    #     db: .cache/trackers.sqlite3
+    def __init__(
+        self,
+        domain: Optional[Domain] = None,
+        event_broker: Optional[EventBroker] = None,
+        db: Text = DEFAULT_DB,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        compact_after_days: float = DEFAULT_COMPACT_AFTER_DAYS,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+        compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(domain, event_broker, **kwargs)
+        self.db = db
+        self.flush_interval = float(flush_interval)
+        self.cache_size = int(cache_size)
+        self.compact_after = float(compact_after_days) * 86400
+        self.max_age = float(max_age_days) * 86400
+        self.compact_interval = float(compact_interval)
+
+        os.makedirs(os.path.dirname(os.path.abspath(db)), exist_ok=True)
+        # Reads run on the event loop; writes run on their own thread and connection
+        self._reader = self._connect()
+        self._writer = self._connect()
+        self._reader_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracker-store")
+        self._cache: "OrderedDict[Text, CachedConversation]" = OrderedDict()
+
+        self._pending_events: List[Tuple[Text, int, float, Text]] = []
+        self._pending_conversations: Dict[Text, Tuple[int, int, float]] = {}
+        self._waiters: List[asyncio.Future] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_compaction = time.time()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db, timeout=5.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Must be set before the tables exist to let compaction give space back
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " sender_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " timestamp REAL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (sender_id, seq)) WITHOUT ROWID"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " sender_id TEXT PRIMARY KEY,"
+            " event_count INTEGER NOT NULL,"
+            " session_start INTEGER NOT NULL,"
+            " first_event INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at)")
+        return conn
+
+    def _read(self, query: Text, params: tuple) -> List[tuple]:
+        with self._reader_lock:
+            return self._reader.execute(query, params).fetchall()
+
+    def _load(self, sender_id: Text) -> Optional[CachedConversation]:
+        rows = self._read("SELECT event_count, session_start FROM conversations WHERE sender_id = ?", (sender_id,))
+        cached = self._cache.get(sender_id)
+        # Check if nothing was stored yet; saves of a new conversation may still be queued
+        if not rows:
+            return cached
+        count, session_start = rows[0]
+        if cached is not None and cached.count >= count:
+            self._cache.move_to_end(sender_id)
+            return cached
+        # Check if another replica only added events to the session this one has
+        if cached is not None and cached.session_start == session_start:
+            first = cached.count
+            events = list(cached.events)
+        else:
+            first = session_start
+            events = []
+        events.extend(data for (data,) in self._read(
+            "SELECT data FROM events WHERE sender_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (sender_id, first, count),
+        ))
+        conversation = CachedConversation(events, count, session_start)
+        self._remember(sender_id, conversation)
+        return conversation
+
+    def _remember(self, sender_id: Text, conversation: CachedConversation) -> None:
+        self._cache[sender_id] = conversation
+        self._cache.move_to_end(sender_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _tracker(self, sender_id: Text, events: List[Text]) -> DialogueStateTracker:
+        return DialogueStateTracker.from_dict(
+            sender_id, [json.loads(data) for data in events], self.domain.slots, self.max_event_history
+        )
+
+    async def retrieve(self, sender_id: Text) -> Optional[DialogueStateTracker]:
+        conversation = self._load(sender_id)
+        if conversation is None:
+            return None
+        return self._tracker(sender_id, conversation.events)
+
+    async def retrieve_full_tracker(self, conversation_id: Text) -> Optional[DialogueStateTracker]:
+        conversation = self._load(conversation_id)
+        if conversation is None:
+            return None
+        rows = self._read(
+            "SELECT data FROM events WHERE sender_id = ? AND seq < ? ORDER BY seq",
+            (conversation_id, conversation.session_start),
+        )
+        return self._tracker(conversation_id, [data for (data,) in rows] + conversation.events)
+
+    async def keys(self) -> Iterable[Text]:
+        return [sender_id for (sender_id,) in self._read("SELECT sender_id FROM conversations", ())]
+
+    async def save(self, tracker: DialogueStateTracker) -> None:
+        if self.event_broker:
+            await self.stream_events(tracker)
+        sender_id = tracker.sender_id
+        conversation = self._load(sender_id) or CachedConversation([], 0, 0)
+        # The tracker holds the latest session; only events past the stored ones are new
+        new_events = [event.as_dict() for event in itertools.islice(tracker.events, len(conversation.events), None)]
+        if not new_events:
+            return
+
+        events = list(conversation.events)
+        session_start = conversation.session_start
+        rows = []
+        for seq, event in enumerate(new_events, conversation.count):
+            # Check if a new session starts here; earlier events are no longer loaded
+            if event.get("event") == "action" and event.get("name") == ACTION_SESSION_START_NAME:
+                session_start = seq
+                events = []
+            data = json.dumps(event, ensure_ascii=False)
+            events.append(data)
+            rows.append((sender_id, seq, event.get("timestamp"), data))
+        count = conversation.count + len(new_events)
+        self._remember(sender_id, CachedConversation(events, count, session_start))
+
+        self._pending_events.extend(rows)
+        self._pending_conversations[sender_id] = (count, session_start, time.time())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush())
+        try:
+            await waiter
+        except Exception:
+            # The events are not on disk; reload from there next time
+            self._cache.pop(sender_id, None)
+            raise
+
+    async def _flush(self) -> None:
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(self.flush_interval)
+        # Saves that arrive while a batch is written go into the next batch
+        while self._waiters:
+            events, self._pending_events = self._pending_events, []
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            waiters, self._waiters = self._waiters, []
+            try:
+                await loop.run_in_executor(self._executor, self._write, events, conversations)
+            except Exception as e:
+                logger.exception("Writing %s tracker events failed", len(events))
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+        self._flush_task = None
+
+        # Check if old sessions are due to be compacted
+        if time.time() - self._last_compaction >= self.compact_interval:
+            self._last_compaction = time.time()
+            try:
+                expired = await loop.run_in_executor(self._executor, self.compact)
+            except sqlite3.Error:
+                logger.exception("Compacting the tracker store failed")
+                return
+            for sender_id in expired:
+                self._cache.pop(sender_id, None)
+
+    def _write(self, events: List[Tuple[Text, int, float, Text]], conversations: Dict[Text, Tuple[int, int, float]]) -> None:
+        conn = self._writer
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO events (sender_id, seq, timestamp, data) VALUES (?, ?, ?, ?)", events)
+            conn.executemany(
+                "INSERT INTO conversations (sender_id, event_count, session_start, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (sender_id) DO UPDATE SET"
+                " event_count = excluded.event_count,"
+                " session_start = excluded.session_start,"
+                " updated_at = excluded.updated_at",
+                [(sender_id,) + state for sender_id, state in conversations.items()],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def compact(self, now: Optional[float] = None) -> List[Text]:
+        # Drops the older sessions of idle conversations and, with max_age_days set,
+        # whole conversations idle for longer. Returns the deleted conversation ids.
+        now = time.time() if now is None else now
+        conn = self._writer
+        expired: List[Text] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.max_age > 0:
+                expired = [sender_id for (sender_id,) in conn.execute(
+                    "SELECT sender_id FROM conversations WHERE updated_at < ?", (now - self.max_age,)
+                )]
+                conn.executemany("DELETE FROM events WHERE sender_id = ?", [(sender_id,) for sender_id in expired])
+                conn.executemany("DELETE FROM conversations WHERE sender_id = ?", [(sender_id,) for sender_id in expired])
+            old_sessions = conn.execute(
+                "SELECT sender_id, session_start FROM conversations WHERE updated_at < ? AND first_event < session_start",
+                (now - self.compact_after,),
+            ).fetchall()
+            conn.executemany("DELETE FROM events WHERE sender_id = ? AND seq < ?", old_sessions)
+            conn.executemany(
+                "UPDATE conversations SET first_event = ? WHERE sender_id = ?",
+                [(session_start, sender_id) for sender_id, session_start in old_sessions],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        # Give the freed pages back and keep the WAL file from growing
+        conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return expired
@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Text
+
+# Run from the RASA directory: python -m benchmarks.bench_actions --preset large
+# The actions module reads its configuration at import time, so the benchmark
+# settings have to be in place before it is imported.
+BENCH_DIR = tempfile.mkdtemp(prefix="legazpin-bench-")
+os.environ["ACTIONS_AUTOSTART"] = "false"
+os.environ["REFERENCE_LISTENERS"] = "false"
+os.environ["MAPS_CACHE_PATH"] = os.path.join(BENCH_DIR, "maps_cache.sqlite3")
+os.environ["SNAPSHOT_PATH"] = os.path.join(BENCH_DIR, "reference_snapshot.bin")
+os.environ.setdefault("LANDMARK_MATRIX_PATH", os.path.join(BENCH_DIR, "landmark_matrix.bin"))
+
+from rasa_sdk.executor import CollectingDispatcher
+
+from actions import actions
+from actions.maps_cache import MAPS_CACHE
+from benchmarks.stats import percentile
+from benchmarks.fakes import FakeFirestore, FakeMapsClient, make_fares, make_locations, make_routes
+from benchmarks.trackers import ACTION_INTENTS, trackers_for_action
+
+LOOKUP_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "lookups", "locations.txt")
+# Dataset sizes close to today's Firestore data and to a city-wide rollout
+PRESETS = {
+    "small": {"locations": 200, "routes": 30},
+    "large": {"locations": 50000, "routes": 3000},
+}
+ACTION_CLASSES = {
+    "action_handle_fare_inquiry": actions.ActionHandleFareInquiry,
+    "action_handle_route_finder": actions.ActionHandleRouteFinder,
+    "action_handle_recommend_place": actions.ActionHandleRecommendPlace,
+    "action_handle_find_nearest": actions.ActionHandleFindNearest,
+    "action_handle_travel_time_estimate": actions.ActionHandleTravelTimeEstimate,
+    "action_handle_location_inquiry": actions.ActionHandleLocationInquiry,
+}
+
+
+def load_landmark_names(path: Text = LOOKUP_PATH) -> List[Text]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def setup(location_count: int, route_count: int, latency: float, jitter: float, firestore_latency: float) -> Dict[Text, Any]:
+    landmarks = load_landmark_names()
+    firestore = FakeFirestore({
+        "fares": make_fares(),
+        "locations": make_locations(location_count, landmarks),
+        "routes": make_routes(route_count, landmarks),
+    }, latency=firestore_latency)
+    maps_client = FakeMapsClient(latency=latency, jitter=jitter)
+    actions.use_clients(maps_client=maps_client, firestore_client=firestore)
+
+    started = time.perf_counter()
+    actions.WARMUP.start()
+    actions.WARMUP.wait()
+    return {"warmup_seconds": time.perf_counter() - started, "cache_state": actions.WARMUP.report(), "maps": maps_client}
+
+
+def clear_caches() -> None:
+    MAPS_CACHE.clear()
+    actions.GEO_CACHE.clear()
+
+
+async def run_once(action: Any, tracker: Any) -> None:
+    await action.run(CollectingDispatcher(), tracker, {})
+
+
+async def bench_action(action_name: Text, iterations: int, cold: bool, seed: int) -> Dict[Text, Any]:
+    action = ACTION_CLASSES[action_name]()
+    trackers = trackers_for_action(action_name, iterations, seed)
+
+    # Timing pass without tracemalloc, which slows allocation-heavy code down a lot
+    timings = []
+    for tracker in trackers:
+        if cold:
+            clear_caches()
+        started = time.perf_counter()
+        await run_once(action, tracker)
+        timings.append(time.perf_counter() - started)
+
+    # Separate allocation pass over the same trackers
+    allocated = []
+    peaks = []
+    for tracker in trackers:
+        if cold:
+            clear_caches()
+        tracemalloc.start()
+        await run_once(action, tracker)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        allocated.append(sum(stat.size for stat in snapshot.statistics("filename")))
+        peaks.append(peak)
+
+    return {
+        "action": action_name,
+        "iterations": iterations,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000 if timings else 0.0,
+        "retained_kib": sum(allocated) / len(allocated) / 1024 if allocated else 0.0,
+        "peak_kib": sum(peaks) / len(peaks) / 1024 if peaks else 0.0,
+    }
+
+
+async def run_benchmarks(action_names: List[Text], iterations: int, cold: bool, seed: int) -> List[Dict[Text, Any]]:
+    results = []
+    for action_name in action_names:
+        results.append(await bench_action(action_name, iterations, cold, seed))
+    await actions.gmaps.close()
+    return results
+
+
+def print_table(results: List[Dict[Text, Any]]) -> None:
+    header = f"{'action':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}{'kept KiB':>11}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['action']:<36}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+            f"{result['peak_kib']:>11.1f}{result['retained_kib']:>11.1f}"
+        )
+
+
+def main(argv: Optional[List[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the custom actions against local Maps and Firestore stand-ins.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--locations", type=int, help="number of synthetic locations (overrides the preset)")
+    parser.add_argument("--routes", type=int, help="number of synthetic routes (overrides the preset)")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="synthetic Google Maps latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random Google Maps latency per call")
+    parser.add_argument("--firestore-latency-ms", type=float, default=0.0, help="synthetic latency per Firestore stream")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--action", action="append", choices=sorted(ACTION_INTENTS), help="only run these actions")
+    parser.add_argument("--cold", action="store_true", help="clear the Maps and geo caches before every run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    location_count = args.locations if args.locations is not None else PRESETS[args.preset]["locations"]
+    route_count = args.routes if args.routes is not None else PRESETS[args.preset]["routes"]
+    state = setup(location_count, route_count, args.latency_ms / 1000, args.jitter_ms / 1000, args.firestore_latency_ms / 1000)
+    results = asyncio.run(run_benchmarks(args.action or list(ACTION_CLASSES), args.iterations, args.cold, args.seed))
+
+    if args.json:
+        print(json.dumps({
+            "locations": location_count,
+            "routes": route_count,
+            "latency_ms": args.latency_ms,
+            "cold": args.cold,
+            "warmup_seconds": state["warmup_seconds"],
+            "maps_calls": state["maps"].calls,
+            "results": results,
+        }, indent=2))
+    else:
+        print(f"{location_count} locations, {route_count} routes, {args.latency_ms:g} ms Maps latency, "
+              f"{'cold' if args.cold else 'warm'} caches, warm-up {state['warmup_seconds']:.2f}s")
+        print_table(results)
+        print(f"Maps calls: {state['maps'].calls}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import math
+import random
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Text, Tuple
+
+from googlemaps.exceptions import ApiError
+
+# Deterministic local stand-ins for the Google Maps web services and Firestore, so the
+# actions can be exercised without credentials or network access.
+LEGAZPI_CENTER = (13.1391, 123.7438)
+TAG_VOCABULARY = [
+    "hiking", "outdoor", "adventure", "park", "nature", "recreation", "sightseeing", "photography",
+    "scenic", "religious", "church", "quiet", "education", "school", "college", "university",
+    "dining", "restaurant", "fast food", "public space", "shopping", "commercial", "market",
+    "sports", "fitness", "historic", "cultural", "banking", "utility", "accommodation", "hotel",
+    "transportation", "logistics", "healthcare", "hospital", "government", "administrative",
+    "events", "entertainment", "wildlife", "community", "beach", "eco-tourism", "resort",
+    "terminal", "barangay", "fuel", "retail", "convenience", "spring", "cemetery", "museum",
+]
+
+
+def _unit_hash(*parts: Any) -> float:
+    digest = hashlib.sha1("|".join(str(part).lower() for part in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def fake_coordinates(name: Text) -> Tuple[float, float]:
+    # Every place name gets a stable position within ~12 km of downtown Legazpi
+    return (
+        LEGAZPI_CENTER[0] + (_unit_hash(name, "lat") - 0.5) * 0.22,
+        LEGAZPI_CENTER[1] + (_unit_hash(name, "lng") - 0.5) * 0.22,
+    )
+
+
+def _haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+class FakeMapsClient:
+    # Same coroutine interface as actions.async_maps.AsyncMapsClient. Road distance is
+    # 1.3x the great-circle distance at 22 km/h; names in `unknown_places` are NOT_FOUND.
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 0,
+        unknown_places: Iterable[Text] = (),
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.unknown_places = {place.lower() for place in unknown_places}
+        self.calls: Dict[Text, int] = {}
+
+    async def _wait(self, method: Text) -> None:
+        self.calls[method] = self.calls.get(method, 0) + 1
+        delay = self.latency + self.jitter * self.random.random()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _element(self, origin: Text, destination: Text) -> Dict[Text, Any]:
+        if origin.lower() in self.unknown_places or destination.lower() in self.unknown_places:
+            return {"status": "NOT_FOUND"}
+        distance_m = int(_haversine_km(fake_coordinates(origin), fake_coordinates(destination)) * 1300) + 200
+        duration_s = int(distance_m / 1000.0 / 22.0 * 3600) + 60
+        return {
+            "status": "OK",
+            "distance": {"value": distance_m, "text": f"{distance_m / 1000.0:.1f} km"},
+            "duration": {"value": duration_s, "text": f"{max(1, round(duration_s / 60))} mins"},
+        }
+
+    async def distance_matrix(self, origins: Any, destinations: Any, **kwargs: Any) -> Dict[Text, Any]:
+        await self._wait("distance_matrix")
+        origins = origins if isinstance(origins, (list, tuple)) else [origins]
+        destinations = destinations if isinstance(destinations, (list, tuple)) else [destinations]
+        return {
+            "status": "OK",
+            "rows": [{"elements": [self._element(o, d) for d in destinations]} for o in origins],
+        }
+
+    async def directions(self, origin: Text, destination: Text, **kwargs: Any) -> list:
+        await self._wait("directions")
+        element = self._element(origin, destination)
+        if element["status"] != "OK":
+            raise ApiError(element["status"])
+        return [{"legs": [{"distance": element["distance"], "duration": element["duration"]}]}]
+
+    async def places_nearby(self, location: Tuple[float, float], type: Optional[Text] = None, **kwargs: Any) -> Dict[Text, Any]:
+        await self._wait("places_nearby")
+        cell = (round(location[0], 3), round(location[1], 3), type)
+        count = int(_unit_hash(*cell) * 20)
+        return {"status": "OK", "results": [{"name": f"{type or 'place'} {i + 1} near {cell[0]},{cell[1]}"} for i in range(count)]}
+
+    async def reverse_geocode(self, latlng: Tuple[float, float], **kwargs: Any) -> list:
+        await self._wait("reverse_geocode")
+        street = int(_unit_hash(round(latlng[0], 4), round(latlng[1], 4)) * 200)
+        return [{"formatted_address": f"{street} Rizal St, Legazpi City, Albay, Philippines"}]
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeDocument:
+    def __init__(self, doc_id: Text, data: Dict[Text, Any]) -> None:
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self) -> Dict[Text, Any]:
+        return dict(self._data)
+
+
+class FakeWatch:
+    def unsubscribe(self) -> None:
+        pass
+
+
+class FakeQuery:
+    def __init__(self, documents: List[FakeDocument], latency: float) -> None:
+        self.documents = documents
+        self.latency = latency
+
+    def stream(self) -> Iterable[FakeDocument]:
+        if self.latency > 0:
+            import time
+            time.sleep(self.latency)
+        return iter(self.documents)
+
+
+class FakeCollection(FakeQuery):
+    def where(self, field: Text, op: Text, value: Any) -> FakeQuery:
+        # The synthetic documents carry no update times, so deltas are always empty
+        return FakeQuery([], self.latency)
+
+    def on_snapshot(self, callback: Any) -> FakeWatch:
+        return FakeWatch()
+
+
+class FakeFirestore:
+    # Synchronous, like firestore.client(); `latency` is charged once per stream() call
+    def __init__(self, collections: Dict[Text, List[Dict[Text, Any]]], latency: float = 0.0) -> None:
+        self.collections = {
+            name: [FakeDocument(f"{name}-{i}", data) for i, data in enumerate(documents)]
+            for name, documents in collections.items()
+        }
+        self.latency = latency
+
+    def collection(self, name: Text) -> FakeCollection:
+        return FakeCollection(self.collections.get(name, []), self.latency)
+
+
+def make_fares(max_distance: int = 40) -> List[Dict[Text, Any]]:
+    # LTFRB-style matrix: base fare for the first 4 km, then a fixed amount per km
+    fares = []
+    for distance in range(1, max_distance + 1):
+        regular = 13.0 + max(0, distance - 4) * 1.8
+        fares.append({"distance": distance, "regular": regular, "discounted": round(regular * 0.8, 2)})
+    return fares
+
+
+def make_locations(count: int, landmark_names: Sequence[Text] = (), seed: int = 0) -> List[Dict[Text, Any]]:
+    rng = random.Random(seed)
+    names = list(landmark_names)[:count]
+    names += [f"Synthetic Place {i}" for i in range(count - len(names))]
+    locations = []
+    for name in names:
+        lat, lng = fake_coordinates(name)
+        locations.append({
+            "name": name,
+            "description": f"A place in Legazpi called {name}.",
+            "tags": rng.sample(TAG_VOCABULARY, rng.randint(2, 5)),
+            "coords": {"lat": lat, "lon": lng},
+        })
+    return locations
+
+
+def make_routes(count: int, landmark_names: Sequence[Text], seed: int = 0) -> List[Dict[Text, Any]]:
+    rng = random.Random(seed)
+    routes = []
+    for i in range(count):
+        stops = rng.sample(list(landmark_names), min(len(landmark_names), rng.randint(8, 20)))
+        routes.append({"name": f"Route {i + 1}", "landmarks": stops})
+    return routes
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+import aiohttp
+import yaml
+
+from benchmarks.stats import percentile
+from benchmarks.trackers import PROJECT_DIR, fill_slots, load_nlu_examples, random_position, tracker_state
+
+# Closed-loop load generator: each virtual user replays a conversation from the
+# stories, rules and test stories against the action webhook, one turn after the
+# other, and starts the next conversation when it is done. Only the turns that run a
+# custom action are sent; utter_* responses never reach the action server.
+#   python -m benchmarks.load_replay --spawn-server --concurrency 1,4,16,64 --duration 20
+STORY_FILES = [
+    os.path.join(PROJECT_DIR, "data", "stories.yml"),
+    os.path.join(PROJECT_DIR, "data", "rules.yml"),
+    os.path.join(PROJECT_DIR, "tests", "test_stories.yml"),
+]
+DOMAIN_PATH = os.path.join(PROJECT_DIR, "domain.yml")
+DEFAULT_URL = "http://localhost:5055/webhook"
+DEFAULT_CONCURRENCY = "1,2,4,8,16,32,64"
+# About 30 m per turn, someone walking while they chat
+WALK_STEP_DEG = 0.0003
+
+
+def load_conversations(paths: List[Text] = STORY_FILES) -> List[List[Dict[Text, Any]]]:
+    conversations = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        # data/stories.yml uses the singular "story" key
+        stories = data.get("stories") or data.get("story") or data.get("rules") or []
+        for story in stories:
+            turns = []
+            turn = None
+            for step in story.get("steps", []):
+                if "intent" in step:
+                    turn = {"intent": step["intent"], "text": (step.get("user") or "").strip(), "actions": []}
+                    turns.append(turn)
+                elif "action" in step and turn is not None and step["action"].startswith("action_"):
+                    turn["actions"].append(step["action"])
+            turns = [turn for turn in turns if turn["actions"]]
+            # Check if the conversation ever reaches the action server
+            if turns:
+                conversations.append(turns)
+    return conversations
+
+
+class Replayer:
+    def __init__(self, url: Text, conversations: List[List[Dict[Text, Any]]], seed: int = 0) -> None:
+        self.url = url
+        self.conversations = conversations
+        self.rng = random.Random(seed)
+        self.examples, self.synonyms = load_nlu_examples()
+        # Test stories carry plain text; recover the entities from the matching NLU example
+        self.annotated = {
+            text.lower(): entities
+            for pool in self.examples.values()
+            for text, entities in pool
+        }
+        with open(DOMAIN_PATH, encoding="utf-8") as f:
+            self.domain = yaml.safe_load(f)
+        self.sessions = 0
+
+    def message_for(self, turn: Dict[Text, Any]) -> Tuple[Text, List[Dict[Text, Any]]]:
+        # Check if the story text is a known NLU example; otherwise use a random example
+        # of the same intent, since the action would only ask for the missing slots
+        if turn["text"].lower() in self.annotated:
+            return turn["text"], self.annotated[turn["text"].lower()]
+        pool = self.examples.get(turn["intent"]) or [("", [])]
+        return self.rng.choice(pool)
+
+    async def replay(self, session: aiohttp.ClientSession, samples: List[Tuple[Text, float, bool]]) -> None:
+        self.sessions += 1
+        sender_id = f"load-{self.sessions}"
+        lat, lng = random_position(self.rng)
+        slots: Dict[Text, Any] = {}
+        for turn in self.rng.choice(self.conversations):
+            text, entities = self.message_for(turn)
+            slots = fill_slots(slots, entities, self.synonyms)
+            lat += self.rng.uniform(-WALK_STEP_DEG, WALK_STEP_DEG)
+            lng += self.rng.uniform(-WALK_STEP_DEG, WALK_STEP_DEG)
+            for action_name in turn["actions"]:
+                payload = {
+                    "next_action": action_name,
+                    "sender_id": sender_id,
+                    "tracker": tracker_state(sender_id, turn["intent"], text, entities, slots, (lat, lng)),
+                    "domain": self.domain,
+                    "version": "3.1",
+                }
+                started = time.perf_counter()
+                ok = False
+                try:
+                    async with session.post(self.url, json=payload) as response:
+                        body = await response.json(content_type=None)
+                        ok = response.status == 200
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                    body = None
+                samples.append((action_name, time.perf_counter() - started, ok))
+                # Carry slot changes into the next turn, as the Rasa server would
+                for event in (body or {}).get("events", []) if ok else []:
+                    if event.get("event") == "slot":
+                        slots[event["name"]] = event.get("value")
+
+
+def summarize(concurrency: int, elapsed: float, samples: List[Tuple[Text, float, bool]]) -> Dict[Text, Any]:
+    latencies = [latency for _, latency, ok in samples if ok]
+    per_action = {}
+    for action_name in sorted({name for name, _, _ in samples}):
+        action_latencies = [latency for name, latency, ok in samples if name == action_name and ok]
+        per_action[action_name] = {
+            "requests": sum(1 for name, _, _ in samples if name == action_name),
+            "p50_ms": percentile(action_latencies, 0.50) * 1000,
+            "p99_ms": percentile(action_latencies, 0.99) * 1000,
+        }
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": sum(1 for _, _, ok in samples if not ok),
+        "throughput_rps": len(samples) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "actions": per_action,
+    }
+
+
+async def run_level(replayer: Replayer, concurrency: int, duration: float, warmup: float, timeout: float) -> Dict[Text, Any]:
+    samples: List[Tuple[Text, float, bool]] = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async def virtual_user(deadline: float, sink: List[Tuple[Text, float, bool]]) -> None:
+            while time.perf_counter() < deadline:
+                await replayer.replay(session, sink)
+
+        # Let connections and caches settle before measuring
+        if warmup > 0:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(virtual_user(deadline, []) for _ in range(concurrency)))
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(virtual_user(deadline, samples) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(concurrency, elapsed, samples)
+
+
+async def wait_for_server(url: Text, timeout: float) -> None:
+    health_url = url.rsplit("/", 1)[0] + "/health"
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(health_url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"Action server at {health_url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.5)
+
+
+def spawn_server(args: argparse.Namespace) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "benchmarks.serve_actions",
+        "--preset", args.preset,
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--port", str(args.port),
+    ]
+    if args.locations is not None:
+        command += ["--locations", str(args.locations)]
+    if args.routes is not None:
+        command += ["--routes", str(args.routes)]
+    return subprocess.Popen(command, cwd=PROJECT_DIR)
+
+
+def print_curve(results: List[Dict[Text, Any]]) -> None:
+    header = f"{'users':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['concurrency']:>6}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.1f}"
+            f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}"
+        )
+
+
+def write_csv(path: Text, results: List[Dict[Text, Any]]) -> None:
+    fields = ["concurrency", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+
+async def sweep(args: argparse.Namespace, url: Text) -> List[Dict[Text, Any]]:
+    await wait_for_server(url, args.startup_timeout)
+    replayer = Replayer(url, load_conversations(), args.seed)
+    results = []
+    for concurrency in [int(level) for level in args.concurrency.split(",")]:
+        result = await run_level(replayer, concurrency, args.duration, args.warmup, args.timeout)
+        results.append(result)
+        if not args.json:
+            print(f"{concurrency} users: {result['throughput_rps']:.1f} req/s, p99 {result['p99_ms']:.1f} ms", file=sys.stderr)
+        # Stop once p99 is past the SLO; higher levels only queue up further
+        if args.max_p99_ms and result["p99_ms"] > args.max_p99_ms:
+            break
+    return results
+
+
+def main(argv: Optional[List[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay story conversations against the action server at rising concurrency.")
+    parser.add_argument("--url", default=DEFAULT_URL, help="action webhook to load (ignored with --spawn-server)")
+    parser.add_argument("--spawn-server", action="store_true", help="start benchmarks.serve_actions with local stand-ins")
+    parser.add_argument("--port", type=int, default=5155, help="port for the spawned server")
+    parser.add_argument("--preset", default="small", help="dataset preset for the spawned server")
+    parser.add_argument("--locations", type=int)
+    parser.add_argument("--routes", type=int)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="synthetic Google Maps latency in the spawned server")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=15.0, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each level")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per request timeout")
+    parser.add_argument("--max-p99-ms", type=float, default=0.0, help="stop the sweep once p99 exceeds this")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", help="write the throughput/latency curve to this file")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    server = spawn_server(args) if args.spawn_server else None
+    url = f"http://localhost:{args.port}/webhook" if server else args.url
+    try:
+        results = asyncio.run(sweep(args, url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.csv:
+        write_csv(args.csv, results)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_curve(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import argparse
+import sys
+from typing import List, Optional, Text
+
+# Runs the regular rasa_sdk action server with the local Maps and Firestore stand-ins
+# injected, for load tests that must not touch the real services:
+#   python -m benchmarks.serve_actions --preset large --latency-ms 80 --port 5155
+from benchmarks.bench_actions import PRESETS, setup
+
+DEFAULT_PORT = 5155
+
+
+def main(argv: Optional[List[Text]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Action server backed by local Maps and Firestore stand-ins.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--locations", type=int)
+    parser.add_argument("--routes", type=int)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--firestore-latency-ms", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+
+    location_count = args.locations if args.locations is not None else PRESETS[args.preset]["locations"]
+    route_count = args.routes if args.routes is not None else PRESETS[args.preset]["routes"]
+    setup(location_count, route_count, args.latency_ms / 1000, args.jitter_ms / 1000, args.firestore_latency_ms / 1000)
+
+    # The executor imports the already initialized actions module from sys.modules,
+    # so the server uses the injected clients and the warm caches
+    from rasa_sdk.endpoint import run
+    run("actions", port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+from typing import List
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    # Nearest-rank percentile; fine for the sample sizes the benchmarks collect
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
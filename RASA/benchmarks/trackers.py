@@ -0,0 +1,133 @@
+import os
+import random
+import re
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+import yaml
+from rasa_sdk import Tracker
+
+from benchmarks.fakes import LEGAZPI_CENTER
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), "..")
+NLU_PATH = os.path.join(PROJECT_DIR, "data", "nlu.yml")
+
+# Entity names from domain.yml and the slots they fill
+ENTITY_SLOTS = {
+    "ORIGIN": "origin",
+    "DESTINATION": "destination",
+    "ROUTE": "route",
+    "DISCOUNT": "discount",
+    "POI": "poi",
+    "LOCATION": "location",
+    "ACTIVITY": "activity",
+}
+# Custom actions and the intent whose examples drive them
+ACTION_INTENTS = {
+    "action_handle_fare_inquiry": "fare_inquiry",
+    "action_handle_route_finder": "route_finder",
+    "action_handle_recommend_place": "recommend_place",
+    "action_handle_find_nearest": "find_nearest",
+    "action_handle_travel_time_estimate": "travel_time_estimate",
+    "action_handle_location_inquiry": "location_inquiry",
+}
+ENTITY_PATTERN = re.compile(r"\[([^\]]+)\]\(([A-Za-z_]+)(?::[^)]*)?\)")
+
+
+def parse_example(example: Text) -> Tuple[Text, List[Dict[Text, Any]]]:
+    # Turns "fare from [A](ORIGIN) to [B](DESTINATION)" into text plus entity spans
+    entities = []
+    text = ""
+    last = 0
+    for match in ENTITY_PATTERN.finditer(example):
+        text += example[last:match.start()]
+        start = len(text)
+        text += match.group(1)
+        entities.append({"entity": match.group(2), "value": match.group(1), "start": start, "end": len(text)})
+        last = match.end()
+    text += example[last:]
+    return text, entities
+
+
+def load_nlu_examples(path: Text = NLU_PATH) -> Tuple[Dict[Text, List[Tuple[Text, List[Dict[Text, Any]]]]], Dict[Text, Text]]:
+    with open(path, encoding="utf-8") as f:
+        nlu = yaml.safe_load(f)["nlu"]
+    examples: Dict[Text, List[Tuple[Text, List[Dict[Text, Any]]]]] = {}
+    synonyms: Dict[Text, Text] = {}
+    for block in nlu:
+        lines = [line.strip()[2:] for line in block.get("examples", "").splitlines() if line.strip().startswith("- ")]
+        if "intent" in block:
+            examples.setdefault(block["intent"], []).extend(parse_example(line) for line in lines)
+        elif "synonym" in block:
+            for line in lines:
+                synonyms[line.lower()] = block["synonym"]
+    return examples, synonyms
+
+
+def random_position(rng: random.Random, spread: float = 0.05) -> Tuple[float, float]:
+    return (
+        LEGAZPI_CENTER[0] + rng.uniform(-spread, spread),
+        LEGAZPI_CENTER[1] + rng.uniform(-spread, spread),
+    )
+
+
+def fill_slots(slots: Dict[Text, Any], entities: List[Dict[Text, Any]], synonyms: Dict[Text, Text]) -> Dict[Text, Any]:
+    slots = dict(slots)
+    for entity in entities:
+        slot = ENTITY_SLOTS.get(entity["entity"])
+        if slot:
+            # Mirror EntitySynonymMapper before the slot is filled
+            slots[slot] = synonyms.get(entity["value"].lower(), entity["value"])
+    return slots
+
+
+def tracker_state(
+    sender_id: Text,
+    intent: Text,
+    text: Text,
+    entities: List[Dict[Text, Any]],
+    slots: Dict[Text, Any],
+    position: Optional[Tuple[float, float]] = None,
+) -> Dict[Text, Any]:
+    # Tracker as the Rasa server serializes it for the action webhook, with the same
+    # location metadata ChatScreen.js attaches to every message
+    metadata = {"latitude": position[0], "longitude": position[1]} if position else {"latitude": 0, "longitude": 0}
+    return {
+        "sender_id": sender_id,
+        "slots": slots,
+        "latest_message": {
+            "text": text,
+            "intent": {"name": intent, "confidence": 1.0},
+            "entities": entities,
+            "metadata": metadata,
+        },
+        "events": [],
+        "paused": False,
+        "followup_action": None,
+        "active_loop": {},
+        "latest_action_name": "action_listen",
+    }
+
+
+def build_tracker(
+    sender_id: Text,
+    intent: Text,
+    text: Text,
+    entities: List[Dict[Text, Any]],
+    synonyms: Dict[Text, Text],
+    position: Optional[Tuple[float, float]] = None,
+    slots: Optional[Dict[Text, Any]] = None,
+) -> Tracker:
+    slots = fill_slots(slots or {}, entities, synonyms)
+    return Tracker.from_dict(tracker_state(sender_id, intent, text, entities, slots, position))
+
+
+def trackers_for_action(action_name: Text, count: int, seed: int = 0) -> List[Tracker]:
+    examples, synonyms = load_nlu_examples()
+    intent = ACTION_INTENTS[action_name]
+    rng = random.Random(seed)
+    pool = examples[intent]
+    trackers = []
+    for i in range(count):
+        text, entities = rng.choice(pool)
+        trackers.append(build_tracker(f"bench-{i}", intent, text, entities, synonyms, random_position(rng)))
+    return trackers